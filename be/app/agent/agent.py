@@ -1,21 +1,33 @@
-import boto3, uuid
+import asyncio
+import base64
+import uuid
 import importlib
 import json
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 os.environ["BYPASS_TOOL_CONSENT"] = "true"
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+from decimal import Decimal
 from strands import Agent, tool
 from strands.models import BedrockModel
 from strands.models.bedrock import BotocoreConfig
 from strands.tools.mcp.mcp_client import MCPClient
 from mcp.client.streamable_http import streamablehttp_client
-from ..mcp.mcp import MCPService
+from .chat_payload import compress, decompress, get_payload_store
+from .chat_search import CHAT_SEARCH_SYNC_WINDOW_MINUTES, ChatSearchHit, assistant_text, get_chat_search_index
+from .context import CycleUsageTracker, build_conversation_manager, context_config
 from .event_serializer import EventSerializer
-from ..utils.aws_config import get_aws_region
+from .manifest import AgentManifest, compile_manifest, load_tool
+from ..storage import get_storage
+from ..utils.catalog import CatalogCache
+from ..utils.lru_cache import LRUCache
 
 from enum import Enum
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, List, Tuple
+from pydantic import BaseModel, Field
 
 AgentType  = Enum("AgentType", ("plain", "orchestrator"))
 ModelProvider = Enum("ModelProvider", ("bedrock", "openai", "anthropic", "litellm", "ollama", "custom"))
@@ -113,6 +125,11 @@ class AgentPO(BaseModel):
     tools: List[AgentTool] = []
     envs: str = ""
     extras: Optional[dict] = None
+    # Compiled when the agent is saved, see AgentManifest. Not part of API responses, only its hash is.
+    manifest: Optional[AgentManifest] = Field(default=None, exclude=True)
+    manifest_hash: Optional[str] = None
+    # Incremented by every save, 0 for agents saved before versioning
+    version: int = 0
 
     def __repr__(self):
         return f"AgentPO(name={self.name}, display_name={self.display_name} description={self.description}, " \
@@ -169,27 +186,99 @@ class AgentPOBuilder:
 
 
 
+class AgentVersionConflict(Exception):
+    """
+    Raised when an agent is saved or deleted with an expected version that is no longer current.
+    """
+
+    def __init__(self, agent_id: str, expected_version: Optional[int]):
+        super().__init__(f"Agent {agent_id} is not at version {expected_version}")
+        self.agent_id = agent_id
+        self.expected_version = expected_version
+
+
+# Attempts of an unconditional save racing with other saves of the same agent
+AGENT_SAVE_ATTEMPTS = 5
+
+
+class AgentCatalogSnapshot:
+    """
+    An immutable view of all agents, indexed by ID, name and type.
+
+    Writes are applied to a snapshot in memory by version: a save only replaces an agent saved at a lower
+    version, and a delete leaves a tombstone with the version it deleted, so writes whose bumps arrive out of
+    order cannot bring back an older agent or a deleted one. Writes that cannot be ordered that way return None,
+    for the catalog to reload instead.
+    """
+
+    def __init__(self, agents: List[AgentPO], deleted: Optional[Dict[str, int]] = None):
+        self.agents = sorted(agents, key=lambda agent: (agent.name or '', agent.id))
+        self.by_id = {agent.id: agent for agent in self.agents}
+        self.by_name = defaultdict(list)
+        self.by_type = defaultdict(list)
+        for agent in self.agents:
+            self.by_name[agent.name].append(agent)
+            self.by_type[agent.agent_type].append(agent)
+        # Versions of agents deleted since the snapshot was loaded
+        self.deleted = deleted or {}
+
+    def with_agent(self, agent: AgentPO) -> Optional['AgentCatalogSnapshot']:
+        """
+        A new snapshot with the agent added or replaced, None if it cannot be ordered against the snapshot.
+        """
+        current = self.by_id.get(agent.id)
+        if agent.id in self.deleted or (current is not None and current.version >= agent.version):
+            # An older save, or one racing a delete; versions restart after a delete, so only a reload can tell
+            return None
+        return AgentCatalogSnapshot([a for a in self.agents if a.id != agent.id] + [agent], self.deleted)
+
+    def without_agent(self, id: str, version: Optional[int]) -> Optional['AgentCatalogSnapshot']:
+        """
+        A new snapshot without the agent, None if it cannot be ordered against the snapshot.
+
+        :param id: The ID of the deleted agent.
+        :param version: The version that was deleted, None if the agent did not exist.
+        """
+        current = self.by_id.get(id)
+        if version is None:
+            return self if current is None else None
+        if current is not None and current.version > version:
+            return None
+        return AgentCatalogSnapshot([a for a in self.agents if a.id != id], {**self.deleted, id: version})
+
+
 class AgentPOService:
     """
     A service to manage AgentPO objects.It allows adding, retrieving, and listing agents from Amazon DynamoDB.
+
+    Reads are served from a process-wide catalog snapshot that is reloaded only when the agent catalog version
+    changes, see CatalogCache.
     """
 
     dynamodb_table_name = "AgentTable"
+    catalog_name = "agents"
 
     def __init__(self):
-        aws_region = get_aws_region()
-        self.dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+        self.dynamodb = get_storage()
+        self.catalog = agent_catalog
 
-    def add_agent(self, agent_po: AgentPO):
+    def add_agent(self, agent_po: AgentPO, expected_version: Optional[int] = None) -> AgentPO:
         """
-        Add an AgentPO object to Amazon DynamoDB
+        Create or replace an AgentPO object in Amazon DynamoDB with a single conditional write.
 
-        :param agent_po: The AgentPO object to add.
-        :raises ValueError: If an agent with the same name already exists.
-        :return: None
+        Every save increments the agent's version. With an expected version (optimistic concurrency, e.g. from
+        an If-Match header) the write only succeeds if the stored agent is still at that version; without one
+        the save is applied on top of whatever version is current.
+
+        :param agent_po: The AgentPO object to save, whose version is set to the new version.
+        :param expected_version: The version the caller last read, None to overwrite.
+        :raises AgentVersionConflict: If expected_version is not the stored version.
+        :return: The saved agent.
         """
         if not isinstance(agent_po, AgentPO):
             raise TypeError("agent_po must be an instance of AgentPO")
+        if agent_po.manifest is None:
+            self.compile_manifest(agent_po)
 
         # write to DynamoDB
         table = self.dynamodb.Table(self.dynamodb_table_name)
@@ -203,14 +292,60 @@ class AgentPOService:
             'model_id': agent_po.model_id,
             'sys_prompt': agent_po.sys_prompt,
             'tools': [tool.model_dump_json() for tool in agent_po.tools],  # Convert tools to JSON string
-            'envs': agent_po.envs
+            'envs': agent_po.envs,
+            'manifest': agent_po.manifest.model_dump_json(),
+            'manifest_hash': agent_po.manifest_hash
         }
         
         # Add extras if it exists
         if agent_po.extras:
             item['extras'] = agent_po.extras
-            
-        table.put_item(Item=item)
+
+        for _ in range(AGENT_SAVE_ATTEMPTS):
+            current = expected_version if expected_version is not None else self._stored_version(agent_po.id)
+            item['version'] = (current or 0) + 1
+            try:
+                table.put_item(Item=item, ConditionExpression=self._version_condition(current))
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                if expected_version is not None:
+                    raise AgentVersionConflict(agent_po.id, expected_version)
+        else:
+            raise AgentVersionConflict(agent_po.id, current)
+        agent_po.version = item['version']
+        saved = agent_po.model_copy()
+        self.catalog.bump(lambda snapshot: snapshot.with_agent(saved))
+        return agent_po
+
+    def _stored_version(self, id: str) -> Optional[int]:
+        # Consistent read of the version alone, None if the agent does not exist
+        table = self.dynamodb.Table(self.dynamodb_table_name)
+        response = table.get_item(Key={'id': id}, ProjectionExpression='#v',
+                                  ExpressionAttributeNames={'#v': 'version'}, ConsistentRead=True)
+        return int(response['Item'].get('version', 0)) if 'Item' in response else None
+
+    @staticmethod
+    def _version_condition(version: Optional[int]):
+        # The stored agent must be at the given version, None meaning that it must not exist
+        if version is None:
+            return Attr('id').not_exists()
+        if version == 0:
+            return Attr('id').exists() & Attr('version').not_exists()
+        return Attr('version').eq(version)
+
+    def compile_manifest(self, agent_po: AgentPO) -> AgentManifest:
+        """
+        Validate an agent's configuration and compile it into the manifest chats are built from.
+
+        :param agent_po: The agent, whose manifest and manifest_hash are set.
+        :raises ManifestError: If a tool cannot be resolved, e.g. a strands tool that does not import.
+        :return: The manifest.
+        """
+        agent_po.manifest = compile_manifest(agent_po, self.get_agent)
+        agent_po.manifest_hash = agent_po.manifest.content_hash
+        return agent_po.manifest
 
     def get_agent(self, id: str) -> Optional[AgentPO]:
         """
@@ -219,13 +354,7 @@ class AgentPOService:
         :param id: The ID of the agent to retrieve.
         :return: An AgentPO object if found, otherwise None.
         """
-        table = self.dynamodb.Table(self.dynamodb_table_name)
-        response = table.get_item(Key={'id': id})
-
-        if 'Item' in response:
-            item = response['Item']
-            return self._map_agent_item(item)
-        return None
+        return self.catalog.get().by_id.get(id)
 
     def query_agent_by_name(self, name: str, limit: int = 5) -> Optional[List[AgentPO]]:
         """
@@ -234,53 +363,94 @@ class AgentPOService:
         :param name: The name of the agent to retrieve.
         :return: An AgentPO object if found, otherwise None.
         """
-        table = self.dynamodb.Table(self.dynamodb_table_name)
-        response = table.scan(FilterExpression=Attr('name').eq(name),
-                              Limit = limit)
-
-        items = response.get('Items', [])
-        if items:
-            return [self._map_agent_item(item) for item in items]
+        agents = self.catalog.get().by_name.get(name)
+        if agents:
+            return agents[:limit]
         return None
 
-    def list_agents(self) -> List[AgentPO]:
+    def list_agents(self, agent_type: Optional[AgentType] = None) -> List[AgentPO]:
         """
-        List all AgentPO objects from Amazon DynamoDB.
+        List all AgentPO objects from Amazon DynamoDB, ordered by name.
+
+        :param agent_type: Only list agents of this type.
         :return: A list of AgentPO objects.
         """
-        table = self.dynamodb.Table(self.dynamodb_table_name)
-        response = table.scan()
-        items = response.get('Items', [])
-        if items:
-            return [ self._map_agent_item(item) for item in items]
-        return []
+        snapshot = self.catalog.get()
+        if agent_type is not None:
+            return list(snapshot.by_type.get(agent_type, []))
+        return list(snapshot.agents)
+
+    def list_agents_page(self, limit: int, cursor: Optional[int] = None,
+                         agent_type: Optional[AgentType] = None) -> Tuple[List[AgentPO], Optional[int]]:
+        """
+        List agents ordered by name, one page at a time.
+
+        :param limit: The maximum number of agents to return.
+        :param cursor: The cursor returned with the previous page, None for the first page.
+        :param agent_type: Only list agents of this type.
+        :return: A tuple of (agents, cursor of the next page or None).
+        """
+        agents = self.list_agents(agent_type)
+        start = cursor or 0
+        end = start + limit
+        return agents[start:end], end if end < len(agents) else None
 
-    def delete_agent(self, id: str) -> bool:
+    def scan_agents(self) -> List[AgentPO]:
+        """
+        Read all agents from Amazon DynamoDB, following pagination. Used to load the catalog snapshot.
+
+        :return: A list of AgentPO objects.
+        """
+        table = self.dynamodb.Table(self.dynamodb_table_name)
+        kwargs = {}
+        agents = []
+        while True:
+            response = table.scan(**kwargs)
+            agents.extend(self._map_agent_item(item) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return agents
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def delete_agent(self, id: str, expected_version: Optional[int] = None) -> bool:
         """
         Delete an AgentPO object by its ID from Amazon DynamoDB.
 
         :param id: The ID of the agent to delete.
+        :param expected_version: Only delete the agent if it is at this version.
+        :raises AgentVersionConflict: If expected_version is not the stored version.
         :return: True if deletion was successful, False otherwise.
         """
         table = self.dynamodb.Table(self.dynamodb_table_name)
-        response = table.delete_item(Key={'id': id})
+        kwargs = {'Key': {'id': id}, 'ReturnValues': 'ALL_OLD'}
+        if expected_version is not None:
+            kwargs['ConditionExpression'] = self._version_condition(expected_version)
+        try:
+            response = table.delete_item(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                raise AgentVersionConflict(id, expected_version)
+            raise
+        deleted = response.get('Attributes')
+        deleted_version = int(deleted.get('version', 0)) if deleted else None
+        self.catalog.bump(lambda snapshot: snapshot.without_agent(id, deleted_version))
 
         # Check if the item was deleted successfully
         return response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200
     
-    async def stream_chat(self, agent_id: str, user_message: str):
+    async def stream_chat(self, agent_id: str, user_message: str, extra_tools: Optional[list] = None):
         """
         Stream chat messages from an agent.
 
         :param agent_id: The ID of the agent to stream chat from.
         :param user_message: The user's message to send to the agent.
+        :param extra_tools: Tools available in this chat only, in addition to the agent's own tools.
         :return: A generator that yields complete event information.
         """
         agent = self.get_agent(agent_id)
         if not agent:
             raise ValueError(f"Agent with ID {agent_id} not found.")
     
-        agent_instance = self.build_strands_agent(agent)
+        agent_instance = self.build_strands_agent(agent, extra_tools=extra_tools)
 
         # Stream the chat response
         async for message in agent_instance.stream_async(user_message):
@@ -296,27 +466,16 @@ class AgentPOService:
 
         :return: A list of AgentTool objects.
         """
-        tools = []
-        for tool in Tools:
-            tools.append(AgentTool(name=tool.identify, display_name=tool.name, category=tool.category, desc=tool.desc))
-        
-        # Add Agent tools(Only plain agents)
-        for agent in self.list_agents():
-            if agent.agent_type == AgentType.plain:
-                tools.append(AgentTool(name=agent.name, display_name=agent.name, category="Agent", desc=agent.description, type=AgentToolType.agent, agent_id=agent.id))
-
-        # Add MCP tools
-        mcpService = MCPService()
-        for mcp in mcpService.list_mcp_servers():
-            tools.append(AgentTool(name=mcp.name, display_name=mcp.name, category="Mcp", desc=mcp.desc, type=AgentToolType.mcp, mcp_server_url=mcp.host))
-        
-        return tools
+        # Strands tools, plain agents and MCP servers, maintained by the tool catalog as they change
+        from .tool_catalog import get_tool_catalog
+        return get_tool_catalog().list_tools()
 
-    def build_strands_agent(self, agent: AgentPO, **kwargs) -> Agent:
+    def build_strands_agent(self, agent: AgentPO, extra_tools: Optional[list] = None, **kwargs) -> Agent:
         """
         Build a Strands agent from an AgentPO object.
 
         :param agent: The AgentPO object to build the Strands agent from.
+        :param extra_tools: Additional Strands tools, e.g. retrieval over the documents attached to a chat.
         :return: A Strands Agent instance.
         """
         # Parse and set environment variables if they exist
@@ -330,102 +489,86 @@ class AgentPOService:
                         print(f"Setting environment variable: {key}")
                         import os
                         os.environ[key] = value
-        # Load tools based on their type
+        manifest = agent.manifest
+        if manifest is None:
+            # Agents saved before manifests existed are compiled when used
+            manifest = compile_manifest(agent, self.get_agent, resolve_mcp=False, strict=False)
+
+        # Load tools from the manifest, where they were resolved when the agent was saved
         tools = []
-        for t in agent.tools:
-            if t.type == AgentToolType.strands:
-                try:
-                    print(f"tool.name: {t.name}")
-                    name_segs = t.name.split(".")
-                    if len(name_segs) ==1:
-                        # If the tool name is just a single name, it is a module in strands_tools
-                        module = importlib.import_module(f"strands_tools.{t.name}")
-                        tools.append(module)
-                    elif len(name_segs) >= 3:
-                        # module.class.method pattern
-                        module_name = f"strands_tools.{'.'.join(name_segs[:-2])}"
-                        class_name = name_segs[-2]
-                        method_name = name_segs[-1]
-                        module = importlib.import_module(module_name)
-                        cls = getattr(module, class_name)
-                        obj = cls()
-                        method = getattr(obj, method_name)
-                        tools.append(method)
-                    else:
-                        raise AttributeError(f"Invalid tool name format: {t.name}. Expected format: module.class.method or module.")
-                except (ImportError, AttributeError) as e:
-                    print(f"Error loading tool {t.name}: {e}")
-            elif t.type == AgentToolType.agent and t.agent_id:
-                # If the tool is another agent, convert it to a Strands tool
-                agent_po = self.get_agent(t.agent_id)
+        for tool_import in manifest.tool_imports:
+            try:
+                tools.append(load_tool(tool_import))
+            except (ImportError, AttributeError) as e:
+                print(f"Error loading tool {tool_import.name}: {e}")
+        for sub_agent in manifest.sub_agents:
+            # If the tool is another agent, convert it to a Strands tool
+            agent_po = self.get_agent(sub_agent.agent_id)
+            if agent_po:
                 tools.append(agent_as_tool(agent_po))
-            elif t.type == AgentToolType.mcp and t.mcp_server_url:
-                try:
-                    # If the tool is an MCP server, create a Strands MCP client with increased timeout
-                    print(f"Initializing MCP client for server: {t.mcp_server_url}")
-                    streamable_http_mcp_client = MCPClient(
-                        lambda: streamablehttp_client(t.mcp_server_url),
-                        startup_timeout=60  # Increase timeout to 60 seconds
-                    )
-                    streamable_http_mcp_client = streamable_http_mcp_client.start()
-                    mcp_tools = streamable_http_mcp_client.list_tools_sync()
-                    print(f"Successfully loaded {len(mcp_tools)} tools from MCP server")
-                    tools.extend(mcp_tools)
-                except Exception as e:
-                    print(f"Error initializing MCP client for {t.mcp_server_url}: {str(e)}")
-                    # Continue without the MCP tools rather than failing completely
-                    continue
             else:
-                print(f"Unsupported tool type: {t.type}")
-        
+                print(f"Agent tool {sub_agent.name} references agent {sub_agent.agent_id}, which no longer exists")
+        for server in manifest.mcp_servers:
+            try:
+                # If the tool is an MCP server, create a Strands MCP client with increased timeout
+                print(f"Initializing MCP client for server: {server.url}")
+                streamable_http_mcp_client = MCPClient(
+                    lambda url=server.url: streamablehttp_client(url),
+                    startup_timeout=60  # Increase timeout to 60 seconds
+                )
+                streamable_http_mcp_client = streamable_http_mcp_client.start()
+                mcp_tools = streamable_http_mcp_client.list_tools_sync()
+                print(f"Successfully loaded {len(mcp_tools)} tools from MCP server")
+                tools.extend(mcp_tools)
+            except Exception as e:
+                print(f"Error initializing MCP client for {server.url}: {str(e)}")
+                # Continue without the MCP tools rather than failing completely
+                continue
+        if extra_tools:
+            tools.extend(extra_tools)
 
         # Choose the appropriate model based on the provider
-        if agent.model_provider == ModelProvider.bedrock:
-            boto_config = BotocoreConfig(
-                retries={"max_attempts": kwargs['max_attempts'] if 'max_attempts' in kwargs else 10, "mode": "standard"},
-                connect_timeout=kwargs['connect_timeout'] if 'connect_timeout' in kwargs else 10,
-                read_timeout=kwargs['read_timeout'] if 'read_timeout' in kwargs else 900
-            )
-
-            model = BedrockModel(
-                model_id=agent.model_id,
+        profile = manifest.model
+        boto_config = BotocoreConfig(
+            retries={"max_attempts": kwargs.get('max_attempts', profile.max_attempts), "mode": "standard"},
+            connect_timeout=kwargs.get('connect_timeout', profile.connect_timeout),
+            read_timeout=kwargs.get('read_timeout', profile.read_timeout)
+        )
+        def make_model():
+            if profile.provider == ModelProvider.openai.name:
+                # For OpenAI, the API key is kept in the extras field and not in the manifest
+                from strands.models.openai import OpenAIModel
+
+                api_key = agent.extras.get('api_key') if agent.extras else None
+                return OpenAIModel(
+                    client_args={
+                        "api_key": api_key,
+                        "base_url": profile.base_url
+                    },
+                    model_id=profile.model_id,
+                )
+            # Bedrock, also the default for other providers for now
+            return BedrockModel(
+                model_id=profile.model_id,
                 boto_client_config=boto_config,
             )
-        elif agent.model_provider == ModelProvider.openai:
-            # For OpenAI, use the extras field to get base_url and api_key
-            from strands.models.openai import OpenAIModel
-            
-            base_url = None
-            api_key = None
-            
-            if agent.extras:
-                base_url = agent.extras.get('base_url')
-                api_key = agent.extras.get('api_key')
-            
-            model = OpenAIModel(
-                client_args={
-                    "api_key": api_key,
-                    "base_url": base_url
-                },
-                model_id=agent.model_id,
-            )
-        else:
-            # Default to Bedrock for now
-            boto_config = BotocoreConfig(
-                retries={"max_attempts": kwargs['max_attempts'] if 'max_attempts' in kwargs else 10, "mode": "standard"},
-                connect_timeout=kwargs['connect_timeout'] if 'connect_timeout' in kwargs else 10,
-                read_timeout=kwargs['read_timeout'] if 'read_timeout' in kwargs else 900
-            )
 
-            model = BedrockModel(
-                model_id=agent.model_id,
-                boto_client_config=boto_config,
-            )
+        # Context-window management from the agent's extras, the Strands default without settings. Summaries
+        # are made with a model of their own, as the OpenAI client is bound to the event loop of the chat.
+        try:
+            conversation_manager = build_conversation_manager(context_config(agent.extras), make_model)
+        except ValueError as e:
+            print(f"Agent {agent.name}: invalid context settings, using the defaults: {str(e)}")
+            conversation_manager = None
+        hooks = [conversation_manager] if hasattr(conversation_manager, 'register_hooks') else []
+        hooks.append(CycleUsageTracker())
 
         return Agent(
             system_prompt=agent.sys_prompt,
-            model=model,
-            tools=tools
+            model=make_model(),
+            tools=tools,
+            conversation_manager=conversation_manager,
+            hooks=hooks
         )
 
     def _map_agent_item(self, item: dict) -> AgentPO:
@@ -459,10 +602,17 @@ class AgentPOService:
             sys_prompt=item['sys_prompt'],
             tools=[json_to_agent_tool(json.loads(tool)) for tool in item['tools'] ],
             envs=item.get('envs', ''),
-            extras=item.get('extras')
+            extras=item.get('extras'),
+            manifest=AgentManifest.model_validate_json(item['manifest']) if 'manifest' in item else None,
+            manifest_hash=item.get('manifest_hash'),
+            version=int(item.get('version', 0))
         )
     
 
+agent_catalog: CatalogCache[AgentCatalogSnapshot] = CatalogCache(
+    AgentPOService.catalog_name, lambda: AgentCatalogSnapshot(AgentPOService().scan_agents()))
+
+
 def agent_as_tool(agent: AgentPO, **kwargs):
 
     if agent.agent_type != AgentType.plain:
@@ -543,12 +693,52 @@ def agent_as_tool(agent: AgentPO, **kwargs):
 
     return agent_tool
 
+# User messages larger than this are stored as compressed blobs and only a preview is kept in DynamoDB
+CHAT_MESSAGE_INLINE_BYTES = int(os.environ.get('CHAT_MESSAGE_INLINE_BYTES', 16 * 1024))
+CHAT_MESSAGE_PREVIEW_CHARS = 500
+# Chat response content above the first size is compressed in the item, above the second (compressed)
+# size it is spilled to the payload store and the item only keeps its digest
+CHAT_RESPONSE_COMPRESS_BYTES = int(os.environ.get('CHAT_RESPONSE_COMPRESS_BYTES', 8 * 1024))
+CHAT_RESPONSE_SPILL_BYTES = int(os.environ.get('CHAT_RESPONSE_SPILL_BYTES', 256 * 1024))
+CHAT_RESPONSE_FETCH_THREADS = 8
+CHAT_RESPONSE_PAGE_SIZE = 100
+# Fold the responses of a finished chat into one compressed transcript item
+CHAT_COMPACTION_ENABLED = os.environ.get('CHAT_COMPACTION_ENABLED', 'true').lower() == 'true'
+# Sort key of the transcript item, below the resp_no of any individual response
+TRANSCRIPT_RESP_NO = -1
+TRANSCRIPT_VERSION = 1
+# Read-through cache of chat records and response pages, shared by all ChatRecordService instances so
+# that writes through any of them invalidate it. The TTL bounds staleness against writes of other tasks.
+CHAT_CACHE_MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CHAT_CACHE_TTL_SECONDS = float(os.environ.get('CHAT_CACHE_TTL_SECONDS', 5))
+# Attribute of chat records and responses that DynamoDB TTL expires items by
+CHAT_TTL_ATTRIBUTE = 'expire_at'
+# Secondary indexes of ChatRecordTable for time-ordered listing, per agent and per month across agents
+CHAT_RECORD_AGENT_INDEX = 'agent_id-create_time-index'
+CHAT_RECORD_TIME_INDEX = 'time_bucket-create_time-index'
+# How many months back a listing without start_time walks through
+CHAT_LIST_LOOKBACK_MONTHS = int(os.environ.get('CHAT_LIST_LOOKBACK_MONTHS', 24))
+
 # Agent Chat Records
 class ChatRecord(BaseModel):
     id: str
     agent_id: str
     user_message: str
     create_time: str
+    # Digest of the full user message in the payload store, user_message then only holds a preview
+    user_message_ref: Optional[str] = None
+    user_message_size: Optional[int] = None
+    # Token usage of the chat ("input_tokens", "output_tokens", "total_tokens", "cycles", "latency_ms")
+    usage: Optional[Dict[str, int]] = None
+    # Per tool call statistics as {tool name: {"call_count", "success_count", "error_count", "total_time"}}
+    tool_metrics: Optional[Dict[str, Dict[str, Any]]] = None
+    # The multi-turn session the chat is a turn of, None for a standalone chat
+    session_id: Optional[str] = None
+    # Token usage of each event loop cycle, {"input_tokens", "output_tokens", "messages"} each, where messages
+    # is the length of the conversation sent to the model after context-window management
+    cycle_usage: Optional[List[Dict[str, int]]] = None
+    # When DynamoDB TTL deletes the chat, as epoch seconds, None if it is kept
+    expire_at: Optional[int] = None
 
 # Agent Chat Responses
 class ChatResponse(BaseModel):
@@ -558,6 +748,44 @@ class ChatResponse(BaseModel):
     create_time: str
 
 
+def summarize_chat_metrics(metrics) -> Tuple[Dict[str, int], Dict[str, Dict[str, Any]], List[Dict[str, int]]]:
+    """
+    Summarize the metrics of an agent invocation for storage with its chat record.
+
+    :param metrics: The EventLoopMetrics of the AgentResult.
+    :return: A tuple of (usage, tool metrics, cycle usage) as stored in ChatRecord.
+    """
+    usage = {
+        'input_tokens': int(metrics.accumulated_usage.get('inputTokens', 0)),
+        'output_tokens': int(metrics.accumulated_usage.get('outputTokens', 0)),
+        'total_tokens': int(metrics.accumulated_usage.get('totalTokens', 0)),
+        'cycles': int(metrics.cycle_count),
+        'latency_ms': int(metrics.accumulated_metrics.get('latencyMs', 0)),
+    }
+    tool_metrics = {
+        name: {
+            'call_count': tool_metric.call_count,
+            'success_count': tool_metric.success_count,
+            'error_count': tool_metric.error_count,
+            'total_time': round(tool_metric.total_time, 3),
+        }
+        for name, tool_metric in metrics.tool_metrics.items()
+    }
+    # Recorded on the cycle traces by CycleUsageTracker
+    cycle_usage = [dict(trace.metadata['usage']) for trace in metrics.traces if 'usage' in trace.metadata]
+    return usage, tool_metrics, cycle_usage
+
+
+def _chat_cache_size(value) -> int:
+    # Approximate memory footprint of a cached chat record or list of response pages
+    if isinstance(value, ChatRecord):
+        return len(value.user_message) + 200
+    return sum(len(r.content) + 100 for page in value for r in page)
+
+
+chat_cache = LRUCache(CHAT_CACHE_MAX_BYTES, CHAT_CACHE_TTL_SECONDS, _chat_cache_size)
+
+
 class ChatRecordService:
     """
     A service to manage chat records and responses.It allows adding, retrieving, and listing chat records and responses from Amazon DynamoDB.
@@ -567,14 +795,20 @@ class ChatRecordService:
     chat_response_table_name = "ChatResponseTable"
 
     def __init__(self):
-        aws_region = get_aws_region()
-        self.dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+        self.dynamodb = get_storage()
+        self.payload_store = get_payload_store()
+        self.cache = chat_cache
+        self.search_index = get_chat_search_index()
 
-    def add_chat_record(self, record: ChatRecord):
+    def add_chat_record(self, record: ChatRecord, expire_at: Optional[int] = None):
         """
         Add a chat record to Amazon DynamoDB.
 
+        User messages above CHAT_MESSAGE_INLINE_BYTES (e.g. with pasted file content) are stored once in the
+        payload store; the item keeps a preview and the digest of the full message.
+
         :param record: The ChatRecord object to add.
+        :param expire_at: Epoch seconds after which DynamoDB TTL may delete the record, None to keep it.
         :raises ValueError: If a chat record with the same ID already exists.
         :return: None
         
@@ -582,116 +816,689 @@ class ChatRecordService:
         if (not record.id):
             record.id = uuid.uuid4().hex
         
+        item = {
+            'id': record.id,
+            'agent_id': record.agent_id,
+            'user_message': record.user_message,
+            'create_time': record.create_time,
+            'time_bucket': self._time_bucket(record.create_time)
+        }
+        if expire_at:
+            item[CHAT_TTL_ATTRIBUTE] = expire_at
+        if record.session_id:
+            item['session_id'] = record.session_id
+        message_bytes = record.user_message.encode('utf-8')
+        if not record.user_message_ref and len(message_bytes) > CHAT_MESSAGE_INLINE_BYTES:
+            item['user_message'] = record.user_message[:CHAT_MESSAGE_PREVIEW_CHARS]
+            item['user_message_ref'] = self.payload_store.put(message_bytes)
+            item['user_message_size'] = len(message_bytes)
+        elif record.user_message_ref:
+            item['user_message_ref'] = record.user_message_ref
+            item['user_message_size'] = record.user_message_size
+
         table = self.dynamodb.Table(self.chat_record_table_name)
         try:
-            table.put_item(
-                Item={
-                    'id': record.id,
-                    'agent_id': record.agent_id,
-                    'user_message': record.user_message,
-                    'create_time': record.create_time
-                }   
-            )
+            table.put_item(Item=item)
+            self.cache.invalidate(record.id)
+            self._update_search_index('index_message', record.id, record.agent_id, record.create_time,
+                                      record.user_message, expire_at)
             # print(f"Successfully wrote chat record to DynamoDB. {self.chat_record_table_name} ID: {record.id}")
         except Exception as e:
             print(f"Error writing chat record to DynamoDB. ID: {record.id}")
             print(f"Error details: {str(e)}")
             raise
     
-    def get_chat_record(self, id: str) -> ChatRecord:
+    def get_chat_record(self, id: str, rehydrate: bool = True) -> ChatRecord:
         """
         Retrieve a chat record by its ID from Amazon DynamoDB.
 
         :param id: The ID of the chat record to retrieve.
+        :param rehydrate: Whether to load the full user message if only a preview is stored inline.
         :return: A ChatRecord object if found, otherwise None.
         
         """
+        key = ('record', id, rehydrate)
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+
+        version = self.cache.version(id)
         table = self.dynamodb.Table(self.chat_record_table_name)
         response = table.get_item(Key={'id': id})
 
         if 'Item' in response:
-            item = response['Item']
-            return ChatRecord(id=item['id'], agent_id=item['agent_id'], user_message=item['user_message'], create_time=item['create_time'])
+            record = self._map_chat_record(response['Item'])
+            if rehydrate:
+                record = self.rehydrate_user_message(record)
+            self.cache.put(key, record, tag=id, if_version=version)
+            return record
         return None
 
+    def rehydrate_user_message(self, record: ChatRecord) -> ChatRecord:
+        """
+        Replace the preview of a chat record's user message with the full message from the payload store.
+
+        :param record: The chat record.
+        :return: The same chat record.
+        """
+        if record.user_message_ref:
+            message = self.payload_store.get_text(record.user_message_ref)
+            if message is None:
+                print(f"User message {record.user_message_ref} of chat {record.id} is missing from the payload store")
+            else:
+                record.user_message = message
+        return record
+
+    @staticmethod
+    def _map_chat_record(item: dict) -> ChatRecord:
+        return ChatRecord(
+            id=item['id'],
+            agent_id=item['agent_id'],
+            user_message=item['user_message'],
+            create_time=item['create_time'],
+            user_message_ref=item.get('user_message_ref'),
+            user_message_size=int(item['user_message_size']) if 'user_message_size' in item else None,
+            usage={k: int(v) for k, v in item['usage'].items()} if 'usage' in item else None,
+            tool_metrics={name: {k: float(v) if k == 'total_time' else int(v) for k, v in values.items()}
+                          for name, values in item['tool_metrics'].items()} if 'tool_metrics' in item else None,
+            session_id=item.get('session_id'),
+            cycle_usage=[{k: int(v) for k, v in cycle.items()} for cycle in item['cycle_usage']]
+            if 'cycle_usage' in item else None,
+            expire_at=int(item[CHAT_TTL_ATTRIBUTE]) if CHAT_TTL_ATTRIBUTE in item else None
+        )
+
+    def set_chat_metrics(self, chat_id: str, usage: Dict[str, int], tool_metrics: Dict[str, Dict[str, Any]],
+                         cycle_usage: Optional[List[Dict[str, int]]] = None):
+        """
+        Store the token usage and tool metrics of a finished chat on its record.
+
+        :param chat_id: The ID of the chat.
+        :param usage: The token usage, see summarize_chat_metrics.
+        :param tool_metrics: The tool metrics, see summarize_chat_metrics.
+        :param cycle_usage: The token usage of each cycle, see summarize_chat_metrics.
+        """
+        table = self.dynamodb.Table(self.chat_record_table_name)
+        try:
+            table.update_item(
+                Key={'id': chat_id},
+                UpdateExpression='SET #usage = :usage, tool_metrics = :tool_metrics, cycle_usage = :cycle_usage',
+                ExpressionAttributeNames={'#usage': 'usage'},
+                ExpressionAttributeValues={
+                    ':usage': usage,
+                    ':tool_metrics': json.loads(json.dumps(tool_metrics), parse_float=Decimal),
+                    ':cycle_usage': cycle_usage or []
+                },
+                # Do not recreate a record deleted while the chat was running
+                ConditionExpression=Attr('id').exists()
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        self.cache.invalidate(chat_id)
+
     
     def get_chat_records(self) -> List[ChatRecord]:
         """
-        Retrieve all chat records from Amazon DynamoDB.
+        Retrieve the 100 most recent chat records from Amazon DynamoDB.
+        Large user messages are returned as previews, see get_chat_record.
+
+        :return: A list of ChatRecord objects, newest first.
+        """
+        records, _ = self.list_chat_records(limit=100)
+        return records
+
+    def list_chat_records(self, limit: int = 100, cursor: Optional[str] = None, agent_id: Optional[str] = None,
+                          start_time: Optional[str] = None, end_time: Optional[str] = None) -> Tuple[List[ChatRecord], Optional[str]]:
+        """
+        List chat records newest first, one page at a time.
+
+        Records of one agent are read from the agent_id/create_time index. Otherwise the time_bucket/create_time
+        index is read month by month, walking back to start_time or at most CHAT_LIST_LOOKBACK_MONTHS.
+
+        :param limit: The maximum number of records to return.
+        :param cursor: The cursor returned with the previous page, None for the first page.
+        :param agent_id: Only list the chats of this agent.
+        :param start_time: Only list chats created at or after this time ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS").
+        :param end_time: Only list chats created at or before this time ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS").
+        :raises ValueError: If the cursor is malformed.
+        :return: A tuple of (records, cursor of the next page or None).
+        """
+        table = self.dynamodb.Table(self.chat_record_table_name)
+        position = self._decode_cursor(cursor) if cursor else {}
+        if end_time and len(end_time) == len('YYYY-MM-DD'):
+            end_time = f"{end_time} 23:59:59"
+
+        def query(index_name: str, key: str, value: str, start_key: Optional[dict], page_size: int) -> dict:
+            condition = Key(key).eq(value)
+            if start_time and end_time:
+                condition &= Key('create_time').between(start_time, end_time)
+            elif start_time:
+                condition &= Key('create_time').gte(start_time)
+            elif end_time:
+                condition &= Key('create_time').lte(end_time)
+            kwargs = {'IndexName': index_name, 'KeyConditionExpression': condition,
+                      'ScanIndexForward': False, 'Limit': page_size}
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            return table.query(**kwargs)
+
+        if agent_id:
+            response = query(CHAT_RECORD_AGENT_INDEX, 'agent_id', agent_id, position.get('k'), limit)
+            records = [self._map_chat_record(item) for item in response.get('Items', [])]
+            last_key = response.get('LastEvaluatedKey')
+            return records, self._encode_cursor({'k': last_key}) if last_key else None
+
+        bucket = position.get('b') or self._time_bucket(end_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        oldest = self._time_bucket(start_time) if start_time else self._shift_bucket(
+            self._time_bucket(datetime.now().strftime("%Y-%m-%d %H:%M:%S")), -CHAT_LIST_LOOKBACK_MONTHS)
+        start_key = position.get('k')
+        records = []
+        while bucket >= oldest:
+            response = query(CHAT_RECORD_TIME_INDEX, 'time_bucket', bucket, start_key, limit - len(records))
+            records.extend(self._map_chat_record(item) for item in response.get('Items', []))
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key:
+                bucket = self._shift_bucket(bucket, -1)
+            if len(records) >= limit:
+                break
+        if bucket < oldest:
+            return records, None
+        return records, self._encode_cursor({'b': bucket, 'k': start_key})
+
+    def scan_chat_ids(self, start_time: Optional[str] = None, end_time: Optional[str] = None,
+                      page_size: int = 100, cursor: Optional[str] = None) -> Iterator[Tuple[List[str], Optional[str]]]:
+        """
+        Scan the IDs of all chats created in a time range, one page at a time.
+
+        Unlike list_chat_records, this reads the whole table: it finds chats older than CHAT_LIST_LOOKBACK_MONTHS
+        and chats written before time_bucket existed, and is meant for bulk jobs rather than listings.
+
+        :param start_time: Only include chats created at or after this time ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS").
+        :param end_time: Only include chats created at or before this time ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS").
+        :param page_size: The number of records read per request.
+        :param cursor: The cursor returned with a previous page, to resume the scan after it.
+        :raises ValueError: If the cursor is malformed.
+        :return: A generator of (chat IDs, cursor of the next page or None), in no particular order.
+        """
+        if end_time and len(end_time) == len('YYYY-MM-DD'):
+            end_time = f"{end_time} 23:59:59"
+        table = self.dynamodb.Table(self.chat_record_table_name)
+        kwargs = {'ProjectionExpression': 'id', 'Limit': page_size}
+        if start_time and end_time:
+            kwargs['FilterExpression'] = Attr('create_time').between(start_time, end_time)
+        elif start_time:
+            kwargs['FilterExpression'] = Attr('create_time').gte(start_time)
+        elif end_time:
+            kwargs['FilterExpression'] = Attr('create_time').lte(end_time)
+        if cursor:
+            kwargs['ExclusiveStartKey'] = self._decode_cursor(cursor)['k']
+        while True:
+            response = table.scan(**kwargs)
+            last_key = response.get('LastEvaluatedKey')
+            next_cursor = self._encode_cursor({'k': last_key}) if last_key else None
+            if response.get('Items') or not last_key:
+                yield [item['id'] for item in response.get('Items', [])], next_cursor
+            if not last_key:
+                return
+            kwargs['ExclusiveStartKey'] = last_key
+
+    def backfill_time_buckets(self) -> int:
+        """
+        Set the time_bucket attribute on chat records written before time-ordered listing existed.
+
+        :return: The number of records updated.
+        """
+        table = self.dynamodb.Table(self.chat_record_table_name)
+        kwargs = {'FilterExpression': Attr('time_bucket').not_exists(), 'ProjectionExpression': 'id, create_time'}
+        updated = 0
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get('Items', []):
+                table.update_item(Key={'id': item['id']}, UpdateExpression='SET time_bucket = :b',
+                                  ExpressionAttributeValues={':b': self._time_bucket(item['create_time'])})
+                self.cache.invalidate(item['id'])
+                updated += 1
+            if 'LastEvaluatedKey' not in response:
+                return updated
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _update_search_index(self, method: str, *args):
+        # The search index is derived data, failing to update it must not fail the write
+        if self.search_index is None:
+            return
+        try:
+            getattr(self.search_index, method)(*args)
+        except Exception as e:
+            print(f"Error updating chat search index ({method}, chat {args[0]}): {str(e)}")
+
+    def rebuild_search_index(self) -> int:
+        """
+        Index all chats, e.g. chats written before search existed or when the index is moved to a new volume.
+        Like backfill_time_buckets, this scans the chat record table and is meant to be run once, off-peak.
+
+        :return: The number of chats indexed.
+        """
+        if self.search_index is None:
+            return 0
+        table = self.dynamodb.Table(self.chat_record_table_name)
+        kwargs = {}
+        indexed = 0
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get('Items', []):
+                self._index_chat(self._map_chat_record(item))
+                indexed += 1
+            if 'LastEvaluatedKey' not in response:
+                return indexed
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def sync_search_index(self) -> int:
+        """
+        Index the chats other tasks wrote since the last sync, as each task keeps its own search index.
+
+        Chats created within CHAT_SEARCH_SYNC_WINDOW_MINUTES, or since the last sync if it is older, are indexed
+        again on every sync until their metrics are stored, i.e. until they finish, so their final assistant text
+        is indexed too. The first sync of a new index, e.g. of a new task, indexes all chats.
+
+        :return: The number of chats indexed.
+        """
+        if self.search_index is None:
+            return 0
+        now = datetime.now()
+        start = now - timedelta(minutes=CHAT_SEARCH_SYNC_WINDOW_MINUTES)
+        synced_until = self.search_index.synced_until()
+        if synced_until:
+            start = min(start, datetime.strptime(synced_until, "%Y-%m-%d %H:%M:%S"))
+        indexed = 0 if synced_until else self.rebuild_search_index()
+        cursor = None
+        while True:
+            records, cursor = self.list_chat_records(100, cursor, start_time=start.strftime("%Y-%m-%d %H:%M:%S"))
+            finished = self.search_index.finished_chats([record.id for record in records])
+            for record in records:
+                if record.id in finished:
+                    continue
+                self._index_chat(record)
+                if record.usage is not None:
+                    self.search_index.mark_finished(record.id)
+                indexed += 1
+            if not cursor:
+                break
+        self.search_index.set_synced_until(now.strftime("%Y-%m-%d %H:%M:%S"))
+        return indexed
+
+    def start_search_sync(self):
+        """
+        Sync the search index of this task with the chat tables in the background, see sync_search_index.
+        """
+        if self.search_index is not None:
+            self.search_index.start_sync(self.sync_search_index)
+
+    def search_chats(self, query: str, limit: int = 20, offset: int = 0,
+                     agent_id: Optional[str] = None) -> Tuple[List[ChatSearchHit], Optional[int]]:
+        """
+        Search chats, best matches first, leaving out chats another task deleted since they were indexed.
 
-        :return: A list of ChatRecord objects.
+        :param query: The words to search for, see ChatSearchIndex.search.
+        :param limit: The maximum number of hits to return.
+        :param offset: The number of hits to skip, i.e. the cursor returned with the previous page.
+        :param agent_id: Only search the chats of this agent.
+        :return: The hits and the offset of the next page, None if this is the last page.
         """
+        hits, next_offset = self.search_index.search(query, limit, offset, agent_id)
         table = self.dynamodb.Table(self.chat_record_table_name)
-        response = table.scan(Limit=100)
-        items = response.get('Items', [])
-        if items:
-            return [ChatRecord(id=item['id'], agent_id=item['agent_id'], user_message=item['user_message'], create_time=item['create_time']) for item in items]
-        return []
+        found = []
+        for hit in hits:
+            if 'Item' in table.get_item(Key={'id': hit.chat_id}, ProjectionExpression='id'):
+                found.append(hit)
+            else:
+                self.search_index.delete(hit.chat_id)
+        return found, next_offset
+
+    def _index_chat(self, record: ChatRecord):
+        record = self.rehydrate_user_message(record)
+        self.search_index.index_message(record.id, record.agent_id, record.create_time, record.user_message,
+                                        record.expire_at)
+        texts = [assistant_text(r.content) for r in self.get_all_chat_responses(record.id)]
+        texts = [text for text in texts if text]
+        if texts:
+            self.search_index.index_assistant_text(record.id, texts[-1])
+
+    @staticmethod
+    def _time_bucket(create_time: str) -> str:
+        # Month of a "YYYY-MM-DD HH:MM:SS" timestamp
+        return create_time[:7]
+
+    @staticmethod
+    def _shift_bucket(bucket: str, months: int) -> str:
+        year, month = map(int, bucket.split('-'))
+        index = year * 12 + month - 1 + months
+        return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+    @staticmethod
+    def _encode_cursor(position: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> dict:
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if not isinstance(position, dict):
+            raise ValueError("Invalid cursor")
+        return position
     
-    def add_chat_response(self, response: ChatResponse):
+    def add_chat_response(self, response: ChatResponse, expire_at: Optional[int] = None):
         """
         Add a chat response to Amazon DynamoDB.
 
         :param response: The ChatResponse object to add.
+        :param expire_at: Epoch seconds after which DynamoDB TTL may delete the response, None to keep it.
         """
         table = self.dynamodb.Table(self.chat_response_table_name)
+        item = self._chat_response_item(response)
+        if expire_at:
+            item[CHAT_TTL_ATTRIBUTE] = expire_at
         try:
-            table.put_item(
-                Item={
-                    'id': response.chat_id,
-                    'resp_no': response.resp_no,
-                    'content': response.content,
-                    'create_time': response.create_time
-                }
-            )
+            table.put_item(Item=item)
+            self.cache.invalidate(response.chat_id)
+            text = assistant_text(response.content)
+            if text:
+                self._update_search_index('index_assistant_text', response.chat_id, text)
             print(f"Successfully wrote chat response to DynamoDB. Chat ID: {response.chat_id}, Response No: {response.resp_no}")
         except Exception as e:
             print(f"Error writing chat response to DynamoDB. Chat ID: {response.chat_id}, Response No: {response.resp_no}")
             print(f"Error details: {str(e)}")
             raise
 
+    def _chat_response_item(self, response: ChatResponse) -> dict:
+        """
+        Build the DynamoDB item of a chat response, compressing or spilling large content.
+        """
+        item = {
+            'id': response.chat_id,
+            'resp_no': response.resp_no,
+            'create_time': response.create_time
+        }
+        content = response.content.encode('utf-8')
+        if len(content) <= CHAT_RESPONSE_COMPRESS_BYTES:
+            item['content'] = response.content
+            return item
+
+        compressed = compress(content)
+        if len(compressed) <= CHAT_RESPONSE_SPILL_BYTES:
+            item['content_z'] = compressed
+        else:
+            item['content_ref'] = self.payload_store.put(content)
+        item['content_size'] = len(content)
+        return item
+
+    def _load_chat_response(self, item: dict) -> ChatResponse:
+        """
+        Map a DynamoDB item to a ChatResponse, decompressing or fetching its content as needed.
+        """
+        if 'content_z' in item:
+            content = decompress(item['content_z'].value).decode('utf-8')
+        elif 'content_ref' in item:
+            content = self.payload_store.get_text(item['content_ref'])
+            if content is None:
+                print(f"Content {item['content_ref']} of chat {item['id']} response {item['resp_no']} is missing from the payload store")
+                content = ''
+        else:
+            content = item['content']
+        return ChatResponse(chat_id=item['id'], resp_no=item['resp_no'], content=content, create_time=item['create_time'])
+
+    def _load_transcript(self, item: dict) -> List[ChatResponse]:
+        """
+        Decode a transcript item written by compact_chat.
+        """
+        if 'transcript_ref' in item:
+            data = self.payload_store.get(item['transcript_ref'])
+            if data is None:
+                print(f"Transcript {item['transcript_ref']} of chat {item['id']} is missing from the payload store")
+                return []
+        else:
+            data = decompress(item['transcript_z'].value)
+        # Columnar layout: one list per field, so repeated keys are not stored once per response
+        transcript = json.loads(data)
+        return [ChatResponse(chat_id=item['id'], resp_no=resp_no, content=content, create_time=create_time)
+                for resp_no, create_time, content in zip(transcript['resp_no'], transcript['create_time'], transcript['content'])]
+
+    def _load_chat_responses(self, items: List[dict]) -> List[ChatResponse]:
+        if any('content_ref' in item for item in items):
+            # Spilled payloads may need an S3 round trip each, fetch them concurrently
+            with ThreadPoolExecutor(max_workers=CHAT_RESPONSE_FETCH_THREADS) as executor:
+                return list(executor.map(self._load_chat_response, items))
+        return [self._load_chat_response(item) for item in items]
+
+    def iter_chat_response_pages(self, chat_id: str, after: Optional[int] = None, page_size: int = CHAT_RESPONSE_PAGE_SIZE,
+                                 include_content: bool = True) -> Iterator[List[ChatResponse]]:
+        """
+        Page through the responses of a chat in resp_no order, following DynamoDB pagination.
+
+        Compacted chats are read from their transcript item first, then any rows not folded into it. Pages
+        are served from the chat cache when the same read was made recently.
+
+        :param chat_id: The ID of the chat to retrieve responses for.
+        :param after: Only return responses with a greater resp_no, to resume an earlier read.
+        :param page_size: The maximum number of items read per DynamoDB query.
+        :param include_content: Whether to load response content; if False, content is left empty and
+            content attributes are not read.
+        :return: An iterator of ChatResponse pages.
+        """
+        key = ('responses', chat_id, after, page_size, include_content)
+        pages = self.cache.get(key)
+        if pages is not None:
+            yield from pages
+            return
+
+        version = self.cache.version(chat_id)
+        pages = []
+        for page in self._read_chat_response_pages(chat_id, after, page_size, include_content):
+            pages.append(page)
+            yield page
+        self.cache.put(key, pages, tag=chat_id, if_version=version)
+
+    def _read_chat_response_pages(self, chat_id: str, after: Optional[int], page_size: int,
+                                  include_content: bool) -> Iterator[List[ChatResponse]]:
+        """
+        Read pages of chat responses from Amazon DynamoDB, see iter_chat_response_pages.
+        """
+        table = self.dynamodb.Table(self.chat_response_table_name)
+        lower = TRANSCRIPT_RESP_NO if after is None else after + 1
+        kwargs = {'KeyConditionExpression': Key('id').eq(chat_id) & Key('resp_no').gte(lower), 'Limit': page_size}
+        if not include_content:
+            kwargs['ProjectionExpression'] = 'id, resp_no, create_time'
+
+        transcribed = set()
+        if after is not None:
+            # The cursor skips the transcript item, which may still hold responses after it
+            item = table.get_item(Key={'id': chat_id, 'resp_no': TRANSCRIPT_RESP_NO}).get('Item')
+            responses = [r for r in self._load_transcript(item) if r.resp_no > after] if item else []
+            transcribed = {r.resp_no for r in responses}
+            for i in range(0, len(responses), page_size):
+                yield self._strip_content(responses[i:i + page_size], include_content)
+
+        while True:
+            response = table.query(**kwargs)
+            items = response.get('Items', [])
+            if items and items[0]['resp_no'] == TRANSCRIPT_RESP_NO:
+                item = items.pop(0)
+                if not include_content:
+                    item = table.get_item(Key={'id': chat_id, 'resp_no': TRANSCRIPT_RESP_NO}).get('Item', item)
+                responses = self._load_transcript(item)
+                transcribed = {r.resp_no for r in responses}
+                for i in range(0, len(responses), page_size):
+                    yield self._strip_content(responses[i:i + page_size], include_content)
+            # Rows not yet removed by compaction, or added after it, are read individually
+            items = [item for item in items if item['resp_no'] not in transcribed]
+            if items:
+                if include_content:
+                    yield self._load_chat_responses(items)
+                else:
+                    yield [ChatResponse(chat_id=item['id'], resp_no=item['resp_no'], content='', create_time=item['create_time'])
+                           for item in items]
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def _strip_content(responses: List[ChatResponse], include_content: bool) -> List[ChatResponse]:
+        if not include_content:
+            for r in responses:
+                r.content = ''
+        return responses
+
+    async def iter_chat_responses(self, chat_id: str, after: Optional[int] = None, page_size: int = CHAT_RESPONSE_PAGE_SIZE,
+                                  include_content: bool = True) -> AsyncIterator[ChatResponse]:
+        """
+        Asynchronously iterate over the responses of a chat, reading one page at a time off the event loop.
+
+        :param chat_id: The ID of the chat to retrieve responses for.
+        :param after: Only return responses with a greater resp_no, to resume an earlier read.
+        :param page_size: The maximum number of items read per DynamoDB query.
+        :param include_content: Whether to load response content.
+        :return: An async iterator of ChatResponse objects ordered by resp_no.
+        """
+        pages = self.iter_chat_response_pages(chat_id, after, page_size, include_content)
+        while (page := await asyncio.to_thread(next, pages, None)) is not None:
+            for response in page:
+                yield response
+
     def get_all_chat_responses(self, chat_id: str) -> List[ChatResponse]:
         """
         Retrieve all chat responses for a given chat ID from Amazon DynamoDB.
+        Compressed content is decompressed, spilled content is fetched from the payload store and compacted
+        chats are read from their transcript item.
 
         :param chat_id: The ID of the chat to retrieve responses for.
-        :return: A list of ChatResponse objects.
+        :return: A list of ChatResponse objects ordered by resp_no.
+        """
+        return [r for page in self.iter_chat_response_pages(chat_id) for r in page]
+
+    def get_chat_response(self, chat_id: str, resp_no: int) -> Optional[ChatResponse]:
         """
+        Retrieve a single chat response by its key.
+
+        :param chat_id: The ID of the chat.
+        :param resp_no: The number of the response within the chat.
+        :return: A ChatResponse object if found, otherwise None.
+        """
+        table = self.dynamodb.Table(self.chat_response_table_name)
+        item = table.get_item(Key={'id': chat_id, 'resp_no': resp_no}).get('Item')
+        if item:
+            return self._load_chat_response(item)
+        item = table.get_item(Key={'id': chat_id, 'resp_no': TRANSCRIPT_RESP_NO}).get('Item')
+        if item:
+            return next((r for r in self._load_transcript(item) if r.resp_no == resp_no), None)
+        return None
+
+    def compact_chat(self, chat_id: str, expire_at: Optional[int] = None) -> int:
+        """
+        Fold all responses of a finished chat into a single compressed transcript item and delete the
+        per-response items.
+
+        The transcript is written before the rows are deleted, so readers see a complete chat throughout.
+
+        :param chat_id: The ID of the chat to compact.
+        :param expire_at: Epoch seconds after which DynamoDB TTL may delete the transcript, None to keep it.
+        :return: The number of response items removed.
+        """
+        responses = self.get_all_chat_responses(chat_id)
+        if not responses:
+            return 0
         table = self.dynamodb.Table(self.chat_response_table_name)
-        response = table.query(KeyConditionExpression=boto3.dynamodb.conditions.Key('id').eq(chat_id))
-        items = response.get('Items', [])
-        if items:
-            return [ChatResponse(chat_id=item['id'], resp_no=item['resp_no'], content=item['content'], create_time=item['create_time']) for item in items]
-        return []
+        rows = []
+        kwargs = {'KeyConditionExpression': Key('id').eq(chat_id) & Key('resp_no').gte(0), 'ProjectionExpression': 'resp_no'}
+        while True:
+            response = table.query(**kwargs)
+            rows.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        if not rows:
+            return 0
+
+        transcript = {
+            'v': TRANSCRIPT_VERSION,
+            'resp_no': [r.resp_no for r in responses],
+            'create_time': [r.create_time for r in responses],
+            'content': [r.content for r in responses]
+        }
+        data = json.dumps(transcript, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        item = {
+            'id': chat_id,
+            'resp_no': TRANSCRIPT_RESP_NO,
+            'create_time': responses[-1].create_time,
+            'responses': len(responses),
+            'content_size': len(data)
+        }
+        if expire_at:
+            item[CHAT_TTL_ATTRIBUTE] = expire_at
+        compressed = compress(data)
+        if len(compressed) <= CHAT_RESPONSE_SPILL_BYTES:
+            item['transcript_z'] = compressed
+        else:
+            item['transcript_ref'] = self.payload_store.put(data)
+        table.put_item(Item=item)
+
+        with table.batch_writer() as batch:
+            for row in rows:
+                batch.delete_item(Key={'id': chat_id, 'resp_no': row['resp_no']})
+        self.cache.invalidate(chat_id)
+        print(f"Compacted chat {chat_id}: {len(rows)} responses, {len(data)} bytes into {len(compressed)} bytes")
+        return len(rows)
     
-    def del_chat(self, id: str):
+    def del_chat(self, id: str) -> int:
         """
         Delete Chat Record and Chat Responses by its ID from Amazon DynamoDB.
 
-        :param id: The ID of the agent to delete.
+        :param id: The ID of the chat to delete.
+        :return: The number of response items deleted.
+        """
+        self.del_chat_record(id)
+        return self.del_chat_responses(id)
+
+    def del_chat_record(self, id: str):
+        """
+        Delete a chat record, leaving its responses.
+
+        :param id: The ID of the chat.
         """
         table = self.dynamodb.Table(self.chat_record_table_name)
         table.delete_item(Key={'id': id})
+        self.cache.invalidate(id)
+        self._update_search_index('delete', id)
 
+    def del_chat_responses(self, id: str) -> int:
+        """
+        Delete all response items of a chat, following DynamoDB pagination.
+
+        :param id: The ID of the chat.
+        :return: The number of response items deleted.
+        """
         table = self.dynamodb.Table(self.chat_response_table_name)
-        response = table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('id').eq(id)
-        )
-        
-        items = response['Items']
+        kwargs = {'KeyConditionExpression': Key('id').eq(id), 'ProjectionExpression': 'id, resp_no'}
         deleted_count = 0
         
         # 批量删除项目
         with table.batch_writer() as batch:
-            for item in items:
-                batch.delete_item(
-                    Key={
-                        'id': item['id'],
-                        'resp_no': item['resp_no']
-                    }
-                )
-                deleted_count += 1
+            while True:
+                response = table.query(**kwargs)
+                for item in response.get('Items', []):
+                    batch.delete_item(
+                        Key={
+                            'id': item['id'],
+                            'resp_no': item['resp_no']
+                        }
+                    )
+                    deleted_count += 1
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        self.cache.invalidate(id)
         print(f"delete chat:{id}, count:{deleted_count}")
+        return deleted_count
     
 
 
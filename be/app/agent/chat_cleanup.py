@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from pydantic import BaseModel
+
+from .agent import AgentPO, ChatRecordService
+from .session import ChatSessionService
+from ..storage import get_storage
+
+# Chats deleted between two progress updates of a deletion job
+CHAT_DELETE_BATCH_SIZE = int(os.environ.get('CHAT_DELETE_BATCH_SIZE', 25))
+CHAT_DELETE_WORKERS = int(os.environ.get('CHAT_DELETE_WORKERS', 2))
+# Default retention of chats of agents without "chat_retention_days" in their extras, 0 keeps chats forever
+CHAT_RETENTION_DAYS = int(os.environ.get('CHAT_RETENTION_DAYS', 0))
+# How long finished deletion jobs are kept for progress queries
+CHAT_DELETE_JOB_RETENTION_DAYS = 7
+# Unfinished jobs without progress for this long were interrupted, e.g. by a restart, and are resumed at startup
+CHAT_DELETE_JOB_STALE_MINUTES = int(os.environ.get('CHAT_DELETE_JOB_STALE_MINUTES', 10))
+# Hours between two sweeps of unreferenced chat payloads, 0 disables them
+CHAT_PAYLOAD_SWEEP_INTERVAL_HOURS = float(os.environ.get('CHAT_PAYLOAD_SWEEP_INTERVAL_HOURS', 24))
+# Unreferenced payloads stored or reused more recently than this are kept, their item may not be written yet
+CHAT_PAYLOAD_SWEEP_GRACE_HOURS = float(os.environ.get('CHAT_PAYLOAD_SWEEP_GRACE_HOURS', 24))
+# The attributes referencing payloads in the payload store, by table
+PAYLOAD_REF_ATTRIBUTES = {
+    ChatRecordService.chat_record_table_name: ('user_message_ref',),
+    ChatRecordService.chat_response_table_name: ('content_ref', 'transcript_ref'),
+    ChatSessionService.dynamodb_table_name: ('messages_ref',),
+}
+
+
+def chat_expire_at(agent: Optional[AgentPO]) -> Optional[int]:
+    """
+    Compute when the chats of an agent expire.
+
+    The retention is read from the agent's extras ("chat_retention_days"), falling back to CHAT_RETENTION_DAYS.
+
+    :param agent: The agent, None if unknown.
+    :return: The expiry as epoch seconds, or None if the chats are kept.
+    """
+    days = CHAT_RETENTION_DAYS
+    if agent and agent.extras and agent.extras.get('chat_retention_days') is not None:
+        days = int(agent.extras['chat_retention_days'])
+    if days <= 0:
+        return None
+    return int(time.time()) + days * 24 * 3600
+
+
+class ChatDeletionJob(BaseModel):
+    id: str
+    status: str = "pending"  # pending, running, done or failed
+    chat_ids: Optional[List[str]] = None
+    agent_id: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    # Where to resume: the offset into chat_ids, or the listing or scan cursor of the next batch
+    cursor: Optional[str] = None
+    deleted_chats: int = 0
+    deleted_responses: int = 0
+    error: Optional[str] = None
+    create_time: str
+    update_time: str
+
+
+class ChatCleanupService:
+    """
+    A service to delete chats in bulk, by ID list, agent or creation time range.
+
+    Deletions run as background jobs on a small thread pool and delete chats in batches; the progress of each
+    job is recorded in Amazon DynamoDB so it can be queried from any task. After each batch the job records a
+    cursor, so a job interrupted by a restart is resumed from its last batch. Payloads left unreferenced by deleted
+    or expired chats and sessions are removed by a periodic sweep.
+    """
+
+    job_table_name = "ChatDeletionJobTable"
+
+    def __init__(self, chat_service: ChatRecordService, workers: int = CHAT_DELETE_WORKERS):
+        self.dynamodb = get_storage()
+        self.chat_service = chat_service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-delete")
+        self.sweeper: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.running = set()
+
+    def submit(self, chat_ids: Optional[List[str]] = None, agent_id: Optional[str] = None,
+               start_time: Optional[str] = None, end_time: Optional[str] = None) -> ChatDeletionJob:
+        """
+        Queue a deletion job.
+
+        :param chat_ids: The IDs of the chats to delete.
+        :param agent_id: Delete the chats of this agent.
+        :param start_time: Delete chats created at or after this time.
+        :param end_time: Delete chats created at or before this time.
+        :raises ValueError: If no criteria are given.
+        :return: The queued job.
+        """
+        if not chat_ids and not agent_id and not start_time and not end_time:
+            raise ValueError("Specify chat_ids, agent_id or a time range")
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        job = ChatDeletionJob(id=uuid.uuid4().hex, chat_ids=chat_ids, agent_id=agent_id, start_time=start_time,
+                              end_time=end_time, create_time=now, update_time=now)
+        self._save(job)
+        self._start(job)
+        return job
+
+    def resume(self, job_id: str) -> Optional[ChatDeletionJob]:
+        """
+        Resume a failed job from its last batch.
+
+        :param job_id: The ID of the job.
+        :return: The job, None if it does not exist.
+        """
+        job = self.get_job(job_id)
+        if job and job.status == "failed":
+            job = self._claim(job)
+            if job:
+                self._start(job)
+        return job or self.get_job(job_id)
+
+    def resume_interrupted_jobs(self) -> int:
+        """
+        Resume the unfinished jobs that made no progress for CHAT_DELETE_JOB_STALE_MINUTES, whichever task ran them.
+
+        :return: The number of jobs resumed.
+        """
+        stale_before = (datetime.now() - timedelta(minutes=CHAT_DELETE_JOB_STALE_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
+        table = self.dynamodb.Table(self.job_table_name)
+        kwargs = {'FilterExpression': Attr('status').is_in(["pending", "running"]) & Attr('update_time').lt(stale_before)}
+        resumed = 0
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get('Items', []):
+                job = self._claim(ChatDeletionJob.model_validate(item))
+                if job:
+                    print(f"Resuming interrupted chat deletion job {job.id}")
+                    self._start(job)
+                    resumed += 1
+            if 'LastEvaluatedKey' not in response:
+                return resumed
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_job(self, job_id: str) -> Optional[ChatDeletionJob]:
+        """
+        Retrieve a deletion job and its progress.
+
+        :param job_id: The ID of the job.
+        :return: A ChatDeletionJob object if found, otherwise None.
+        """
+        response = self.dynamodb.Table(self.job_table_name).get_item(Key={'id': job_id})
+        item = response.get('Item')
+        if item:
+            return ChatDeletionJob.model_validate(item)
+        return None
+
+    def sweep_payloads(self, grace_hours: float = CHAT_PAYLOAD_SWEEP_GRACE_HOURS) -> int:
+        """
+        Delete the payloads no chat record, response or session references any more.
+
+        This scans the referencing tables in full, so it blocks for a while; run it in a worker thread.
+
+        :param grace_hours: Keep unreferenced payloads stored or reused within this many hours.
+        :return: The number of payloads deleted.
+        """
+        cutoff = time.time() - grace_hours * 3600
+        deleted = self.chat_service.payload_store.sweep(self._payload_references(), cutoff)
+        print(f"Swept {deleted} unreferenced chat payloads")
+        return deleted
+
+    def start_payload_sweeps(self, interval_hours: float = CHAT_PAYLOAD_SWEEP_INTERVAL_HOURS):
+        """
+        Sweep unreferenced payloads every interval_hours in a background thread, once per process.
+        """
+        if interval_hours <= 0 or self.sweeper:
+            return
+
+        def sweep_periodically():
+            while True:
+                time.sleep(interval_hours * 3600)
+                try:
+                    self.sweep_payloads()
+                except Exception as e:
+                    print(f"Error sweeping chat payloads: {str(e)}")
+
+        self.sweeper = threading.Thread(target=sweep_periodically, name="payload-sweep", daemon=True)
+        self.sweeper.start()
+
+    def _payload_references(self) -> Set[str]:
+        referenced = set()
+        for table_name, attributes in PAYLOAD_REF_ATTRIBUTES.items():
+            table = self.dynamodb.Table(table_name)
+            kwargs = {'ProjectionExpression': ', '.join(attributes), 'ConsistentRead': True}
+            while True:
+                response = table.scan(**kwargs)
+                for item in response.get('Items', []):
+                    referenced.update(item[attribute] for attribute in attributes if attribute in item)
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return referenced
+
+    def _claim(self, job: ChatDeletionJob) -> Optional[ChatDeletionJob]:
+        # Only the task whose update lands first resumes the job, the others see its update_time changed
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.dynamodb.Table(self.job_table_name).update_item(
+                Key={'id': job.id},
+                UpdateExpression="SET update_time = :now",
+                ConditionExpression=Attr('update_time').eq(job.update_time) & Attr('status').eq(job.status),
+                ExpressionAttributeValues={':now': now}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise
+        job.update_time = now
+        return job
+
+    def _start(self, job: ChatDeletionJob):
+        with self.lock:
+            if job.id in self.running:
+                return
+            self.running.add(job.id)
+        self.executor.submit(self._run, job)
+
+    def _save(self, job: ChatDeletionJob):
+        item = {k: v for k, v in job.model_dump().items() if v is not None}
+        item['expire_at'] = int(time.time()) + CHAT_DELETE_JOB_RETENTION_DAYS * 24 * 3600
+        self.dynamodb.Table(self.job_table_name).put_item(Item=item)
+
+    def _chat_id_batches(self, job: ChatDeletionJob):
+        """
+        Yield (chat IDs, cursor after them) batches of the chats to delete, from the job's cursor on.
+        """
+        if job.chat_ids:
+            for i in range(int(job.cursor or 0), len(job.chat_ids), CHAT_DELETE_BATCH_SIZE):
+                yield job.chat_ids[i:i + CHAT_DELETE_BATCH_SIZE], str(i + CHAT_DELETE_BATCH_SIZE)
+            return
+        if not job.agent_id:
+            # A time range spans all chats, including those older than the listing lookback or without time_bucket
+            yield from self.chat_service.scan_chat_ids(job.start_time, job.end_time, CHAT_DELETE_BATCH_SIZE, job.cursor)
+            return
+        # The agent index holds every chat of the agent, whatever its age
+        cursor = job.cursor
+        while True:
+            records, cursor = self.chat_service.list_chat_records(CHAT_DELETE_BATCH_SIZE, cursor, job.agent_id,
+                                                                  job.start_time, job.end_time)
+            yield [record.id for record in records], cursor
+            if not cursor:
+                return
+
+    def _run(self, job: ChatDeletionJob):
+        job.status = "running"
+        job.error = None
+        self._save(job)
+        try:
+            for chat_ids, cursor in self._chat_id_batches(job):
+                for chat_id in chat_ids:
+                    job.deleted_responses += self.chat_service.del_chat(chat_id)
+                    job.deleted_chats += 1
+                job.cursor = cursor
+                job.update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self._save(job)
+            job.status = "done"
+        except Exception as e:
+            print(f"Error in chat deletion job {job.id}: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            with self.lock:
+                self.running.discard(job.id)
+        job.update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._save(job)
+        print(f"Chat deletion job {job.id} {job.status}: {job.deleted_chats} chats, {job.deleted_responses} responses")
+
+
+_service: Optional[ChatCleanupService] = None
+_service_lock = threading.Lock()
+
+
+def get_chat_cleanup_service() -> ChatCleanupService:
+    """
+    Get the process-wide chat cleanup service, creating it on first use.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChatCleanupService(ChatRecordService())
+        return _service
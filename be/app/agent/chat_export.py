@@ -0,0 +1,285 @@
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+from pydantic import BaseModel
+
+from .agent import ChatRecordService
+from ..upload.service import UPLOAD_DIR, UPLOAD_KEY_PREFIX
+from ..utils.aws_config import get_aws_region
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:  # A dependency, but only needed to export chat history, which is refused without it
+    pyarrow = None
+
+# Where export jobs write their files and checkpoints, one directory per job
+CHAT_EXPORT_DIR = os.environ.get('CHAT_EXPORT_DIR', os.path.join(UPLOAD_DIR, 'exports'))
+# S3 location the exported files are uploaded to, empty to keep them local only
+CHAT_EXPORT_S3_BUCKET = os.environ.get('CHAT_EXPORT_S3_BUCKET', '')
+CHAT_EXPORT_S3_PREFIX = os.environ.get('CHAT_EXPORT_S3_PREFIX', f"{UPLOAD_KEY_PREFIX}/exports")
+# Rows buffered in memory before they are written out and the job is checkpointed
+CHAT_EXPORT_BUFFER_ROWS = int(os.environ.get('CHAT_EXPORT_BUFFER_ROWS', 50000))
+# Chats read from the store per page
+CHAT_EXPORT_PAGE_SIZE = 25
+CHAT_EXPORT_WORKERS = 1
+CHAT_EXPORT_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+CHECKPOINT_FILE = '_checkpoint.json'
+
+# Columns of the exported datasets, all exported files of a dataset share its schema
+_DATASET_COLUMNS = {
+    'chat_records': [
+        ('chat_id', 'string'), ('agent_id', 'string'), ('create_time', 'string'), ('user_message', 'string'),
+        ('user_message_size', 'int64'), ('input_tokens', 'int64'), ('output_tokens', 'int64'),
+        ('total_tokens', 'int64'), ('cycles', 'int64'), ('latency_ms', 'int64'),
+    ],
+    'chat_responses': [
+        ('chat_id', 'string'), ('agent_id', 'string'), ('resp_no', 'int64'), ('create_time', 'string'),
+        ('role', 'string'), ('content', 'string'),
+    ],
+    'tool_metrics': [
+        ('chat_id', 'string'), ('agent_id', 'string'), ('create_time', 'string'), ('tool_name', 'string'),
+        ('call_count', 'int64'), ('success_count', 'int64'), ('error_count', 'int64'), ('total_time', 'float64'),
+    ],
+}
+
+
+class ChatExportJob(BaseModel):
+    id: str
+    status: str = "pending"  # pending, running, done or failed
+    format: str = "parquet"
+    agent_id: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    # list_chat_records cursor of the first chat not yet written out, None before the first checkpoint
+    cursor: Optional[str] = None
+    # Number of checkpoints taken, part files are numbered by it
+    sequence: int = 0
+    exported_chats: int = 0
+    exported_responses: int = 0
+    files: List[str] = []
+    error: Optional[str] = None
+    create_time: str
+    update_time: str
+
+
+def _partition(create_time: str, agent_id: str) -> str:
+    # Hive-style partition directory, readable as columns by Athena, Spark, DuckDB or pyarrow.dataset. The keys
+    # must not repeat a file column: readers replace the column with the partition value, whose agent ID is
+    # sanitized, and Athena rejects such tables
+    safe_agent_id = re.sub(r'[^A-Za-z0-9_.-]', '_', agent_id or 'unknown')
+    return f"date={create_time[:10]}/agent={safe_agent_id}"
+
+
+def _message_role(content: str) -> Optional[str]:
+    try:
+        message = json.loads(content).get('message')
+    except (ValueError, AttributeError):
+        return None
+    return message.get('role') if isinstance(message, dict) else None
+
+
+class ChatExportService:
+    """
+    A service to export chat history to Parquet or Arrow files for offline analysis.
+
+    Export jobs read chats a page at a time through the time-ordered listing index and buffer at most
+    CHAT_EXPORT_BUFFER_ROWS rows (plus one page) before writing them out, partitioned by date and agent. After
+    each write the job records a checkpoint with the listing cursor, so an interrupted job resumes from its last
+    checkpoint instead of starting over.
+    """
+
+    def __init__(self, chat_service: ChatRecordService, export_dir: str = CHAT_EXPORT_DIR,
+                 workers: int = CHAT_EXPORT_WORKERS):
+        self.chat_service = chat_service
+        self.export_dir = export_dir
+        self.s3 = boto3.client('s3', region_name=get_aws_region()) if CHAT_EXPORT_S3_BUCKET else None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-export")
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def submit(self, format: str = "parquet", agent_id: Optional[str] = None, start_time: Optional[str] = None,
+               end_time: Optional[str] = None) -> ChatExportJob:
+        """
+        Queue an export job.
+
+        :param format: "parquet" or "arrow" (Arrow IPC files).
+        :param agent_id: Only export the chats of this agent.
+        :param start_time: Only export chats created at or after this time.
+        :param end_time: Only export chats created at or before this time, defaults to now so that a resumed
+            job exports the same chats.
+        :raises ValueError: If the format is not supported.
+        :raises RuntimeError: If pyarrow is not installed.
+        :return: The queued job.
+        """
+        if pyarrow is None:
+            raise RuntimeError("Exporting chat history requires the pyarrow package")
+        if format not in CHAT_EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format {format}, use parquet or arrow")
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        job = ChatExportJob(id=uuid.uuid4().hex, format=format, agent_id=agent_id, start_time=start_time,
+                            end_time=end_time or now, create_time=now, update_time=now)
+        self._save(job)
+        self._start(job)
+        return job
+
+    def resume(self, job_id: str) -> Optional[ChatExportJob]:
+        """
+        Resume an interrupted or failed job from its last checkpoint.
+
+        :param job_id: The ID of the job.
+        :return: The job, None if it does not exist.
+        """
+        job = self.get_job(job_id)
+        if job and job.status != "done":
+            self._start(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ChatExportJob]:
+        """
+        Retrieve an export job and its progress from its checkpoint.
+
+        :param job_id: The ID of the job.
+        :return: A ChatExportJob object if found, otherwise None.
+        """
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            return None
+        try:
+            with open(os.path.join(self.export_dir, job_id, CHECKPOINT_FILE), encoding='utf-8') as f:
+                return ChatExportJob.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _start(self, job: ChatExportJob):
+        with self.lock:
+            if job.id in self.running:
+                return
+            self.running.add(job.id)
+        self.executor.submit(self._run, job)
+
+    def _save(self, job: ChatExportJob):
+        job.update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        job_dir = os.path.join(self.export_dir, job.id)
+        os.makedirs(job_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=job_dir, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(job.model_dump_json())
+        os.replace(tmp_path, os.path.join(job_dir, CHECKPOINT_FILE))
+
+    def _run(self, job: ChatExportJob):
+        job.status = "running"
+        job.error = None
+        self._save(job)
+        self._remove_uncommitted_files(job)
+        try:
+            self._export(job)
+            job.status = "done"
+        except Exception as e:
+            print(f"Error in chat export job {job.id}: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            with self.lock:
+                self.running.discard(job.id)
+        self._save(job)
+        print(f"Chat export job {job.id} {job.status}: {job.exported_chats} chats, {job.exported_responses} responses, "
+              f"{len(job.files)} files")
+
+    def _export(self, job: ChatExportJob):
+        buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        buffered_rows = chats = responses = 0
+        cursor = job.cursor
+        while True:
+            records, cursor = self.chat_service.list_chat_records(CHAT_EXPORT_PAGE_SIZE, cursor, job.agent_id,
+                                                                  job.start_time, job.end_time)
+            for record in records:
+                partition = _partition(record.create_time, record.agent_id)
+                record = self.chat_service.rehydrate_user_message(record)
+                usage = record.usage or {}
+                buffers['chat_records', partition].append({
+                    'chat_id': record.id, 'agent_id': record.agent_id, 'create_time': record.create_time,
+                    'user_message': record.user_message,
+                    'user_message_size': record.user_message_size or len(record.user_message.encode('utf-8')),
+                    **{key: usage.get(key) for key in ('input_tokens', 'output_tokens', 'total_tokens', 'cycles',
+                                                       'latency_ms')},
+                })
+                for name, metrics in (record.tool_metrics or {}).items():
+                    buffers['tool_metrics', partition].append({
+                        'chat_id': record.id, 'agent_id': record.agent_id, 'create_time': record.create_time,
+                        'tool_name': name, **metrics,
+                    })
+                chat_responses = self.chat_service.get_all_chat_responses(record.id)
+                for response in chat_responses:
+                    buffers['chat_responses', partition].append({
+                        'chat_id': record.id, 'agent_id': record.agent_id, 'resp_no': response.resp_no,
+                        'create_time': response.create_time, 'role': _message_role(response.content),
+                        'content': response.content,
+                    })
+                buffered_rows += 1 + len(record.tool_metrics or {}) + len(chat_responses)
+                chats += 1
+                responses += len(chat_responses)
+
+            # Only checkpoint between pages, so that the cursor never points into a partially written page
+            if buffered_rows >= CHAT_EXPORT_BUFFER_ROWS or not cursor:
+                self._write(job, buffers)
+                job.cursor = cursor
+                job.exported_chats += chats
+                job.exported_responses += responses
+                job.sequence += 1
+                self._save(job)
+                buffers.clear()
+                buffered_rows = chats = responses = 0
+            if not cursor:
+                return
+
+    def _write(self, job: ChatExportJob, buffers: Dict[Tuple[str, str], List[Dict[str, Any]]]):
+        extension = CHAT_EXPORT_FORMATS[job.format]
+        for (dataset, partition), rows in sorted(buffers.items()):
+            columns = _DATASET_COLUMNS[dataset]
+            schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in columns])
+            table = pyarrow.Table.from_pylist(rows, schema=schema)
+            relative_path = f"{dataset}/{partition}/part-{job.sequence:05d}.{extension}"
+            path = os.path.join(self.export_dir, job.id, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if job.format == 'parquet':
+                pyarrow.parquet.write_table(table, path, compression='zstd')
+            else:
+                pyarrow.feather.write_feather(table, path, compression='zstd')
+            if self.s3:
+                self.s3.upload_file(path, CHAT_EXPORT_S3_BUCKET, f"{CHAT_EXPORT_S3_PREFIX}/{job.id}/{relative_path}")
+            if relative_path not in job.files:
+                job.files.append(relative_path)
+
+    def _remove_uncommitted_files(self, job: ChatExportJob):
+        # Files written after the last checkpoint are written again on resume, drop them to avoid duplicate rows
+        job_dir = os.path.join(self.export_dir, job.id)
+        for path in glob.glob(os.path.join(job_dir, '*', '*', '*', 'part-*')):
+            sequence = int(re.match(r'part-(\d+)', os.path.basename(path)).group(1))
+            if sequence >= job.sequence:
+                os.remove(path)
+
+
+_service: Optional[ChatExportService] = None
+_service_lock = threading.Lock()
+
+
+def get_chat_export_service() -> ChatExportService:
+    """
+    Get the process-wide chat export service, creating it on first use.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChatExportService(ChatRecordService())
+        return _service
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Set
+
+import boto3
+from botocore.exceptions import ClientError
+
+from ..upload.service import UPLOAD_BUCKET, UPLOAD_DIR, UPLOAD_KEY_PREFIX
+from ..utils.aws_config import get_aws_region
+
+try:
+    import zstandard
+except ImportError:  # A dependency, environments without it fall back to zlib
+    zstandard = None
+
+# Where chat payloads too large for DynamoDB items are kept. Blobs are always written to the local
+# directory, which doubles as a read cache, and to S3 unless the bucket is set to an empty string.
+CHAT_PAYLOAD_DIR = os.environ.get('CHAT_PAYLOAD_DIR', os.path.join(UPLOAD_DIR, 'payloads'))
+CHAT_PAYLOAD_S3_BUCKET = os.environ.get('CHAT_PAYLOAD_S3_BUCKET', UPLOAD_BUCKET)
+CHAT_PAYLOAD_S3_PREFIX = os.environ.get('CHAT_PAYLOAD_S3_PREFIX', f"{UPLOAD_KEY_PREFIX}/payloads")
+# Size of the local read cache when payloads are kept in S3, least recently used blobs are evicted beyond it
+CHAT_PAYLOAD_CACHE_MAX_BYTES = int(os.environ.get('CHAT_PAYLOAD_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def compress(data: bytes) -> bytes:
+    """
+    Compress a payload with zstd if the zstandard package is installed, otherwise with zlib.
+    """
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(blob: bytes) -> bytes:
+    """
+    Decompress a payload written by compress, detecting the codec from the frame header.
+
+    :raises RuntimeError: If the payload is zstd compressed and the zstandard package is not installed.
+    """
+    if blob[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd compressed but the zstandard package is not installed")
+        # Frames written by ZstdCompressor.compress carry their content size
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+class PayloadStore:
+    """
+    Content-addressed storage of compressed chat payloads.
+
+    A payload is stored once under the SHA-256 digest of its uncompressed bytes, so DynamoDB items only need
+    to keep the digest. Storing the same payload again only refreshes its modification time, which keeps it
+    from being swept while the item referencing it is written.
+
+    With an S3 bucket, the local directory is a read cache bounded to ``cache_max_bytes`` and evicted least
+    recently used first, like the extraction cache. Without one it is the store itself and is never evicted.
+    """
+
+    def __init__(self, local_dir: str = CHAT_PAYLOAD_DIR, s3_bucket: str = CHAT_PAYLOAD_S3_BUCKET,
+                 s3_prefix: str = CHAT_PAYLOAD_S3_PREFIX, cache_max_bytes: int = CHAT_PAYLOAD_CACHE_MAX_BYTES):
+        self.local_dir = local_dir
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.s3 = boto3.client('s3', region_name=get_aws_region()) if s3_bucket else None
+        self.cache_max_bytes = cache_max_bytes
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        os.makedirs(self.local_dir, exist_ok=True)
+        if self.s3:
+            self._load_index()
+
+    def put(self, data: bytes) -> str:
+        """
+        Store a payload.
+
+        :param data: The uncompressed payload.
+        :return: The SHA-256 hex digest referencing the payload.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._path(sha256)
+        if not self.s3:
+            try:
+                os.utime(path)
+                return sha256
+            except FileNotFoundError:
+                self._write_local(sha256, compress(data))
+                return sha256
+
+        stored = self._touch_s3(sha256)
+        if stored and os.path.exists(path):
+            return sha256
+        blob = compress(data)
+        if not stored:
+            self.s3.put_object(Bucket=self.s3_bucket, Key=self._s3_key(sha256), Body=blob)
+        self._write_local(sha256, blob)
+        return sha256
+
+    def get(self, sha256: str) -> Optional[bytes]:
+        """
+        Load a payload by its digest.
+
+        :param sha256: The SHA-256 hex digest returned by put.
+        :return: The uncompressed payload, or None if it is not stored.
+        """
+        path = self._path(sha256)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            if self.s3:
+                os.utime(path)
+                with self.lock:
+                    if sha256 in self.entries:
+                        self.entries.move_to_end(sha256)
+        except FileNotFoundError:
+            if not self.s3:
+                return None
+            try:
+                blob = self.s3.get_object(Bucket=self.s3_bucket, Key=self._s3_key(sha256))['Body'].read()
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                    return None
+                raise
+            self._write_local(sha256, blob)
+        return decompress(blob)
+
+    def get_text(self, sha256: str) -> Optional[str]:
+        data = self.get(sha256)
+        return data.decode('utf-8') if data is not None else None
+
+    def sweep(self, referenced: Set[str], cutoff: float) -> int:
+        """
+        Delete the payloads that are no longer referenced.
+
+        :param referenced: The digests of all referenced payloads, collected after ``cutoff``.
+        :param cutoff: Epoch seconds, payloads stored or reused since are kept even if unreferenced, as the item
+            referencing them may not have been written yet.
+        :return: The number of payloads deleted.
+        """
+        deleted = 0
+        if self.s3:
+            paginator = self.s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=f"{self.s3_prefix}/"):
+                for obj in page.get('Contents', []):
+                    sha256 = obj['Key'].rsplit('/', 1)[-1]
+                    if sha256 in referenced or obj['LastModified'].timestamp() >= cutoff:
+                        continue
+                    self.s3.delete_object(Bucket=self.s3_bucket, Key=obj['Key'])
+                    self._remove_local(sha256)
+                    deleted += 1
+            return deleted
+
+        for directory, _, names in os.walk(self.local_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name in referenced or name.endswith('.part'):
+                    continue
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.local_dir, sha256[:2], sha256)
+
+    def _s3_key(self, sha256: str) -> str:
+        return f"{self.s3_prefix}/{sha256[:2]}/{sha256}"
+
+    def _touch_s3(self, sha256: str) -> bool:
+        # Copying the object onto itself refreshes its LastModified, which the sweep goes by
+        key = self._s3_key(sha256)
+        try:
+            self.s3.copy_object(Bucket=self.s3_bucket, Key=key, CopySource={'Bucket': self.s3_bucket, 'Key': key},
+                                MetadataDirective='REPLACE')
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return False
+            raise
+
+    def _load_index(self):
+        files = []
+        for directory, _, names in os.walk(self.local_dir):
+            for name in names:
+                if not name.endswith('.part'):
+                    stat = os.stat(os.path.join(directory, name))
+                    files.append((stat.st_mtime, name, stat.st_size))
+        for _, sha256, size in sorted(files):
+            self.entries[sha256] = size
+            self.total_bytes += size
+
+    def _write_local(self, sha256: str, blob: bytes):
+        if self.s3 and len(blob) > self.cache_max_bytes:
+            return
+        path = self._path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        if not self.s3:
+            return
+
+        with self.lock:
+            self.total_bytes += len(blob) - self.entries.pop(sha256, 0)
+            self.entries[sha256] = len(blob)
+            while self.total_bytes > self.cache_max_bytes and self.entries:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def _remove_local(self, sha256: str):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(sha256, 0)
+        try:
+            os.remove(self._path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+_store: Optional[PayloadStore] = None
+_store_lock = threading.Lock()
+
+
+def get_payload_store() -> PayloadStore:
+    """
+    Get the process-wide payload store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PayloadStore()
+        return _store
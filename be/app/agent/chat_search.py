@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..upload.service import UPLOAD_DIR
+
+# Local SQLite database holding the full-text index of chat history
+CHAT_SEARCH_DB = os.environ.get('CHAT_SEARCH_DB', os.path.join(UPLOAD_DIR, 'chat_search.db'))
+CHAT_SEARCH_ENABLED = os.environ.get('CHAT_SEARCH_ENABLED', 'true').lower() == 'true'
+# Seconds between two syncs of the index with the chats written by other tasks, 0 disables them
+CHAT_SEARCH_SYNC_SECONDS = float(os.environ.get('CHAT_SEARCH_SYNC_SECONDS', 60))
+# Chats created within this many minutes are synced until they finish, longer chats keep the text synced last
+CHAT_SEARCH_SYNC_WINDOW_MINUTES = int(os.environ.get('CHAT_SEARCH_SYNC_WINDOW_MINUTES', 60))
+# bm25 weights of the user message and assistant text columns, matches in the question rank higher
+CHAT_SEARCH_WEIGHTS = (2.0, 1.0)
+CHAT_SEARCH_SNIPPET_TOKENS = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_docs (
+    rowid INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL UNIQUE,
+    agent_id TEXT,
+    create_time TEXT,
+    expire_at INTEGER,
+    user_message TEXT NOT NULL DEFAULT '',
+    assistant_text TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS chat_docs_expire_at ON chat_docs (expire_at) WHERE expire_at IS NOT NULL;
+CREATE VIRTUAL TABLE IF NOT EXISTS chat_fts USING fts5(
+    user_message, assistant_text, content='chat_docs', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chat_docs_ai AFTER INSERT ON chat_docs BEGIN
+    INSERT INTO chat_fts (rowid, user_message, assistant_text) VALUES (new.rowid, new.user_message, new.assistant_text);
+END;
+CREATE TRIGGER IF NOT EXISTS chat_docs_ad AFTER DELETE ON chat_docs BEGIN
+    INSERT INTO chat_fts (chat_fts, rowid, user_message, assistant_text)
+    VALUES ('delete', old.rowid, old.user_message, old.assistant_text);
+END;
+CREATE TRIGGER IF NOT EXISTS chat_docs_au AFTER UPDATE OF user_message, assistant_text ON chat_docs BEGIN
+    INSERT INTO chat_fts (chat_fts, rowid, user_message, assistant_text)
+    VALUES ('delete', old.rowid, old.user_message, old.assistant_text);
+    INSERT INTO chat_fts (rowid, user_message, assistant_text) VALUES (new.rowid, new.user_message, new.assistant_text);
+END;
+CREATE TABLE IF NOT EXISTS chat_synced (chat_id TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS search_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class ChatSearchHit(BaseModel):
+    chat_id: str
+    agent_id: Optional[str] = None
+    create_time: Optional[str] = None
+    # bm25 relevance, higher is better
+    score: float
+    user_message: str
+    assistant_text: str
+
+
+def assistant_text(content: str) -> Optional[str]:
+    """
+    Extract the text of an assistant message from the content of a chat response.
+
+    :param content: The content of a ChatResponse, a serialized agent event.
+    :return: The text blocks of the message joined, or None if the response is not an assistant message with text.
+    """
+    try:
+        message = json.loads(content).get('message')
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(message, dict) or message.get('role') != 'assistant':
+        return None
+    blocks = message.get('content')
+    if isinstance(blocks, str):
+        return blocks or None
+    texts = [block['text'] for block in blocks or [] if isinstance(block, dict) and block.get('text')]
+    return "\n".join(texts) or None
+
+
+def match_expression(query: str) -> str:
+    """
+    Turn a free-text query into an FTS5 match expression that cannot be a syntax error.
+
+    Every word must match; a trailing ``*`` keeps prefix matching, e.g. ``deploy*``.
+    """
+    terms = re.findall(r'\w+\*?', query)
+    return " ".join(f'"{term.rstrip("*")}"' + ('*' if term.endswith('*') else '') for term in terms)
+
+
+class ChatSearchIndex:
+    """
+    An incrementally maintained full-text index of chat history, stored in a local SQLite FTS5 database.
+
+    Each chat is one document of its user message and the text of its latest assistant message, updated as
+    the chat is persisted. Every task keeps its own index, which also syncs periodically with the chats other
+    tasks wrote to the chat tables, see ChatRecordService.sync_search_index. Searching it never reads the chat
+    tables.
+    """
+
+    def __init__(self, path: str = CHAT_SEARCH_DB):
+        self.path = path
+        self.local = threading.local()
+        self.syncer: Optional[threading.Thread] = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self.connection()
+        connection.executescript(_SCHEMA)
+        self.purge_expired()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def index_message(self, chat_id: str, agent_id: Optional[str], create_time: Optional[str], user_message: str,
+                      expire_at: Optional[int] = None):
+        """
+        Add or replace the user message of a chat.
+        """
+        self.connection().execute(
+            "INSERT INTO chat_docs (chat_id, agent_id, create_time, expire_at, user_message) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET agent_id = excluded.agent_id, create_time = excluded.create_time, "
+            "expire_at = excluded.expire_at, user_message = excluded.user_message",
+            (chat_id, agent_id, create_time, expire_at, user_message))
+
+    def index_assistant_text(self, chat_id: str, text: str):
+        """
+        Set the assistant text of a chat, i.e. the text of its latest assistant message.
+        """
+        self.connection().execute(
+            "INSERT INTO chat_docs (chat_id, assistant_text) VALUES (?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET assistant_text = excluded.assistant_text",
+            (chat_id, text))
+
+    def delete(self, chat_id: str):
+        self.connection().execute("DELETE FROM chat_docs WHERE chat_id = ?", (chat_id,))
+        self.connection().execute("DELETE FROM chat_synced WHERE chat_id = ?", (chat_id,))
+
+    def synced_until(self) -> Optional[str]:
+        """
+        Get the time of the last sync with the chat tables, None before the first one.
+        """
+        row = self.connection().execute("SELECT value FROM search_meta WHERE key = 'synced_until'").fetchone()
+        return row[0] if row else None
+
+    def set_synced_until(self, value: str):
+        self.connection().execute(
+            "INSERT INTO search_meta (key, value) VALUES ('synced_until', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (value,))
+
+    def finished_chats(self, chat_ids: List[str]) -> set:
+        """
+        Get which of the chats were synced after they finished, so they need no further syncs.
+        """
+        if not chat_ids:
+            return set()
+        rows = self.connection().execute(
+            f"SELECT chat_id FROM chat_synced WHERE chat_id IN ({', '.join('?' * len(chat_ids))})", chat_ids)
+        return {row[0] for row in rows}
+
+    def mark_finished(self, chat_id: str):
+        self.connection().execute("INSERT OR IGNORE INTO chat_synced (chat_id) VALUES (?)", (chat_id,))
+
+    def start_sync(self, sync: Callable[[], int], interval_seconds: float = CHAT_SEARCH_SYNC_SECONDS):
+        """
+        Call sync now and then every interval_seconds in a background thread, once per process.
+        """
+        if interval_seconds <= 0 or self.syncer:
+            return
+
+        def sync_periodically():
+            while True:
+                try:
+                    sync()
+                    self.purge_expired()
+                except Exception as e:
+                    print(f"Error syncing chat search index: {str(e)}")
+                time.sleep(interval_seconds)
+
+        self.syncer = threading.Thread(target=sync_periodically, name="chat-search-sync", daemon=True)
+        self.syncer.start()
+
+    def purge_expired(self) -> int:
+        """
+        Remove chats past their expiry, which DynamoDB TTL deletes without notice.
+
+        :return: The number of chats removed.
+        """
+        cursor = self.connection().execute("DELETE FROM chat_docs WHERE expire_at < ?", (int(time.time()),))
+        self.connection().execute("DELETE FROM chat_synced WHERE chat_id NOT IN (SELECT chat_id FROM chat_docs)")
+        if cursor.rowcount:
+            print(f"Purged {cursor.rowcount} expired chats from the search index")
+        return cursor.rowcount
+
+    def search(self, query: str, limit: int = 20, offset: int = 0,
+               agent_id: Optional[str] = None) -> Tuple[List[ChatSearchHit], Optional[int]]:
+        """
+        Search chats, best matches first.
+
+        :param query: The words to search for, all of which must match.
+        :param limit: The maximum number of hits to return.
+        :param offset: The number of hits to skip, i.e. the cursor returned with the previous page.
+        :param agent_id: Only search the chats of this agent.
+        :return: The hits and the offset of the next page, None if this is the last page.
+        """
+        expression = match_expression(query)
+        if not expression:
+            return [], None
+        sql = (
+            "SELECT d.chat_id, d.agent_id, d.create_time, bm25(chat_fts, ?, ?) AS rank, "
+            f"snippet(chat_fts, 0, '[', ']', '...', {CHAT_SEARCH_SNIPPET_TOKENS}), "
+            f"snippet(chat_fts, 1, '[', ']', '...', {CHAT_SEARCH_SNIPPET_TOKENS}) "
+            "FROM chat_fts JOIN chat_docs d ON d.rowid = chat_fts.rowid "
+            "WHERE chat_fts MATCH ? AND (d.expire_at IS NULL OR d.expire_at >= ?)"
+        )
+        params = [*CHAT_SEARCH_WEIGHTS, expression, int(time.time())]
+        if agent_id:
+            sql += " AND d.agent_id = ?"
+            params.append(agent_id)
+        # Fetch one extra row to know whether there is a next page
+        sql += " ORDER BY rank, d.create_time DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, offset])
+        rows = self.connection().execute(sql, params).fetchall()
+
+        hits = [ChatSearchHit(chat_id=row[0], agent_id=row[1], create_time=row[2], score=round(-row[3], 4),
+                              user_message=row[4], assistant_text=row[5]) for row in rows[:limit]]
+        return hits, offset + limit if len(rows) > limit else None
+
+
+_index: Optional[ChatSearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_chat_search_index() -> Optional[ChatSearchIndex]:
+    """
+    Get the process-wide chat search index, creating it on first use.
+
+    :return: The index, or None if CHAT_SEARCH_ENABLED is false.
+    """
+    global _index
+    if not CHAT_SEARCH_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = ChatSearchIndex(CHAT_SEARCH_DB)
+        return _index
@@ -0,0 +1,337 @@
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+from strands import Agent
+from strands.agent.conversation_manager import (ConversationManager, NullConversationManager,
+                                                SlidingWindowConversationManager)
+from strands.experimental.hooks import BeforeModelInvocationEvent
+from strands.hooks import AfterInvocationEvent, HookProvider, HookRegistry
+
+# Summaries computed at the same time, across all agents of the process
+CONTEXT_SUMMARY_WORKERS = int(os.environ.get('CONTEXT_SUMMARY_WORKERS', 4))
+# Length of the transcript a summary is made from, older content beyond it is left out
+SUMMARY_TRANSCRIPT_MAX_CHARS = 100000
+SUMMARY_BLOCK_MAX_CHARS = 2000
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+SUMMARY_SYSTEM_PROMPT = (
+    "You summarize conversations between a user and an AI assistant that uses tools. Write a concise summary that "
+    "keeps the user's goals, decisions, facts and figures found so far, tool results that are still relevant and "
+    "open questions, so that the assistant can continue the task from the summary alone. If the conversation "
+    "starts with an earlier summary, fold it into the new one. Reply with the summary only."
+)
+TRUNCATED_SUFFIX = "characters truncated]"
+# Stands in for the prompt of a tool-call run when the prompt itself is no longer in the conversation
+TRIMMED_PROMPT = "[Earlier messages were removed to fit the context window, continue the task from here.]"
+
+_summary_executor = ThreadPoolExecutor(max_workers=CONTEXT_SUMMARY_WORKERS, thread_name_prefix="context-summary")
+
+
+class ContextConfig(BaseModel):
+    """
+    Context-window settings of an agent, the "context" entry of its extras, e.g.
+    {"strategy": "summarizing", "window_size": 80, "tool_result_max_chars": 4000}.
+    """
+    model_config = ConfigDict(extra='forbid')
+
+    # Name of a registered strategy: "sliding_window", "summarizing" or "none"
+    strategy: str = "sliding_window"
+    # Most messages kept, the oldest ones are dropped beyond it
+    window_size: int = Field(40, ge=2)
+    # Tool results older than the most recent ones are cut to this many characters, 0 to keep them whole
+    tool_result_max_chars: int = Field(0, ge=0)
+    keep_recent_tool_results: int = Field(2, ge=0)
+    # Summarizing: summarize older messages in the background beyond this many messages...
+    summarize_after_messages: int = Field(30, ge=2)
+    # ...or once a model call takes more input tokens than this, 0 to only count messages
+    summarize_after_tokens: int = Field(0, ge=0)
+    # Summarizing: most recent messages never summarized
+    preserve_recent_messages: int = Field(10, ge=1)
+
+    @field_validator('strategy')
+    @classmethod
+    def known_strategy(cls, strategy: str) -> str:
+        if strategy not in CONTEXT_STRATEGIES:
+            raise ValueError(f"Unknown context strategy {strategy}, use one of {', '.join(CONTEXT_STRATEGIES)}")
+        return strategy
+
+
+def context_config(extras: Optional[Dict[str, Any]]) -> Optional[ContextConfig]:
+    """
+    Read the context-window settings from an agent's extras.
+
+    :raises ValueError: If the settings are invalid.
+    :return: The settings, None if the agent has none.
+    """
+    if not extras or extras.get('context') is None:
+        return None
+    try:
+        return ContextConfig.model_validate(extras['context'])
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(str(loc) for loc in error['loc']) or 'context'}: {error['msg']}"
+                                   for error in e.errors()))
+
+
+def render_transcript(messages: List[Dict[str, Any]]) -> str:
+    """
+    Render messages as plain text for the summarizer, which is not given the agent's tools.
+    """
+    def clip(text: str) -> str:
+        return text if len(text) <= SUMMARY_BLOCK_MAX_CHARS else text[:SUMMARY_BLOCK_MAX_CHARS] + " [...]"
+
+    lines = []
+    for message in messages:
+        role = "User" if message['role'] == 'user' else "Assistant"
+        for block in message.get('content', []):
+            if 'text' in block:
+                lines.append(f"{role}: {clip(block['text'])}")
+            elif 'toolUse' in block:
+                tool_input = json.dumps(block['toolUse'].get('input'), ensure_ascii=False, default=str)
+                lines.append(f"Assistant called tool {block['toolUse'].get('name')}: {clip(tool_input)}")
+            elif 'toolResult' in block:
+                texts = [item['text'] if 'text' in item else json.dumps(item.get('json'), ensure_ascii=False, default=str)
+                         for item in block['toolResult'].get('content', []) if 'text' in item or 'json' in item]
+                lines.append(f"Tool result ({block['toolResult'].get('status')}): {clip(' '.join(texts))}")
+    transcript = "\n".join(lines)
+    # Keep the end of the transcript, the start is already in the previous summary if there is one
+    return transcript[-SUMMARY_TRANSCRIPT_MAX_CHARS:]
+
+
+def summarize_transcript(model_factory: Callable[[], Any], transcript: str) -> str:
+    """
+    Summarize a conversation transcript with a model of the agent.
+    """
+    summarizer = Agent(model=model_factory(), system_prompt=SUMMARY_SYSTEM_PROMPT, tools=[], callback_handler=None,
+                       conversation_manager=NullConversationManager())
+    return str(summarizer(f"Summarize this conversation:\n\n{transcript}")).strip()
+
+
+class ContextWindowManager(SlidingWindowConversationManager, HookProvider):
+    """
+    Keeps an agent's conversation within its context window before every model call, not only after each
+    invocation, so that long runs with many tool calls do not grow the input of every cycle.
+
+    Before each model call, tool results older than the most recent ones are truncated and the oldest messages
+    are dropped beyond the window. With summarization, the messages before the most recent ones are summarized
+    in the background once the conversation grows beyond a threshold, while the agent carries on; the summary
+    replaces them at the first model call after it is ready. Each summary folds in the previous one.
+    """
+
+    def __init__(self, config: ContextConfig, model_factory: Optional[Callable[[], Any]] = None,
+                 summarize: bool = False):
+        super().__init__(window_size=config.window_size, should_truncate_results=True)
+        self.config = config
+        self.model_factory = model_factory
+        self.summarize = summarize and model_factory is not None
+        # Summary in progress and the last message it covers
+        self.pending: Optional[Tuple[Future, Dict[str, Any]]] = None
+        self.retry_after_messages = 0
+        self.seen_input_tokens = 0
+        self.last_input_tokens = 0
+        self.summaries = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any):
+        registry.add_callback(BeforeModelInvocationEvent, self._before_model_invocation)
+
+    def _before_model_invocation(self, event: BeforeModelInvocationEvent):
+        # Input tokens of the previous model call, the metrics are reset at the start of an invocation
+        input_tokens = event.agent.event_loop_metrics.accumulated_usage.get('inputTokens', 0)
+        delta = input_tokens - self.seen_input_tokens if input_tokens >= self.seen_input_tokens else input_tokens
+        if delta:
+            self.last_input_tokens = delta
+        self.seen_input_tokens = input_tokens
+        self.apply_management(event.agent)
+
+    def apply_management(self, agent: Agent, **kwargs: Any):
+        messages = agent.messages
+        if self.summarize:
+            self._apply_summary(messages)
+        if self.config.tool_result_max_chars:
+            self._truncate_old_tool_results(messages)
+        if self.summarize:
+            self._start_summary(messages)
+        if len(messages) > self.window_size:
+            self._trim(messages, len(messages) - self.window_size)
+
+    def reduce_context(self, agent: Agent, e: Optional[Exception] = None, **kwargs: Any):
+        # The context overflowed: use a summary if one is ready, otherwise fall back to truncating and trimming
+        if self.summarize and self._apply_summary(agent.messages):
+            return
+        super().reduce_context(agent, e, **kwargs)
+
+    def _trim(self, messages: List[Dict[str, Any]], start: int):
+        index = self._first_valid_index(messages, start)
+        if not index:
+            return
+        if messages[index]['role'] == 'user':
+            self.removed_message_count += index
+            messages[:] = messages[index:]
+            return
+        # In the middle of a long run of tool calls: keep the prompt the run works on, which also keeps the
+        # conversation starting with a user message, and make room for it in the window
+        index = self._first_valid_index(messages, start + 1) or index
+        prompt_index = next((i for i in range(index - 1, -1, -1) if self._is_prompt(messages[i])), None)
+        if prompt_index == 0 and index == 1:
+            return
+        if prompt_index is None:
+            prompt = {'role': 'user', 'content': [{'text': TRIMMED_PROMPT}]}
+        else:
+            prompt = messages[prompt_index]
+        self.removed_message_count += index - (prompt_index is not None)
+        messages[:] = [prompt, *messages[index:]]
+
+    @staticmethod
+    def _is_prompt(message: Dict[str, Any]) -> bool:
+        return message['role'] == 'user' and not any('toolResult' in block for block in message['content'])
+
+    @classmethod
+    def _first_valid_index(cls, messages: List[Dict[str, Any]], start: int) -> Optional[int]:
+        # Prefer starting at a user message that is not a tool result, which every model provider accepts
+        for index in range(max(start, 0), len(messages)):
+            if cls._is_prompt(messages[index]):
+                return index
+        # Within a long run of tool calls, the conversation cannot start with a tool result, or with a tool use
+        # not followed by its result
+        for index in range(max(start, 0), len(messages)):
+            content = messages[index]['content']
+            if any('toolResult' in block for block in content):
+                continue
+            if any('toolUse' in block for block in content) and not (
+                    index + 1 < len(messages) and any('toolResult' in block for block in messages[index + 1]['content'])):
+                continue
+            return index
+        return None
+
+    def _truncate_old_tool_results(self, messages: List[Dict[str, Any]]):
+        limit = self.config.tool_result_max_chars
+        with_results = [message for message in messages
+                        if any('toolResult' in block for block in message.get('content', []))]
+        old = with_results[:-self.config.keep_recent_tool_results] if self.config.keep_recent_tool_results \
+            else with_results
+        for message in old:
+            for block in message['content']:
+                if 'toolResult' not in block:
+                    continue
+                items = []
+                for item in block['toolResult'].get('content', []):
+                    if 'json' in item:
+                        item = {'text': json.dumps(item['json'], ensure_ascii=False, default=str)}
+                    elif 'text' not in item:
+                        item = {'text': f"[{', '.join(item)} removed]"}
+                    text = item['text']
+                    if len(text) > limit and not text.endswith(TRUNCATED_SUFFIX):
+                        item = {'text': f"{text[:limit]}\n[{len(text) - limit} {TRUNCATED_SUFFIX}"}
+                    items.append(item)
+                block['toolResult']['content'] = items
+
+    def _start_summary(self, messages: List[Dict[str, Any]]):
+        if self.pending is not None or len(messages) < self.retry_after_messages:
+            return
+        over_tokens = self.config.summarize_after_tokens and self.last_input_tokens > self.config.summarize_after_tokens
+        if len(messages) <= self.config.summarize_after_messages and not over_tokens:
+            return
+        end = self._first_valid_index(messages, len(messages) - self.config.preserve_recent_messages)
+        if not end or end < 2:
+            return
+        transcript = render_transcript(messages[:end])
+        self.pending = (_summary_executor.submit(summarize_transcript, self.model_factory, transcript),
+                        messages[end - 1])
+
+    def _apply_summary(self, messages: List[Dict[str, Any]]) -> bool:
+        # Only a finished summary is used, the agent does not wait for one
+        if self.pending is None or not self.pending[0].done():
+            return False
+        future, last = self.pending
+        self.pending = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"Error summarizing conversation: {str(e)}")
+            # Try again once the conversation has grown further
+            self.retry_after_messages = len(messages) + self.config.preserve_recent_messages
+            return False
+        # The summary covers everything up to its last message, which may already have been trimmed
+        end = next((index + 1 for index, message in enumerate(messages) if message is last), 0)
+        rest = messages[end:]
+        block = {'text': f"{SUMMARY_HEADER}\n{summary}"}
+        if rest and rest[0]['role'] == 'user':
+            rest[0] = {**rest[0], 'content': [block, *rest[0]['content']]}
+        else:
+            rest.insert(0, {'role': 'user', 'content': [block]})
+        self.removed_message_count += end
+        messages[:] = rest
+        self.summaries += 1
+        return True
+
+
+class CycleUsageTracker(HookProvider):
+    """
+    Records the token usage of every event loop cycle of an agent in the metadata of the cycle's trace, as
+    {"input_tokens", "output_tokens", "messages"}, where messages is the length of the conversation sent.
+    """
+
+    def __init__(self):
+        self.trace = None
+        self.start_usage: Dict[str, int] = {}
+        self.messages = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any):
+        registry.add_callback(BeforeModelInvocationEvent, self._before_model_invocation)
+        registry.add_callback(AfterInvocationEvent, self._after_invocation)
+
+    def _before_model_invocation(self, event: BeforeModelInvocationEvent):
+        metrics = event.agent.event_loop_metrics
+        trace = metrics.traces[-1] if metrics.traces else None
+        if trace is self.trace:
+            # The model call of this cycle is retried, e.g. after throttling
+            return
+        self._close(metrics)
+        self.trace = trace
+        self.start_usage = dict(metrics.accumulated_usage)
+        self.messages = len(event.agent.messages)
+
+    def _after_invocation(self, event: AfterInvocationEvent):
+        self._close(event.agent.event_loop_metrics)
+        self.trace = None
+
+    def _close(self, metrics):
+        # Usage is added to the metrics after the model call, so a cycle is closed when the next one starts
+        if self.trace is None:
+            return
+        usage = metrics.accumulated_usage
+        self.trace.metadata['usage'] = {
+            'input_tokens': int(usage.get('inputTokens', 0) - self.start_usage.get('inputTokens', 0)),
+            'output_tokens': int(usage.get('outputTokens', 0) - self.start_usage.get('outputTokens', 0)),
+            'messages': self.messages,
+        }
+
+
+# Context strategies by name, each building a conversation manager from an agent's settings and model factory
+CONTEXT_STRATEGIES: Dict[str, Callable[[ContextConfig, Callable[[], Any]], ConversationManager]] = {
+    'none': lambda config, model_factory: NullConversationManager(),
+    'sliding_window': lambda config, model_factory: ContextWindowManager(config),
+    'summarizing': lambda config, model_factory: ContextWindowManager(config, model_factory, summarize=True),
+}
+
+
+def register_context_strategy(name: str, factory: Callable[[ContextConfig, Callable[[], Any]], ConversationManager]):
+    """
+    Register a context strategy, which agents then select by name in their "context" extras.
+    """
+    CONTEXT_STRATEGIES[name] = factory
+
+
+def build_conversation_manager(config: Optional[ContextConfig],
+                               model_factory: Callable[[], Any]) -> Optional[ConversationManager]:
+    """
+    Build the conversation manager of an agent.
+
+    :param config: The agent's context settings.
+    :param model_factory: Creates a model like the agent's, for summaries.
+    :return: The conversation manager, None to use the Strands default.
+    """
+    if config is None:
+        return None
+    return CONTEXT_STRATEGIES[config.strategy](config, model_factory)
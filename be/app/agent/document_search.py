@@ -0,0 +1,87 @@
+import os
+from typing import List
+
+from strands import tool
+
+from ..upload import UploadService, UploadedFile, extract_file
+from ..utils.doc_index import DocumentIndex
+
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 20
+
+
+def load_document_index(upload_service: UploadService, uploaded: UploadedFile) -> DocumentIndex:
+    """
+    Load the retrieval index of an uploaded file, building it if the background pipeline has not yet.
+
+    :param upload_service: The upload service that knows where indexes are stored.
+    :param uploaded: The uploaded file.
+    :raises ValueError: If the file format cannot be extracted.
+    """
+    index_path = upload_service.index_path(uploaded)
+    if os.path.exists(index_path):
+        return DocumentIndex.load(index_path)
+
+    result = extract_file(uploaded.file_path, uploaded.sha256)
+    if result is None:
+        raise ValueError(f"Unsupported document format: {uploaded.filename}")
+    index = DocumentIndex.from_text(result['content'])
+    index.save(index_path)
+    return index
+
+
+def attachment_prompt(documents: List[UploadedFile]) -> str:
+    """
+    Describe attached documents to the agent, in place of their full text.
+    """
+    lines = ["Attached documents (use the search_uploaded_document tool to retrieve relevant passages):"]
+    for uploaded in documents:
+        details = [f"document_id={uploaded.sha256}"]
+        metadata = uploaded.extraction_metadata or {}
+        for key in ('type', 'pages', 'rows', 'chars'):
+            if metadata.get(key) is not None:
+                details.append(f"{key}={metadata[key]}")
+        lines.append(f"- {uploaded.filename} ({', '.join(details)})")
+    return '\n'.join(lines)
+
+
+def document_search_tool(documents: List[UploadedFile], upload_service: UploadService):
+    """
+    Build a retrieval tool restricted to the documents attached to a chat.
+
+    :param documents: The uploaded files the agent may search.
+    :param upload_service: The upload service that knows where indexes are stored.
+    :return: A Strands tool.
+    """
+    by_id = {uploaded.sha256: uploaded for uploaded in documents}
+
+    @tool(name="search_uploaded_document",
+          description="Search the documents attached to this conversation and return the passages most relevant "
+                      "to a query. Use it instead of asking for the full document text.")
+    def search_uploaded_document(query: str, document_id: str = "", top_k: int = DEFAULT_TOP_K) -> str:
+        """
+        :param query: What to look for, in natural language or keywords.
+        :param document_id: The document to search; all attached documents if empty.
+        :param top_k: The number of passages to return.
+        """
+        if document_id and document_id not in by_id:
+            return f"Unknown document_id {document_id}. Attached documents: {', '.join(by_id)}"
+        targets = [by_id[document_id]] if document_id else list(by_id.values())
+        top_k = max(1, min(int(top_k), MAX_TOP_K))
+
+        hits = []
+        for uploaded in targets:
+            try:
+                index = load_document_index(upload_service, uploaded)
+            except Exception as e:
+                hits.append((0.0, f"[{uploaded.filename}] could not be searched: {str(e)}"))
+                continue
+            for hit in index.search(query, top_k):
+                hits.append((hit['score'], f"[{uploaded.filename} #{hit['chunk_id']} score={hit['score']}]\n{hit['text']}"))
+
+        if not hits:
+            return "No relevant passages found."
+        hits.sort(key=lambda h: h[0], reverse=True)
+        return '\n\n'.join(text for _, text in hits[:top_k])
+
+    return search_uploaded_document
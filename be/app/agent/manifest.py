@@ -0,0 +1,199 @@
+import hashlib
+import importlib
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+# Fetch the tool specs of an agent's MCP servers when it is saved
+AGENT_MANIFEST_RESOLVE_MCP = os.environ.get('AGENT_MANIFEST_RESOLVE_MCP', 'true').lower() == 'true'
+AGENT_MANIFEST_MCP_TIMEOUT = int(os.environ.get('AGENT_MANIFEST_MCP_TIMEOUT', 10))
+MANIFEST_VERSION = 1
+
+# Bedrock client settings used unless build_strands_agent is given others
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 900
+
+
+class ManifestError(ValueError):
+    """
+    Raised when an agent's configuration cannot be compiled into a manifest, e.g. a tool that does not import.
+    """
+
+
+class ToolImport(BaseModel):
+    # Tool name as configured, e.g. "calculator" or "browser.AgentCoreBrowser.browser"
+    name: str
+    module: str
+    # Set for tools that are a method of a class instance
+    class_name: Optional[str] = None
+    method: Optional[str] = None
+
+
+class McpServerSpec(BaseModel):
+    name: str
+    url: str
+    # Specs of the tools the server offered when the agent was saved, {"name", "description"} each
+    tools: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+
+
+class SubAgentRef(BaseModel):
+    agent_id: str
+    name: str
+
+
+class ModelProfile(BaseModel):
+    provider: str
+    model_id: str
+    base_url: Optional[str] = None
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    connect_timeout: int = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: int = DEFAULT_READ_TIMEOUT
+
+
+class AgentManifest(BaseModel):
+    """
+    The validated, resolved form of an agent's configuration, compiled when the agent is saved.
+
+    Chats build their Strands agent from the manifest instead of re-parsing and re-resolving the configuration.
+    The content hash identifies the manifest, so callers can tell whether an agent's runtime setup changed.
+    """
+    version: int = MANIFEST_VERSION
+    tool_imports: List[ToolImport] = []
+    mcp_servers: List[McpServerSpec] = []
+    sub_agents: List[SubAgentRef] = []
+    model: ModelProfile
+    # Problems that do not prevent the agent from running, e.g. an MCP server that was unreachable
+    warnings: List[str] = []
+    content_hash: str = ""
+
+    def compute_hash(self) -> str:
+        data = self.model_dump(mode='json', exclude={'content_hash'})
+        return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def resolve_tool_import(name: str) -> ToolImport:
+    """
+    Resolve and validate a strands_tools tool name.
+
+    :param name: A module name ("calculator") or a module.class.method path ("browser.AgentCoreBrowser.browser").
+    :raises ManifestError: If the name is malformed or does not import.
+    :return: The resolved import.
+    """
+    segments = name.split(".")
+    if len(segments) == 1:
+        tool_import = ToolImport(name=name, module=f"strands_tools.{name}")
+    elif len(segments) >= 3:
+        tool_import = ToolImport(name=name, module=f"strands_tools.{'.'.join(segments[:-2])}",
+                                 class_name=segments[-2], method=segments[-1])
+    else:
+        raise ManifestError(f"Invalid tool name format: {name}. Expected format: module.class.method or module.")
+    try:
+        module = importlib.import_module(tool_import.module)
+        if tool_import.class_name:
+            getattr(getattr(module, tool_import.class_name), tool_import.method)
+    except (ImportError, AttributeError) as e:
+        raise ManifestError(f"Tool {name} cannot be loaded: {e}")
+    return tool_import
+
+
+def load_tool(tool_import: ToolImport) -> Any:
+    """
+    Load a resolved tool: the module itself, or the method of a new instance of its class.
+    """
+    module = importlib.import_module(tool_import.module)
+    if not tool_import.class_name:
+        return module
+    return getattr(getattr(module, tool_import.class_name)(), tool_import.method)
+
+
+def fetch_mcp_tool_specs(url: str, timeout: int = AGENT_MANIFEST_MCP_TIMEOUT) -> List[Dict[str, Any]]:
+    """
+    Connect to an MCP server and list its tools.
+
+    :return: The name and description of each tool.
+    """
+    from mcp.client.streamable_http import streamablehttp_client
+    from strands.tools.mcp.mcp_client import MCPClient
+
+    with MCPClient(lambda: streamablehttp_client(url), startup_timeout=timeout) as client:
+        return [{'name': t.tool_spec['name'], 'description': t.tool_spec.get('description', '')}
+                for t in client.list_tools_sync()]
+
+
+def compile_manifest(agent, get_agent: Callable[[str], Optional[Any]],
+                     resolve_mcp: bool = AGENT_MANIFEST_RESOLVE_MCP, strict: bool = True) -> AgentManifest:
+    """
+    Compile an agent's configuration into a manifest.
+
+    :param agent: The AgentPO to compile.
+    :param get_agent: Looks up other agents by ID, to resolve agent tools.
+    :param resolve_mcp: Whether to fetch the tool specs of the agent's MCP servers.
+    :param strict: Whether a tool that cannot be resolved is an error. Otherwise it is left out with a warning,
+        as for agents saved before manifests existed, which are compiled when they are used.
+    :raises ManifestError: If strict and a tool cannot be resolved.
+    :return: The manifest with its content hash set.
+    """
+    from .agent import AgentToolType, AgentType, ModelProvider
+    from .context import context_config
+
+    tool_imports, mcp_servers, sub_agents, warnings = [], [], [], []
+
+    def check(condition: bool, error: str) -> bool:
+        if not condition:
+            if strict:
+                raise ManifestError(error)
+            warnings.append(f"{error}, the tool is ignored")
+        return condition
+
+    for t in agent.tools:
+        if t.type == AgentToolType.strands:
+            try:
+                tool_imports.append(resolve_tool_import(t.name))
+            except ManifestError as e:
+                check(False, str(e))
+        elif t.type == AgentToolType.agent:
+            sub_agent = get_agent(t.agent_id) if t.agent_id and t.agent_id != agent.id else None
+            if (check(bool(t.agent_id), f"Agent tool {t.name} has no agent_id")
+                    and check(t.agent_id != agent.id, f"Agent {agent.name} cannot use itself as a tool")
+                    and check(sub_agent is not None, f"Agent tool {t.name} references unknown agent {t.agent_id}")
+                    and check(sub_agent.agent_type == AgentType.plain,
+                              f"Agent tool {t.name} must reference a plain agent")):
+                sub_agents.append(SubAgentRef(agent_id=sub_agent.id, name=sub_agent.name))
+        elif t.type == AgentToolType.mcp:
+            if not check(bool(t.mcp_server_url) and t.mcp_server_url.startswith(('http://', 'https://')),
+                         f"MCP tool {t.name} needs an http(s) mcp_server_url"):
+                continue
+            server = McpServerSpec(name=t.name, url=t.mcp_server_url)
+            if resolve_mcp:
+                try:
+                    server.tools = fetch_mcp_tool_specs(t.mcp_server_url)
+                except Exception as e:
+                    # The server may only be down for now, the chat connects to it again
+                    server.error = str(e) or type(e).__name__
+                    warnings.append(f"MCP server {t.mcp_server_url} could not be reached: {server.error}")
+            mcp_servers.append(server)
+        else:
+            warnings.append(f"Tool {t.name} of type {t.type.name} is not supported and will be ignored")
+
+    extras = agent.extras or {}
+    try:
+        context_config(extras)
+    except ValueError as e:
+        if strict:
+            raise ManifestError(f"Invalid context settings: {e}")
+        warnings.append(f"Invalid context settings, the defaults are used: {e}")
+    model = ModelProfile(
+        provider=agent.model_provider.name,
+        model_id=agent.model_id,
+        base_url=extras.get('base_url') if agent.model_provider == ModelProvider.openai else None
+    )
+    manifest = AgentManifest(tool_imports=tool_imports, mcp_servers=mcp_servers, sub_agents=sub_agents,
+                             model=model, warnings=warnings)
+    manifest.content_hash = manifest.compute_hash()
+    for warning in warnings:
+        print(f"Agent {agent.name}: {warning}")
+    return manifest
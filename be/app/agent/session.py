@@ -0,0 +1,436 @@
+import asyncio
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from strands.telemetry.metrics import EventLoopMetrics
+
+from .agent import AgentPOService
+from .chat_payload import compress, decompress, get_payload_store
+from .document_search import document_search_tool
+from ..storage import get_storage
+from ..upload import UploadService, UploadedFile
+
+# Live sessions kept in memory, the least recently used ones are spilled to the store beyond either limit
+CHAT_SESSION_MAX_COUNT = int(os.environ.get('CHAT_SESSION_MAX_COUNT', 200))
+CHAT_SESSION_MEMORY_BYTES = int(os.environ.get('CHAT_SESSION_MEMORY_BYTES', 256 * 1024 * 1024))
+# Sessions unused for this long are spilled to the store
+CHAT_SESSION_IDLE_SECONDS = float(os.environ.get('CHAT_SESSION_IDLE_SECONDS', 900))
+# Days a spilled session can be resumed, after which DynamoDB TTL deletes it
+CHAT_SESSION_TTL_DAYS = int(os.environ.get('CHAT_SESSION_TTL_DAYS', 7))
+# Compressed conversations above this size are kept in the payload store instead of the session item
+CHAT_SESSION_INLINE_BYTES = 256 * 1024
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+
+def dump_messages(messages: List[Dict[str, Any]]) -> bytes:
+    """
+    Serialize a Strands conversation to compact JSON, with binary content (e.g. images) as base64.
+    """
+    def encode(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    return json.dumps(messages, default=encode, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_messages(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Deserialize a conversation written by dump_messages.
+    """
+    def decode(value):
+        if len(value) == 1 and '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return value
+
+    return json.loads(data, object_hook=decode)
+
+
+class StoredChatSession(BaseModel):
+    id: str
+    agent_id: str
+    # Number of turns taken, i.e. of chats sent in the session
+    turns: int = 0
+    # SHA-256 digests of the uploaded files attached to the session
+    attachments: List[str] = []
+    # The conversation as serialized by dump_messages
+    messages: bytes = b''
+    update_time: str
+
+
+class ChatSessionService:
+    """
+    A service to persist the conversation of chat sessions, so that any task can take a session's next turn.
+
+    A session is one item holding its conversation as compressed JSON; conversations too large for an item
+    are kept in the payload store and referenced by digest.
+    """
+
+    dynamodb_table_name = "ChatSessionTable"
+
+    def __init__(self):
+        self.dynamodb = get_storage()
+        self.payload_store = get_payload_store()
+
+    def save_session(self, session: StoredChatSession) -> bool:
+        """
+        Store a session, replacing its previous state unless the stored state is as recent or more recent.
+
+        :param session: The session to store. It expires CHAT_SESSION_TTL_DAYS after this save.
+        :return: False if another task stored as many or more turns of the session, which are kept.
+        """
+        item = {
+            'id': session.id,
+            'agent_id': session.agent_id,
+            'turns': session.turns,
+            'attachments': session.attachments,
+            'update_time': session.update_time,
+            'expire_at': int(time.time()) + CHAT_SESSION_TTL_DAYS * 86400,
+        }
+        blob = compress(session.messages)
+        if len(blob) > CHAT_SESSION_INLINE_BYTES:
+            item['messages_ref'] = self.payload_store.put(session.messages)
+        else:
+            item['messages'] = blob
+        try:
+            self.dynamodb.Table(self.dynamodb_table_name).put_item(
+                Item=item, ConditionExpression=Attr('turns').not_exists() | Attr('turns').lt(session.turns))
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        return True
+
+    def get_turns(self, id: str) -> Optional[int]:
+        """
+        Get the number of turns stored for a session, without reading its conversation.
+
+        :param id: The session ID.
+        :return: The number of turns, None if the session was never stored or has expired.
+        """
+        response = self.dynamodb.Table(self.dynamodb_table_name).get_item(
+            Key={'id': id}, ProjectionExpression='turns, expire_at', ConsistentRead=True)
+        item = response.get('Item')
+        if not item or int(item.get('expire_at', 0)) < time.time():
+            return None
+        return int(item.get('turns', 0))
+
+    def get_session(self, id: str) -> Optional[StoredChatSession]:
+        """
+        Retrieve a stored session.
+
+        :param id: The session ID.
+        :return: The session, None if it was never stored, has expired or its conversation is missing.
+        """
+        response = self.dynamodb.Table(self.dynamodb_table_name).get_item(Key={'id': id}, ConsistentRead=True)
+        item = response.get('Item')
+        if not item or int(item.get('expire_at', 0)) < time.time():
+            return None
+        if 'messages_ref' in item:
+            messages = self.payload_store.get(item['messages_ref'])
+            if messages is None:
+                print(f"Conversation {item['messages_ref']} of session {id} is missing from the payload store")
+                return None
+        else:
+            messages = decompress(bytes(item['messages'])) if 'messages' in item else b''
+        return StoredChatSession(id=item['id'], agent_id=item['agent_id'], turns=int(item.get('turns', 0)),
+                                 attachments=list(item.get('attachments', [])), messages=messages,
+                                 update_time=item['update_time'])
+
+    def delete_session(self, id: str):
+        self.dynamodb.Table(self.dynamodb_table_name).delete_item(Key={'id': id})
+
+
+class ChatSession:
+    """
+    The live state of a session: the Strands agent holding its conversation, reused across turns.
+    """
+
+    def __init__(self, id: str):
+        self.id = id
+        self.agent_id: Optional[str] = None
+        self.agent = None
+        # (version, manifest hash) of the agent configuration the Strands agent was built from
+        self.agent_key: Optional[Tuple[int, Optional[str]]] = None
+        self.attachments: Dict[str, UploadedFile] = {}
+        # Conversation loaded from the store, until the agent is built
+        self.messages: List[Dict[str, Any]] = []
+        self.turns = 0
+        self.size = 0
+        self.loaded = False
+        self.dirty = False
+        # Set once the session is ended, a turn still running is then neither saved nor followed by another
+        self.ended = False
+        # Requests waiting for or taking a turn, a busy session is never spilled
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def unload(self):
+        """
+        Drop the conversation and agent, so that the session is loaded from the store on its next turn.
+        """
+        self.agent_id = None
+        self.agent = None
+        self.agent_key = None
+        self.attachments = {}
+        self.messages = []
+        self.turns = 0
+        self.size = 0
+        self.loaded = False
+        self.dirty = False
+
+    def to_stored(self) -> StoredChatSession:
+        messages = self.agent.messages if self.agent is not None else self.messages
+        return StoredChatSession(id=self.id, agent_id=self.agent_id, turns=self.turns,
+                                 attachments=list(self.attachments), messages=dump_messages(messages),
+                                 update_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+class ChatSessionManager:
+    """
+    Keeps multi-turn chat sessions in memory, so that a follow-up turn continues the conversation with the
+    agent built for the previous one instead of building a new agent with an empty history.
+
+    Sessions are kept in least-recently-used order within CHAT_SESSION_MAX_COUNT sessions and an estimated
+    CHAT_SESSION_MEMORY_BYTES of conversation. Sessions beyond these limits or idle for CHAT_SESSION_IDLE_SECONDS
+    are spilled and rehydrated when their next turn comes. Turns of one session run one at a time.
+
+    Each turn is saved to the store when it finishes, and a session kept in memory is reloaded when another task
+    has taken a turn since, so a session can move between the tasks of the service. The load balancer keeps a
+    client on one task, which then finds its sessions warm. The manager is used from the event loop only.
+    """
+
+    def __init__(self, agent_service: AgentPOService, upload_service: UploadService,
+                 store: Optional[ChatSessionService] = None, max_sessions: int = CHAT_SESSION_MAX_COUNT,
+                 memory_bytes: int = CHAT_SESSION_MEMORY_BYTES, idle_seconds: float = CHAT_SESSION_IDLE_SECONDS):
+        self.agent_service = agent_service
+        self.upload_service = upload_service
+        self.store = store or ChatSessionService()
+        self.max_sessions = max_sessions
+        self.memory_bytes = memory_bytes
+        self.idle_seconds = idle_seconds
+        self.sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        # Saves in progress by session ID, a session is only loaded again or deleted once its save is written
+        self.spills: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.rehydrations = 0
+        self.spilled = 0
+
+    async def stream_chat(self, session_id: str, agent_id: str, user_message: str,
+                          attachments: Optional[List[UploadedFile]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Take a turn in a session, creating the session on its first turn.
+
+        :param session_id: The session ID, chosen by the client.
+        :param agent_id: The ID of the agent, which must be the agent of the session's earlier turns.
+        :param user_message: The user's message of this turn.
+        :param attachments: Uploaded files attached in this turn, in addition to those of earlier turns.
+        :raises ValueError: If the agent does not exist or the session belongs to another agent.
+        :return: A generator of the agent's events.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = ChatSession(session_id)
+        else:
+            self.hits += 1
+        self.sessions.move_to_end(session_id)
+        session.active += 1
+        try:
+            async with session.lock:
+                agent = await self._prepare(session, agent_id, attachments or [])
+                # The metrics of a Strands agent add up over its invocations, the chat record holds this turn's
+                agent.event_loop_metrics = EventLoopMetrics()
+                history = list(agent.messages)
+                try:
+                    async for event in agent.stream_async(user_message):
+                        yield event
+                except BaseException:
+                    # Drop the unfinished turn, so the next one does not start from a dangling message
+                    agent.messages = history
+                    raise
+                session.turns += 1
+                session.dirty = True
+                session.size = len(dump_messages(agent.messages))
+                if not session.ended:
+                    await self._write([session], spill=False)
+        finally:
+            session.active -= 1
+            session.last_used = time.monotonic()
+        await self._evict()
+
+    async def end_session(self, session_id: str) -> bool:
+        """
+        End a session, discarding its conversation.
+
+        :param session_id: The session ID.
+        :return: True if the session existed in memory or in the store.
+        """
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.ended = True
+        # Delete the session once a spill of it is written, which would otherwise store it again
+        spill = self.spills.get(session_id)
+        if spill is not None:
+            await asyncio.wait([spill])
+        stored_turns = await run_in_threadpool(self.store.get_turns, session_id)
+        await run_in_threadpool(self.store.delete_session, session_id)
+        return session is not None or stored_turns is not None
+
+    async def spill_all(self):
+        """
+        Spill all sessions to the store, e.g. before the server shuts down.
+        """
+        await self._spill([session for session in self.sessions.values() if not session.active])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number and estimated size of live sessions, and how often sessions were reused warm.
+        """
+        return {
+            'sessions': len(self.sessions),
+            'bytes': sum(session.size for session in self.sessions.values()),
+            'max_sessions': self.max_sessions,
+            'max_bytes': self.memory_bytes,
+            'hits': self.hits,
+            'rehydrations': self.rehydrations,
+            'spilled': self.spilled,
+        }
+
+    async def _prepare(self, session: ChatSession, agent_id: str, attachments: List[UploadedFile]):
+        if session.ended:
+            raise ValueError(f"Session {session.id} has ended.")
+        if session.loaded and not session.dirty:
+            # Another task may have taken a turn of the session, or ended it, since this task's last turn
+            stored_turns = await run_in_threadpool(self.store.get_turns, session.id)
+            if (stored_turns or 0) != session.turns:
+                session.loaded = False
+        if not session.loaded:
+            await self._load(session)
+        if session.agent_id and session.agent_id != agent_id:
+            raise ValueError(f"Session {session.id} belongs to agent {session.agent_id}, not {agent_id}.")
+        agent = await run_in_threadpool(self.agent_service.get_agent, agent_id)
+        if not agent:
+            raise ValueError(f"Agent with ID {agent_id} not found.")
+        session.agent_id = agent_id
+
+        new_attachments = [uploaded for uploaded in attachments if uploaded.sha256 not in session.attachments]
+        session.attachments.update((uploaded.sha256, uploaded) for uploaded in new_attachments)
+        agent_key = (agent.version, agent.manifest_hash)
+        if session.agent is None or session.agent_key != agent_key or new_attachments:
+            # Build the agent for a new or rehydrated session, or again after the agent's configuration changed,
+            # keeping the conversation
+            messages = session.agent.messages if session.agent is not None else session.messages
+            extra_tools = [document_search_tool(list(session.attachments.values()), self.upload_service)] \
+                if session.attachments else None
+            session.agent = await run_in_threadpool(self.agent_service.build_strands_agent, agent,
+                                                    extra_tools=extra_tools)
+            session.agent.messages = messages
+            session.agent_key = agent_key
+            session.messages = []
+        return session.agent
+
+    async def _load(self, session: ChatSession):
+        spill = self.spills.get(session.id)
+        if spill is not None:
+            await asyncio.wait([spill])
+        stored = await run_in_threadpool(self.store.get_session, session.id)
+        session.unload()
+        if stored is not None:
+            session.agent_id = stored.agent_id
+            session.turns = stored.turns
+            session.messages = load_messages(stored.messages) if stored.messages else []
+            session.size = len(stored.messages)
+            session.attachments = await run_in_threadpool(self._resolve_attachments, stored.attachments)
+            self.rehydrations += 1
+        session.loaded = True
+
+    def _resolve_attachments(self, sha256s: List[str]) -> Dict[str, UploadedFile]:
+        attachments = {}
+        for sha256 in sha256s:
+            uploaded = self.upload_service.get_upload(sha256)
+            if uploaded:
+                self.upload_service.fetch_local_copy(uploaded)
+                attachments[sha256] = uploaded
+        return attachments
+
+    async def _evict(self):
+        # Sessions are in least-recently-used order, so the idle and the evictable ones come first
+        now = time.monotonic()
+        count = len(self.sessions)
+        size = sum(session.size for session in self.sessions.values())
+        victims = []
+        for session in self.sessions.values():
+            if count <= self.max_sessions and size <= self.memory_bytes \
+                    and now - session.last_used <= self.idle_seconds:
+                break
+            if session.active:
+                continue
+            victims.append(session)
+            count -= 1
+            size -= session.size
+        await self._spill(victims)
+
+    async def _spill(self, sessions: List[ChatSession]):
+        for session in sessions:
+            if self.sessions.get(session.id) is session:
+                del self.sessions[session.id]
+        dirty = [session for session in sessions if session.dirty and not session.ended]
+        if dirty:
+            await self._write(dirty, spill=True)
+
+    async def _write(self, sessions: List[ChatSession], spill: bool):
+        write = asyncio.ensure_future(run_in_threadpool(self._save_all, sessions, spill))
+        for session in sessions:
+            self.spills[session.id] = write
+        try:
+            await write
+        finally:
+            for session in sessions:
+                if self.spills.get(session.id) is write:
+                    del self.spills[session.id]
+
+    def _save_all(self, sessions: List[ChatSession], spill: bool):
+        for session in sessions:
+            if self._save(session) and spill:
+                self.spilled += 1
+
+    def _save(self, session: ChatSession) -> bool:
+        try:
+            saved = self.store.save_session(session.to_stored())
+        except Exception as e:
+            # The session stays dirty, and is saved again by its next turn or spill
+            print(f"Error saving chat session {session.id}: {str(e)}")
+            return False
+        if not saved:
+            # Another task took a turn of the session meanwhile, its conversation is kept and loaded next turn
+            print(f"Chat session {session.id} has more turns in the store, discarding turn {session.turns}")
+            session.loaded = False
+        session.dirty = False
+        return saved
+
+
+_manager: Optional[ChatSessionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_chat_session_manager() -> ChatSessionManager:
+    """
+    Get the process-wide chat session manager, creating it on first use.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ChatSessionManager(AgentPOService(), UploadService())
+        return _manager
@@ -0,0 +1,125 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .agent import AgentPO, AgentTool, AgentToolType, AgentType, Tools, agent_catalog
+from ..mcp.mcp import HttpMCPServer, mcp_catalog
+from ..utils.catalog import CatalogCache
+
+# Fields of a tool in compact listings, plus agent_id and mcp_server_url when they are set
+COMPACT_TOOL_FIELDS = {'name', 'display_name', 'category', 'type', 'agent_id', 'mcp_server_url'}
+
+
+class ToolCatalog:
+    """
+    The merged catalog of tools agents can use: strands tools, plain agents and MCP servers.
+
+    Strands tools are listed once. The agent and MCP server entries are kept in step with the agent and MCP
+    server catalogs: when one of them changes, only the entries of agents or servers that were added, changed or
+    removed are rebuilt, and the merged list is assembled again without reading the store.
+    """
+
+    def __init__(self, agents: CatalogCache, mcp_servers: CatalogCache):
+        self.agents = agents
+        self.mcp_servers = mcp_servers
+        self.lock = threading.Lock()
+        self.static_tools = [AgentTool(name=tool.identify, display_name=tool.name, category=tool.category,
+                                       desc=tool.desc) for tool in Tools]
+        # Entries by agent or server ID, with the state they were built from
+        self.agent_tools: Dict[str, Tuple[Any, AgentTool]] = {}
+        self.mcp_tools: Dict[str, Tuple[Any, AgentTool]] = {}
+        self.sources: Tuple[Any, Any] = (None, None)
+        self.tools: List[AgentTool] = []
+        self.search_texts: List[str] = []
+
+    def list_tools(self) -> List[AgentTool]:
+        """
+        List all tools: strands tools, then plain agents and MCP servers ordered by name.
+        """
+        return list(self._refresh()[0])
+
+    def search_tools(self, category: Optional[str] = None, query: Optional[str] = None,
+                     tool_type: Optional[AgentToolType] = None, limit: Optional[int] = None,
+                     cursor: int = 0) -> Tuple[List[AgentTool], Optional[int]]:
+        """
+        Filter the tools, one page at a time.
+
+        :param category: Only list tools of this category, compared case-insensitively.
+        :param query: Only list tools whose name, display name, description or category contains every word.
+        :param tool_type: Only list tools of this type.
+        :param limit: The maximum number of tools to return, all of them if None.
+        :param cursor: The cursor returned with the previous page, 0 for the first page.
+        :return: A tuple of (tools, cursor of the next page or None).
+        """
+        tools, search_texts = self._refresh()
+        category = category.lower() if category else None
+        words = query.lower().split() if query else []
+        matches = [tool for tool, text in zip(tools, search_texts)
+                   if (category is None or tool.category.lower() == category)
+                   and (tool_type is None or tool.type == tool_type)
+                   and all(word in text for word in words)]
+        if limit is None:
+            return matches[cursor:], None
+        next_cursor = cursor + limit
+        return matches[cursor:next_cursor], next_cursor if next_cursor < len(matches) else None
+
+    def _refresh(self) -> Tuple[List[AgentTool], List[str]]:
+        agents = self.agents.get()
+        servers = self.mcp_servers.get()
+        with self.lock:
+            if agents is self.sources[0] and servers is self.sources[1]:
+                return self.tools, self.search_texts
+            if agents is not self.sources[0]:
+                plain_agents = {agent.id: agent for agent in agents.by_type.get(AgentType.plain, [])}
+                self._sync(self.agent_tools, plain_agents, lambda agent: (agent.version, agent.name, agent.description),
+                           self._agent_tool)
+            if servers is not self.sources[1]:
+                self._sync(self.mcp_tools, {server.id: server for server in servers},
+                           lambda server: (server.name, server.desc, server.host), self._mcp_tool)
+            self.tools = self.static_tools + [tool for _, tool in self.agent_tools.values()] + \
+                [tool for _, tool in self.mcp_tools.values()]
+            self.search_texts = [" ".join(filter(None, (tool.name, tool.display_name, tool.desc, tool.category)))
+                                 .lower() for tool in self.tools]
+            self.sources = (agents, servers)
+            return self.tools, self.search_texts
+
+    @staticmethod
+    def _sync(entries: Dict[str, Tuple[Any, AgentTool]], sources: Dict[str, Any], state, build):
+        # Rebuild the entries whose source changed and keep the order of the sources, which are sorted by name
+        previous = dict(entries)
+        entries.clear()
+        for id, source in sources.items():
+            key = state(source)
+            entry = previous.get(id)
+            entries[id] = entry if entry is not None and entry[0] == key else (key, build(source))
+
+    @staticmethod
+    def _agent_tool(agent: AgentPO) -> AgentTool:
+        return AgentTool(name=agent.name, display_name=agent.name, category="Agent", desc=agent.description,
+                         type=AgentToolType.agent, agent_id=agent.id)
+
+    @staticmethod
+    def _mcp_tool(server: HttpMCPServer) -> AgentTool:
+        return AgentTool(name=server.name, display_name=server.name, category="Mcp", desc=server.desc,
+                         type=AgentToolType.mcp, mcp_server_url=server.host)
+
+
+def compact_tool(tool: AgentTool) -> Dict[str, Any]:
+    """
+    The fields of a tool needed to pick it, without its description.
+    """
+    return tool.model_dump(include=COMPACT_TOOL_FIELDS, exclude_none=True)
+
+
+_catalog: Optional[ToolCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_tool_catalog() -> ToolCatalog:
+    """
+    Get the process-wide tool catalog, creating it on first use.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ToolCatalog(agent_catalog, mcp_catalog)
+        return _catalog
@@ -1,4 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 import os
 
 from .routers import agent
@@ -6,7 +8,24 @@ from .routers import mcp
 from .routers import chat_record
 from .routers import schedule
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index the chats other tasks write, remove payloads left behind by deleted and expired chats, and finish
+    # deletions interrupted by a restart
+    from .agent.chat_cleanup import get_chat_cleanup_service
+    cleanup_service = get_chat_cleanup_service()
+    cleanup_service.chat_service.start_search_sync()
+    cleanup_service.start_payload_sweeps()
+    try:
+        await run_in_threadpool(cleanup_service.resume_interrupted_jobs)
+    except Exception as e:
+        print(f"Error resuming chat deletion jobs: {str(e)}")
+    yield
+    # Keep the conversations of live chat sessions, which can then be resumed by any task
+    from .agent.session import get_chat_session_manager
+    await get_chat_session_manager().spill_all()
+
+app = FastAPI(lifespan=lifespan)
 
 # Read APP_ENV environment variable and set URL prefix accordingly
 app_env = os.environ.get("APP_ENV", "")
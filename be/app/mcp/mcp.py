@@ -1,8 +1,8 @@
 
 import uuid
-import boto3
 from pydantic import BaseModel
-from ..utils.aws_config import get_aws_region
+from ..storage import get_storage
+from ..utils.catalog import CatalogCache
 
 class HttpMCPServer(BaseModel):
    id: str | None = None
@@ -15,9 +15,11 @@ class MCPService:
 
     dynamodb_table_name = "HttpMCPTable"
 
+    catalog_name = "mcp_servers"
+
     def __init__(self):
-        aws_region = get_aws_region()
-        self.dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+        self.dynamodb = get_storage()
+        self.catalog = mcp_catalog
 
     def add_mcp_server(self, server: HttpMCPServer):
         if not server.id:
@@ -30,13 +32,27 @@ class MCPService:
                 'host': server.host
             }
         )
+        # MCP servers have no version to order racing writes by, so the catalog is reloaded
+        self.catalog.bump()
 
     def list_mcp_servers(self) -> list[HttpMCPServer]:
-        response = self.dynamodb.Table(self.dynamodb_table_name).scan()
-        items = response.get('Items', [])
-        self.mcp_servers = [HttpMCPServer.model_validate(item) for item in items]
+        # Served from the catalog snapshot, ordered by name
+        self.mcp_servers = list(self.catalog.get())
         return self.mcp_servers
-        
+
+    def scan_mcp_servers(self) -> list[HttpMCPServer]:
+        """
+        Read all MCP servers from the table, ordered by name.
+        """
+        table = self.dynamodb.Table(self.dynamodb_table_name)
+        servers = []
+        kwargs = {}
+        while True:
+            response = table.scan(**kwargs)
+            servers.extend(HttpMCPServer.model_validate(item) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return sorted(servers, key=lambda server: server.name)
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     def get_mcp_server(self, id: str) -> HttpMCPServer | None:
         response = self.dynamodb.Table(self.dynamodb_table_name).get_item(
@@ -52,4 +68,9 @@ class MCPService:
         response = self.dynamodb.Table(self.dynamodb_table_name).delete_item(
             Key={'id': id}
         )
+        self.catalog.bump()
         return response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200
+
+
+# Process-wide snapshot of the MCP server catalog, shared by all MCPService instances
+mcp_catalog = CatalogCache(MCPService.catalog_name, lambda: MCPService().scan_mcp_servers())
@@ -1,17 +1,26 @@
 from datetime import datetime
 import uuid
 import json
-import os
-import boto3
-from fastapi import APIRouter, Request, BackgroundTasks, UploadFile, File
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, JSONResponse
-from typing import List, Dict, Tuple, Optional, AsyncGenerator
-from ..agent.agent import AgentPO, AgentType, ModelProvider, AgentTool, AgentPOService, ChatRecord, ChatResponse, ChatRecordService
+from typing import Any, List, Dict, Tuple, Optional, AsyncGenerator
+from ..agent.agent import AgentPO, AgentType, ModelProvider, AgentTool, AgentToolType, AgentPOService, AgentVersionConflict, agent_catalog, ChatRecord, ChatResponse, ChatRecordService, CHAT_COMPACTION_ENABLED, summarize_chat_metrics
+from ..agent.chat_cleanup import chat_expire_at
+from ..agent.document_search import attachment_prompt, document_search_tool
+from ..agent.manifest import ManifestError
+from ..agent.session import SESSION_ID_PATTERN, get_chat_session_manager
+from ..agent.tool_catalog import compact_tool, get_tool_catalog
 from ..agent.event_serializer import EventSerializer
-from ..utils.aws_config import get_aws_region
+from ..utils.catalog import catalog_response
+from ..mcp.mcp import mcp_catalog
+from ..upload import UploadService, UploadedFile, PresignedUpload, UploadReleased, get_extraction_pipeline
 
 agent_service = AgentPOService()
 chat_reccord_service = ChatRecordService()
+upload_service = UploadService()
+extraction_pipeline = get_extraction_pipeline()
 
 router = APIRouter(
     prefix="/agent",
@@ -19,120 +28,219 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
+def add_upload_chat_record(uploaded: UploadedFile):
+    """
+    Create the chat record and first chat response that point agents at a newly uploaded file.
+
+    :param uploaded: The newly stored file.
+    """
+    chat_record = ChatRecord(
+        id=uploaded.chat_id,
+        agent_id="file_upload",  # Special agent ID for file uploads
+        user_message=f"File uploaded: {uploaded.file_path}",
+        create_time=uploaded.create_time
+    )
+    chat_reccord_service.add_chat_record(chat_record)
+
+    # Create chat response with the local path
+    chat_resp = ChatResponse(
+        chat_id=uploaded.chat_id,
+        resp_no=0,
+        content=uploaded.file_path,  # Store local path for agent to use
+        create_time=uploaded.create_time
+    )
+    chat_reccord_service.add_chat_response(chat_resp)
+
+async def upload_result(uploaded: UploadedFile, created: bool) -> Dict[str, Any]:
+    """
+    Build the response of an upload, including cached extracted text for deduplicated uploads.
+
+    :param uploaded: The stored file.
+    :param created: Whether the file content was stored by this upload.
+    :return: The upload response.
+    """
+    result = {
+        "s3_path": uploaded.s3_path,
+        "file_path": uploaded.file_path,
+        "chat_id": uploaded.chat_id,
+        "sha256": uploaded.sha256,
+        "deduplicated": not created
+    }
+    if created:
+        await run_in_threadpool(add_upload_chat_record, uploaded)
+    else:
+        extracted_text = await run_in_threadpool(upload_service.load_extracted_text, uploaded)
+        if extracted_text is not None:
+            result["extracted_text"] = extracted_text
+    return result
+
+def fetch_and_extract(uploaded: UploadedFile):
+    """
+    Fetch the local copy of a presigned upload and queue its text extraction.
+
+    :param uploaded: The stored file.
+    """
+    upload_service.fetch_local_copy(uploaded)
+    extraction_pipeline.submit(uploaded)
+
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)) -> Dict[str, str]:
+async def upload_file(file: UploadFile = File(...)) -> Dict[str, Any]:
     """
     Upload a file to S3, create a chat record, and return both S3 path and chat ID.
+    Re-uploading content that is already stored returns the existing paths, chat ID and any cached extracted text.
     """
     print(f"Uploading file: {file.filename}, Content-Type: {file.content_type}")
     try:
-        # Initialize S3 client
-        s3 = boto3.client('s3', region_name=get_aws_region())
-        bucket_name = 'a-web-uw2' # Replace with your actual bucket name
-        print(f"S3 client initialized for bucket: {bucket_name}")
-        s3_key = f'agentx/{file.filename}'
-        
-        # Read file content
-        content = await file.read()
-        content_size = len(content)
-        print(f"Read file content, size: {content_size} bytes")
-        
-        # Create a file-like object from the content
-        from io import BytesIO
-        file_obj = BytesIO(content)
-        file_obj.seek(0)  # Ensure file pointer is at the beginning
-        
-        # Upload file to S3
-        print(f"Uploading to S3: bucket={bucket_name}, key={s3_key}")
-        s3.upload_fileobj(
-            file_obj,
-            bucket_name,
-            s3_key,
-            ExtraArgs={'ContentType': file.content_type}
-        )
-        print("S3 upload completed successfully")
-        
-        # Generate chat ID
-        chat_id = uuid.uuid4().hex
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        s3_path = f's3://{bucket_name}/{s3_key}'
-        
-        # Save file locally
-        file_ext = os.path.splitext(file.filename)[1]
-        local_file_path = f"/Users/anbei/Desktop/AgentX/be/uploads/{chat_id}{file_ext}"
-        # Ensure the uploads directory exists
-        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-        # Create a new BytesIO object for local file save
-        local_file_obj = BytesIO(content)
-        with open(local_file_path, "wb") as f:
-            f.write(local_file_obj.read())
-        print(f"File saved locally at: {local_file_path}")
-        
-        chat_record = ChatRecord(
-            id=chat_id,
-            agent_id="file_upload",  # Special agent ID for file uploads
-            user_message=f"File uploaded: {local_file_path}",
-            create_time=current_time
+        # Hash and stream the spooled upload to S3 and the local disk off the event loop
+        uploaded, created = await run_in_threadpool(
+            upload_service.save_upload, file.file, file.filename, uuid.uuid4().hex, file.content_type
         )
-        chat_reccord_service.add_chat_record(chat_record)
-        
-        # Create chat response with both paths
-        chat_resp = ChatResponse(
-            chat_id=chat_id,
-            resp_no=0,
-            content=local_file_path,  # Store local path for agent to use
-            create_time=current_time
-        )
-        chat_reccord_service.add_chat_response(chat_resp)
-        
-        return {
-            "s3_path": s3_path,
-            "file_path": local_file_path,
-            "chat_id": chat_id
-        }
-        
+        # Parse the document in the background so it is ready before the first prompt
+        extraction_pipeline.submit(uploaded)
+        return await upload_result(uploaded, created)
     except Exception as e:
         raise Exception(f"Failed to upload file to S3: {str(e)}")
 
-@router.get("/list")
-def list_agents() -> List[AgentPO]:
+@router.post("/upload/presign")
+async def presign_upload(request: Request) -> PresignedUpload:
+    """
+    Issue presigned S3 URLs so the client can upload a file without proxying it through the backend.
+    Content that is already stored is deduplicated and returned without URLs.
+    :param request: The request containing sha256, filename, size and content_type.
+    :return: The presigned single-part or multipart upload.
+    """
+    data = await request.json()
+    sha256 = data.get("sha256")
+    filename = data.get("filename")
+    size = data.get("size")
+    if not sha256 or not filename or size is None:
+        raise HTTPException(status_code=400, detail="sha256, filename and size are required")
+    try:
+        return await run_in_threadpool(upload_service.presign_upload, sha256, filename, int(size), data.get("content_type"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/upload/complete")
+async def complete_upload(request: Request, background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    """
+    Complete a presigned upload: register the S3 object, create the chat record, then fetch a local copy and extract its text in the background.
+    :param request: The request containing sha256, filename, the generation returned by /upload/presign, content_type and, for multipart uploads, upload_id and parts.
+    :param background_tasks: FastAPI's BackgroundTasks for background processing.
+    :return: The upload response, in the same shape as /agent/upload.
     """
-    List all agents.
+    data = await request.json()
+    sha256 = data.get("sha256")
+    filename = data.get("filename")
+    generation = data.get("generation")
+    if not sha256 or not filename or not generation:
+        raise HTTPException(status_code=400, detail="sha256, filename and generation are required")
+    try:
+        uploaded, created = await run_in_threadpool(
+            upload_service.complete_presigned_upload, sha256, filename, generation, uuid.uuid4().hex,
+            data.get("content_type"), data.get("upload_id"), data.get("parts")
+        )
+    except UploadReleased as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ValueError, ClientError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to complete upload: {str(e)}")
+
+    background_tasks.add_task(fetch_and_extract, uploaded)
+    return await upload_result(uploaded, created)
+
+@router.delete("/upload/{sha256}")
+def release_uploaded_file(sha256: str) -> bool:
+    """
+    Release a reference to an uploaded file, deleting its content once no references remain.
+    :param sha256: The SHA-256 digest returned by the upload.
+    :return: True if the file content was deleted, False otherwise.
+    """
+    return upload_service.release_upload(sha256)
+
+@router.get("/list", response_model=List[AgentPO])
+def list_agents(request: Request, limit: Optional[int] = None, cursor: Optional[int] = None,
+                agent_type: Optional[str] = None) -> Response:
+    """
+    List agents ordered by name, all of them unless a limit is given.
+    The cursor of the next page is returned in the X-Next-Cursor header and is absent on the last page.
+    The ETag header changes with the agent catalog; If-None-Match with the current one gets a 304.
+    :param limit: The maximum number of agents to return.
+    :param cursor: The cursor returned with the previous page.
+    :param agent_type: Only list agents of this type ("plain" or "orchestrator").
     :return: A list of agents.
     """
-    return agent_service.list_agents()
+    try:
+        type_filter = AgentType[agent_type] if agent_type else None
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown agent type {agent_type}")
+
+    def render():
+        if limit is None:
+            return agent_service.list_agents(type_filter), {}
+        agents, next_cursor = agent_service.list_agents_page(max(1, limit), max(cursor or 0, 0), type_filter)
+        return agents, {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+
+    return catalog_response(request, [agent_catalog], render)
+
+def agent_etag(agent: AgentPO) -> str:
+    """
+    The entity tag of a saved agent, which changes with its version.
+    """
+    return f'"{agent.id}.{agent.version}"'
+
+def expected_agent_version(request: Request) -> Optional[int]:
+    """
+    Parse the agent version a request expects from its If-Match header.
+
+    :param request: The request, whose If-Match header holds an ETag returned by /agent/get or /agent/createOrUpdate.
+    :raises HTTPException: 412 if the header is not such an ETag.
+    :return: The expected version, None if the request has no If-Match header or it is "*".
+    """
+    if_match = request.headers.get("if-match")
+    if not if_match or if_match.strip() == "*":
+        return None
+    etag = if_match.split(",")[0].strip().removeprefix("W/").strip('"')
+    try:
+        return int(etag.rsplit(".", 1)[-1])
+    except ValueError:
+        raise HTTPException(status_code=412, detail=f"Invalid If-Match header {if_match}")
 
 @router.get("/get/{agent_id}")
-def get_agent(agent_id: str) -> AgentPO:
+def get_agent(agent_id: str, response: Response) -> AgentPO:
     """
     Get a specific agent by ID.
     :param agent_id: The ID of the agent to retrieve.
-    :return: Details of the specified agent.
+    :return: Details of the specified agent, with its version as the ETag header.
     """
-    return agent_service.get_agent(agent_id)
+    agent = agent_service.get_agent(agent_id)
+    if agent:
+        response.headers["ETag"] = agent_etag(agent)
+    return agent
 
 @router.delete("/delete/{agent_id}")
-def delete_agent(agent_id: str) -> bool:
+def delete_agent(agent_id: str, request: Request) -> bool:
     """
     Delete a specific agent by ID.
     :param agent_id: The ID of the agent to delete.
+    :param request: An If-Match header makes the deletion conditional on the agent's version.
     :return: True if deletion was successful, False otherwise.
     """
-    return agent_service.delete_agent(agent_id)
+    try:
+        return agent_service.delete_agent(agent_id, expected_agent_version(request))
+    except AgentVersionConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
 
 @router.post("/createOrUpdate")
-async def create_agent(request: Request) -> AgentPO:
+async def create_agent(request: Request, response: Response) -> AgentPO:
     """
-    Create a new agent.
-    :param agent: The agent data to create.
-    :return: Confirmation of agent creation.
+    Create a new agent or replace an existing one.
+    :param request: The agent data to save. An If-Match header with the agent's ETag makes the save conditional
+        on the agent not having been changed since it was read.
+    :return: The saved agent, with its new version as the ETag header.
     """
-    
+    expected_version = expected_agent_version(request)
+
     agent = await request.json()
-    agent_id = uuid.uuid4().hex
-    if agent and agent.get("id"):
-        agent_service.delete_agent(agent["id"])
-        agent_id = agent["id"]
+    agent_id = agent["id"] if agent and agent.get("id") else uuid.uuid4().hex
 
     tools = []
     if agent.get("tools"):
@@ -151,37 +259,81 @@ async def create_agent(request: Request) -> AgentPO:
         envs=agent.get("envs", ""),
         extras=agent.get("extras"),
     )
-    agent_service.add_agent(agent_po)
+    # Validate and compile the configuration before touching the stored agent
+    try:
+        await run_in_threadpool(agent_service.compile_manifest, agent_po)
+    except ManifestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        agent_po = await run_in_threadpool(agent_service.add_agent, agent_po, expected_version)
+    except AgentVersionConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    response.headers["ETag"] = agent_etag(agent_po)
     return agent_po
 
-async def parse_chat_request_and_add_record(request: Request) -> Tuple[Optional[str], Optional[str], str, bool]:
+def resolve_attachments(sha256s: List[str]) -> List[UploadedFile]:
+    """
+    Look up the uploaded files attached to a chat request and make sure they can be searched locally.
+
+    :param sha256s: The SHA-256 digests returned by the upload endpoints.
+    :return: The attached files that exist.
+    """
+    attachments = []
+    for sha256 in sha256s:
+        uploaded = upload_service.get_upload(sha256)
+        if not uploaded:
+            print(f"Attachment {sha256} not found, ignoring it")
+            continue
+        upload_service.fetch_local_copy(uploaded)
+        attachments.append(uploaded)
+    return attachments
+
+async def parse_chat_request_and_add_record(request: Request) -> Tuple[Optional[str], Optional[str], str, bool, List[UploadedFile], Optional[int], Optional[str]]:
     """
     Parse a chat request to extract agent_id, user_message, and create a chat record.
+
+    Documents attached by SHA-256 digest are not inlined into the message; the agent is told about them and
+    retrieves relevant passages through the search_uploaded_document tool.
     
-    :param request: The request containing the chat parameters.
-    :return: A tuple of (agent_id, user_message, chat_id, chat_record_enabled).
+    :param request: The request containing the chat parameters. A session_id chosen by the client makes the chat
+        a turn of a multi-turn session, which continues the conversation of the session's earlier turns.
+    :return: A tuple of (agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at, session_id).
     """
     data = await request.json()
     agent_id = data.get("agent_id")
     user_message = data.get("user_message")
     chat_record_enabled = data.get("chat_record_enabled", True)  # Default to True if not provided
+    session_id = data.get("session_id")
+    if session_id is not None and not (isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id)):
+        raise HTTPException(status_code=400, detail="session_id must be 1 to 128 letters, digits, '-' or '_'")
+    attachments = await run_in_threadpool(resolve_attachments, data.get("attachments") or [])
+    if user_message and attachments:
+        user_message = f"{user_message}\n\n{attachment_prompt(attachments)}"
     
     # Log the received message content
     print(f"Received chat request - Agent ID: {agent_id}")
-    print(f"User message content: {user_message}")
-    if user_message and "File Content:" in user_message:
-        print("Message includes uploaded file content")
+    if user_message:
+        print(f"User message: {len(user_message)} chars, {user_message[:200]!r}")
+        if "File Content:" in user_message:
+            print("Message includes uploaded file content")
     
     # Create a chat record if chat_record_enabled is True
     chat_id = uuid.uuid4().hex
+    expire_at = None
     if chat_record_enabled:
+        # Chats of agents with a retention period are expired by DynamoDB TTL
+        expire_at = chat_expire_at(await run_in_threadpool(agent_service.get_agent, agent_id)) if agent_id else None
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        chat_record = ChatRecord(id=chat_id, agent_id=agent_id, user_message=user_message, create_time=current_time)
-        chat_reccord_service.add_chat_record(chat_record)
+        chat_record = ChatRecord(id=chat_id, agent_id=agent_id, user_message=user_message, create_time=current_time,
+                                 session_id=session_id)
+        chat_reccord_service.add_chat_record(chat_record, expire_at)
     
-    return agent_id, user_message, chat_id, chat_record_enabled
+    return agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at, session_id
 
-async def process_chat_events(agent_id: str, user_message: str, chat_id: str, chat_record_enabled: bool = True) -> AsyncGenerator[Dict, None]:
+async def process_chat_events(agent_id: str, user_message: str, chat_id: str, chat_record_enabled: bool = True,
+                              attachments: Optional[List[UploadedFile]] = None, expire_at: Optional[int] = None,
+                              session_id: Optional[str] = None) -> AsyncGenerator[Dict, None]:
     """
     Process chat events and save responses to the database if chat_record_enabled is True.
     
@@ -189,10 +341,21 @@ async def process_chat_events(agent_id: str, user_message: str, chat_id: str, ch
     :param user_message: The user's message to process.
     :param chat_id: The ID of the chat record.
     :param chat_record_enabled: Whether to save chat responses to the database.
+    :param attachments: Uploaded files the agent can search during this chat.
+    :param expire_at: Epoch seconds after which the saved responses expire, None to keep them.
+    :param session_id: The session the chat is a turn of, None for a standalone chat.
     :yield: Chat events.
     """
     resp_no = 0
-    async for event in agent_service.stream_chat(agent_id, user_message):
+    metrics = None
+    if session_id:
+        events = get_chat_session_manager().stream_chat(session_id, agent_id, user_message, attachments)
+    else:
+        extra_tools = [document_search_tool(attachments, upload_service)] if attachments else None
+        events = agent_service.stream_chat(agent_id, user_message, extra_tools)
+    async for event in events:
+        if "result" in event:
+            metrics = event["result"].metrics
         if chat_record_enabled and ("message" in event and "role" in event["message"]):
             chat_resp = ChatResponse(
                 chat_id=chat_id, 
@@ -200,9 +363,20 @@ async def process_chat_events(agent_id: str, user_message: str, chat_id: str, ch
                 content=json.dumps(event), 
                 create_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             )
-            chat_reccord_service.add_chat_response(chat_resp)
+            chat_reccord_service.add_chat_response(chat_resp, expire_at)
             resp_no += 1
         yield event
+    if chat_record_enabled and metrics is not None:
+        try:
+            await run_in_threadpool(chat_reccord_service.set_chat_metrics, chat_id, *summarize_chat_metrics(metrics))
+        except Exception as e:
+            print(f"Error saving metrics of chat {chat_id}: {str(e)}")
+    if chat_record_enabled and resp_no and CHAT_COMPACTION_ENABLED:
+        # The chat is complete, fold its responses into one transcript item
+        try:
+            await run_in_threadpool(chat_reccord_service.compact_chat, chat_id, expire_at)
+        except Exception as e:
+            print(f"Error compacting chat {chat_id}: {str(e)}")
 
 @router.post("/stream_chat")
 async def stream_chat(request: Request) -> StreamingResponse:
@@ -211,7 +385,7 @@ async def stream_chat(request: Request) -> StreamingResponse:
     :param request: The request containing the chat parameters.
     :return: A stream of chat messages.
     """
-    agent_id, user_message, chat_id, chat_record_enabled = await parse_chat_request_and_add_record(request)
+    agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at, session_id = await parse_chat_request_and_add_record(request)
     
     if not agent_id or not user_message:
         return "Agent ID and user message are required."
@@ -220,7 +394,8 @@ async def stream_chat(request: Request) -> StreamingResponse:
         """
         Generator function to yield SSE formatted events.
         """
-        async for event in process_chat_events(agent_id, user_message, chat_id, chat_record_enabled):
+        async for event in process_chat_events(agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at,
+                                               session_id):
             # Format the event as an SSE
             yield EventSerializer.format_as_sse(event)
     
@@ -239,7 +414,7 @@ async def async_chat(request: Request, background_tasks: BackgroundTasks) -> JSO
     :param background_tasks: FastAPI's BackgroundTasks for background processing.
     :return: A JSON response with the chat ID.
     """
-    agent_id, user_message, chat_id, chat_record_enabled = await parse_chat_request_and_add_record(request)
+    agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at, session_id = await parse_chat_request_and_add_record(request)
     
     if not agent_id or not user_message:
         return JSONResponse(
@@ -253,7 +428,10 @@ async def async_chat(request: Request, background_tasks: BackgroundTasks) -> JSO
         agent_id=agent_id,
         user_message=user_message,
         chat_id=chat_id,
-        chat_record_enabled=chat_record_enabled
+        chat_record_enabled=chat_record_enabled,
+        attachments=attachments,
+        expire_at=expire_at,
+        session_id=session_id
     )
     
     # Return immediately with the chat ID
@@ -261,11 +439,14 @@ async def async_chat(request: Request, background_tasks: BackgroundTasks) -> JSO
         content={
             "status": "processing",
             "chat_id": chat_id,
+            "session_id": session_id,
             "message": "Your request is being processed in the background."
         }
     )
 
-async def process_chat_in_background(agent_id: str, user_message: str, chat_id: str, chat_record_enabled: bool = True):
+async def process_chat_in_background(agent_id: str, user_message: str, chat_id: str, chat_record_enabled: bool = True,
+                                     attachments: Optional[List[UploadedFile]] = None, expire_at: Optional[int] = None,
+                                     session_id: Optional[str] = None):
     """
     Process a chat message in the background.
     
@@ -273,19 +454,62 @@ async def process_chat_in_background(agent_id: str, user_message: str, chat_id:
     :param user_message: The user's message to process.
     :param chat_id: The ID of the chat record.
     :param chat_record_enabled: Whether to save chat responses to the database.
+    :param attachments: Uploaded files the agent can search during this chat.
+    :param expire_at: Epoch seconds after which the saved responses expire, None to keep them.
+    :param session_id: The session the chat is a turn of, None for a standalone chat.
     """
     try:
-        async for _ in process_chat_events(agent_id, user_message, chat_id, chat_record_enabled):
+        async for _ in process_chat_events(agent_id, user_message, chat_id, chat_record_enabled, attachments, expire_at,
+                                           session_id):
             pass  # We just need to consume the generator
         print(f"Background processing completed for chat {chat_id}")
     except Exception as e:
         # Log the error
         print(f"Error in background processing for chat {chat_id}: {str(e)}")
 
-@router.get("/tool_list")
-def available_agent_tools() -> List[AgentTool]:
+@router.delete("/sessions/{session_id}")
+async def end_session(session_id: str) -> bool:
+    """
+    End a multi-turn chat session, discarding its conversation.
+    :param session_id: The ID of the session.
+    :return: True if the session existed.
+    """
+    return await get_chat_session_manager().end_session(session_id)
+
+@router.get("/session_stats")
+async def session_stats() -> Dict[str, Any]:
+    """
+    Get the number and memory use of live chat sessions and how often they were reused.
+    :return: The session counters.
+    """
+    return get_chat_session_manager().stats()
+
+@router.get("/tool_list", response_model=List[AgentTool])
+def available_agent_tools(request: Request, category: Optional[str] = None, q: Optional[str] = None,
+                          type: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[int] = None,
+                          fields: Optional[str] = None) -> Response:
     """
-    List all available agent tools.
+    List the available agent tools, all of them unless filtered or a limit is given.
+    The cursor of the next page is returned in the X-Next-Cursor header and is absent on the last page.
+    The ETag header changes with the agent and MCP server catalogs; If-None-Match with the current one gets a 304.
+    :param category: Only list tools of this category, e.g. "Utilities", "Agent" or "Mcp".
+    :param q: Only list tools whose name, description or category contains every word of q.
+    :param type: Only list tools of this type ("strands", "mcp" or "agent").
+    :param limit: The maximum number of tools to return.
+    :param cursor: The cursor returned with the previous page.
+    :param fields: "compact" to return only the fields needed to pick a tool, without descriptions.
     :return: A list of available agent tools.
     """
-    return agent_service.get_all_available_tools()
+    try:
+        tool_type = AgentToolType[type] if type else None
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown tool type {type}")
+
+    def render():
+        tools, next_cursor = get_tool_catalog().search_tools(category, q, tool_type,
+                                                             max(1, limit) if limit is not None else None,
+                                                             max(cursor or 0, 0))
+        content = [compact_tool(tool) for tool in tools] if fields == "compact" else tools
+        return content, {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+
+    return catalog_response(request, [agent_catalog, mcp_catalog], render)
@@ -1,7 +1,23 @@
-from fastapi import APIRouter, Request
-from typing import List
+import json
+import os
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
 
 from ..agent.agent import ChatRecord, ChatResponse, ChatRecordService
+from ..agent.chat_cleanup import ChatDeletionJob, get_chat_cleanup_service
+from ..agent.chat_export import ChatExportJob, get_chat_export_service
+from ..agent.chat_search import ChatSearchHit
+from ..upload import UploadService, UploadedFile, get_extraction_pipeline
+from ..utils.file_processor import FileProcessor
+from ..utils.csv_profiler import query_csv
+
+# How long get_file_content waits for an in-flight extraction before falling back to the file path
+EXTRACTION_WAIT_SECONDS = float(os.environ.get('EXTRACTION_WAIT_SECONDS', 10))
+CSV_QUERY_MAX_ROWS = 1000
+CHAT_LIST_MAX_LIMIT = 100
+CHAT_SEARCH_MAX_LIMIT = 50
 
 router = APIRouter(
     prefix="/chat",
@@ -10,39 +26,217 @@ router = APIRouter(
 )
 
 chat_service = ChatRecordService()
+upload_service = UploadService()
+extraction_pipeline = get_extraction_pipeline()
+cleanup_service = get_chat_cleanup_service()
+export_service = get_chat_export_service()
 
 
-# List top 100 Chat Records
+# List Chat Records, newest first
 @router.get("/list_record")
-def  list_chats() -> List[ChatRecord]:
-    return chat_service.get_chat_records()
+def list_chats(response: Response, limit: int = 100, cursor: Optional[str] = None, agent_id: Optional[str] = None,
+               start_time: Optional[str] = None, end_time: Optional[str] = None) -> List[ChatRecord]:
+    """
+    List chat records newest first, optionally filtered by agent and creation time.
+
+    The cursor of the next page is returned in the X-Next-Cursor header and is absent on the last page.
+    """
+    limit = max(1, min(limit, CHAT_LIST_MAX_LIMIT))
+    try:
+        records, next_cursor = chat_service.list_chat_records(limit, cursor, agent_id, start_time, end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return records
+
+@router.get("/search")
+def search_chats(q: str, response: Response, limit: int = 20, cursor: Optional[int] = None,
+                 agent_id: Optional[str] = None) -> List[ChatSearchHit]:
+    """
+    Full-text search over chat history, best matches first.
+
+    Every word of the query must appear in the user message or the assistant's reply; "word*" matches a prefix.
+    The cursor of the next page is returned in the X-Next-Cursor header and is absent on the last page.
+    """
+    if chat_service.search_index is None:
+        raise HTTPException(status_code=503, detail="Chat search is disabled")
+    limit = max(1, min(limit, CHAT_SEARCH_MAX_LIMIT))
+    hits, next_cursor = chat_service.search_chats(q, limit, max(cursor or 0, 0), agent_id)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return hits
 
 @router.get("/get_chat")
 def get_chat(chat_id: str) -> ChatRecord | None:
     return chat_service.get_chat_record(chat_id)
 
 @router.get("/list_chat_responses")
-def list_chat_responses(chat_id: str) -> List[ChatResponse]:
-    return chat_service.get_all_chat_responses(chat_id)
+async def list_chat_responses(chat_id: str, cursor: Optional[int] = None, limit: Optional[int] = None,
+                              fields: str = "all") -> StreamingResponse:
+    """
+    Stream the responses of a chat as NDJSON, one ChatResponse object per line in resp_no order.
+
+    :param chat_id: The ID of the chat.
+    :param cursor: The resp_no of the last response already received, to resume an interrupted read.
+    :param limit: The maximum number of responses to return.
+    :param fields: "all", or "metadata" to omit the content of each response.
+    """
+    if fields not in ("all", "metadata"):
+        raise HTTPException(status_code=400, detail="fields must be 'all' or 'metadata'")
+    include_content = fields == "all"
+
+    async def ndjson_generator():
+        count = 0
+        async for response in chat_service.iter_chat_responses(chat_id, after=cursor, include_content=include_content):
+            if limit is not None and count >= limit:
+                break
+            data = response.model_dump() if include_content else response.model_dump(exclude={'content'})
+            yield json.dumps(data, ensure_ascii=False) + "\n"
+            count += 1
+
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
 
 # delete chat record
 @router.delete("/del_chat")
-def del_chat(chat_id: str):
-    chat_service.del_chat(chat_id)
+def del_chat(chat_id: str, background_tasks: BackgroundTasks):
+    # Remove the record right away so the chat disappears from the history, its responses in the background
+    chat_service.del_chat_record(chat_id)
+    background_tasks.add_task(chat_service.del_chat_responses, chat_id)
+
+@router.get("/cache_stats")
+def cache_stats() -> Dict[str, Any]:
+    """
+    Get the counters of the in-process chat cache of this task, including its hit rate.
+    """
+    return chat_service.cache.stats()
+
+@router.post("/delete_jobs")
+async def create_delete_job(request: Request) -> ChatDeletionJob:
+    """
+    Delete chats in bulk in the background, by ID list ("chat_ids"), agent ("agent_id") and/or creation time
+    range ("start_time", "end_time"). Poll /chat/delete_jobs/{job_id} for progress.
+    """
+    data = await request.json()
+    try:
+        return await run_in_threadpool(cleanup_service.submit, data.get("chat_ids"), data.get("agent_id"),
+                                       data.get("start_time"), data.get("end_time"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/delete_jobs/{job_id}")
+def get_delete_job(job_id: str) -> ChatDeletionJob:
+    job = cleanup_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Deletion job {job_id} not found")
+    return job
+
+@router.post("/delete_jobs/{job_id}/resume")
+def resume_delete_job(job_id: str) -> ChatDeletionJob:
+    """
+    Resume a failed deletion job from its last batch. Jobs interrupted by a restart are resumed at startup.
+    """
+    job = cleanup_service.resume(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Deletion job {job_id} not found")
+    return job
+
+@router.post("/export_jobs")
+async def create_export_job(request: Request) -> ChatExportJob:
+    """
+    Export chat records, responses, token usage and tool metrics to Parquet or Arrow files in the background,
+    partitioned by date and agent. Accepts "format" ("parquet" or "arrow"), "agent_id", "start_time" and
+    "end_time". Poll /chat/export_jobs/{job_id} for progress.
+    """
+    data = await request.json()
+    try:
+        return await run_in_threadpool(export_service.submit, data.get("format", "parquet"), data.get("agent_id"),
+                                       data.get("start_time"), data.get("end_time"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/export_jobs/{job_id}")
+def get_export_job(job_id: str) -> ChatExportJob:
+    job = export_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Export job {job_id} not found")
+    return job
+
+@router.post("/export_jobs/{job_id}/resume")
+def resume_export_job(job_id: str) -> ChatExportJob:
+    """
+    Resume an interrupted or failed export job from its last checkpoint.
+    """
+    job = export_service.resume(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Export job {job_id} not found")
+    return job
+
+def get_uploaded_file(chat_id: str) -> UploadedFile:
+    """
+    Resolve the uploaded file of a file upload chat.
+
+    :param chat_id: The chat ID returned by the upload.
+    :raises HTTPException: If the chat does not reference an uploaded file.
+    """
+    first_response = chat_service.get_chat_response(chat_id, 0)
+    uploaded = upload_service.find_upload_by_path(first_response.content) if first_response else None
+    if not uploaded:
+        raise HTTPException(status_code=404, detail=f"No uploaded file for chat {chat_id}")
+    return uploaded
+
+@router.get("/csv_profile")
+def csv_profile(chat_id: str, stratify_by: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get a compact profile of an uploaded CSV file: schema, per-column statistics and a row sample.
+    :param chat_id: The chat ID returned by the upload.
+    :param stratify_by: A column to stratify the row sample by.
+    """
+    uploaded = get_uploaded_file(chat_id)
+    if not uploaded.file_path.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="The uploaded file is not a CSV file")
+    return FileProcessor.profile_csv(uploaded.file_path, uploaded.sha256, stratify_by)
+
+@router.post("/csv_query")
+async def csv_query(request: Request) -> Dict[str, Any]:
+    """
+    Query a slice of an uploaded CSV file.
+    :param request: The request containing chat_id and optionally columns, where ({column: value}), offset and limit.
+    """
+    data = await request.json()
+    uploaded = await run_in_threadpool(get_uploaded_file, data.get("chat_id"))
+    if not uploaded.file_path.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="The uploaded file is not a CSV file")
+    try:
+        return await run_in_threadpool(
+            query_csv, uploaded.file_path, data.get("columns"), data.get("where"),
+            int(data.get("offset", 0)), min(int(data.get("limit", 100)), CSV_QUERY_MAX_ROWS)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/get_file_content")
 def get_file_content(chat_id: str) -> str:
     """
     Get file content from ChatResponse using chat_id.
-    The content is stored in the first response (resp_no=0).
+    The local path of the upload is stored in the first response (resp_no=0). If the file has been
+    extracted by the background pipeline, its normalized text is returned instead of the path.
     """
-    responses = chat_service.get_all_chat_responses(chat_id)
-    if not responses:
-        return ""
-    
-    # Get the first response which contains the S3 path
-    first_response = next((r for r in responses if r.resp_no == 0), None)
+    # The first response contains the local path
+    first_response = chat_service.get_chat_response(chat_id, 0)
     if not first_response:
         return ""
-    
-    return first_response.content
+
+    uploaded = upload_service.find_upload_by_path(first_response.content)
+    if not uploaded:
+        return first_response.content
+
+    extracted_text = upload_service.load_extracted_text(uploaded)
+    if extracted_text is None and not uploaded.extraction_status:
+        # Still parsing (or never queued), wait briefly rather than returning the path
+        extraction_pipeline.submit(uploaded)
+        result = extraction_pipeline.wait(uploaded.sha256, timeout=EXTRACTION_WAIT_SECONDS)
+        extracted_text = result['content'] if result else None
+    return extracted_text if extracted_text is not None else first_response.content
@@ -1,7 +1,8 @@
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
 
-from ..mcp.mcp import HttpMCPServer, MCPService
+from ..mcp.mcp import HttpMCPServer, MCPService, mcp_catalog
+from ..utils.catalog import catalog_response
 
 
 mcp_service = MCPService()
@@ -13,13 +14,14 @@ router = APIRouter(
 )
 
 
-@router.get("/list")
-def list_mcp_servers() -> list[HttpMCPServer]:
+@router.get("/list", response_model=list[HttpMCPServer])
+def list_mcp_servers(request: Request) -> Response:
     """
     List all MCP servers.
+    The ETag header changes with the MCP server catalog; If-None-Match with the current one gets a 304.
     :return: A list of MCP servers.
     """
-    return mcp_service.list_mcp_servers()
+    return catalog_response(request, [mcp_catalog], lambda: (mcp_service.list_mcp_servers(), {}))
 
 @router.get("/get/{server_id}")
 def get_mcp_server(server_id: str) -> HttpMCPServer | None:
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException
 from typing import List, Dict, Any
 
-from ..schedule import Schedule, ScheduleCreate, list_schedules, create_schedule, update_schedule, delete_schedule
+from ..schedule import Schedule, ScheduleCreate, list_schedules, create_schedule, update_schedule, delete_schedule, schedule_catalog
+from ..utils.catalog import catalog_response
 
 # Router definition
 router = APIRouter(
@@ -11,12 +12,14 @@ router = APIRouter(
 )
 
 @router.get("/list", response_model=List[Schedule])
-async def get_schedules() -> List[Schedule]:
+def get_schedules(request: Request) -> Response:
     """
     List all agent schedules.
+    The ETag header changes with the schedule catalog; If-None-Match with the current one gets a 304.
     :return: A list of schedules.
     """
-    return list_schedules()
+    return catalog_response(request, [schedule_catalog],
+                            lambda: ([Schedule.model_validate(item) for item in list_schedules()], {}))
 
 @router.post("/create", response_model=Schedule)
 async def create_schedule_endpoint(request: Request) -> Schedule:
@@ -2,6 +2,7 @@
 from .models import Schedule, ScheduleCreate
 from .service import (
     list_schedules,
+    schedule_catalog,
     create_schedule,
     update_schedule,
     delete_schedule,
@@ -13,6 +14,7 @@ __all__ = [
     'Schedule',
     'ScheduleCreate',
     'list_schedules',
+    'schedule_catalog',
     'create_schedule',
     'update_schedule',
     'delete_schedule',
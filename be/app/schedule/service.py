@@ -7,12 +7,14 @@ from typing import List, Dict, Any, Optional
 from fastapi import HTTPException
 
 from .models import Schedule, ScheduleCreate
+from ..storage import get_storage
+from ..utils.catalog import CatalogCache
 from ..utils.aws_config import get_aws_region
 
 # Initialize AWS clients
 aws_region = get_aws_region()
 eventbridge = boto3.client('scheduler', region_name=aws_region)
-dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+dynamodb = get_storage()
 
 # DynamoDB table name
 SCHEDULE_TABLE_NAME = "AgentScheduleTable"
@@ -23,16 +25,33 @@ LAMBDA_FUNCTION_ARN = os.environ.get('LAMBDA_FUNCTION_ARN', f"arn:aws:lambda:{aw
 SCHEDULE_ROLE_ARN = os.environ.get('SCHEDULE_ROLE_ARN', "arn:aws:iam::719135481877:role/EventBridgeSchedulerExecutionRole")
 
 
+def scan_schedules() -> List[Dict[str, Any]]:
+    """
+    Read all agent schedules from the table, oldest first.
+    :return: A list of schedules.
+    """
+    table = dynamodb.Table(SCHEDULE_TABLE_NAME)
+    items = []
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return sorted(items, key=lambda item: (item.get('createdAt', ''), item['id']))
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+# Process-wide snapshot of the schedule catalog, reloaded when a schedule is written
+schedule_catalog = CatalogCache("schedules", scan_schedules)
+
+
 def list_schedules() -> List[Dict[str, Any]]:
     """
     List all agent schedules.
     :return: A list of schedules.
     """
     try:
-        table = dynamodb.Table(SCHEDULE_TABLE_NAME)
-        response = table.scan()
-        items = response.get('Items', [])
-        return items
+        return list(schedule_catalog.get())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list schedules: {str(e)}")
 
@@ -131,6 +150,7 @@ def create_schedule(agent_id: str, cron_expression: str, user_message: str) -> D
         
         table = dynamodb.Table(SCHEDULE_TABLE_NAME)
         table.put_item(Item=schedule_item)
+        schedule_catalog.bump()
         
         return schedule_item
     except HTTPException as e:
@@ -201,6 +221,7 @@ def update_schedule(schedule_id: str, agent_id: str, cron_expression: str, user_
         }
         
         table.put_item(Item=updated_schedule)
+        schedule_catalog.bump()
         
         return updated_schedule
     except HTTPException as e:
@@ -232,6 +253,7 @@ def delete_schedule(schedule_id: str) -> Dict[str, Any]:
         
         # Delete the schedule from DynamoDB
         table.delete_item(Key={"id": schedule_id})
+        schedule_catalog.bump()
         
         return {"message": f"Schedule {schedule_id} deleted successfully"}
     except HTTPException as e:
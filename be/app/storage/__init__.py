@@ -0,0 +1,41 @@
+import os
+import threading
+from typing import Any, Optional
+
+import boto3
+
+from .schema import TABLE_SCHEMAS, TableSchema
+from .sqlite import SQLiteStorage
+from ..utils.aws_config import get_aws_region
+
+# Storage backend of the services, "dynamodb" (default) or "sqlite" for a single embedded database
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.environ.get('UPLOAD_DIR', 'uploads'), 'agentx.db'))
+# Endpoint of a DynamoDB compatible service (e.g. DynamoDB Local), empty for AWS
+DYNAMODB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT', '')
+
+_sqlite_storage: Optional[SQLiteStorage] = None
+_sqlite_lock = threading.Lock()
+
+
+def get_storage() -> Any:
+    """
+    Get the storage the services read and write their tables through.
+
+    Both backends expose the boto3 DynamoDB resource interface, i.e. ``get_storage().Table(name)``.
+
+    :return: A boto3 DynamoDB resource, or the process-wide SQLiteStorage.
+    """
+    global _sqlite_storage
+    if STORAGE_BACKEND == 'sqlite':
+        with _sqlite_lock:
+            if _sqlite_storage is None:
+                _sqlite_storage = SQLiteStorage(SQLITE_PATH)
+                print(f"Using SQLite storage at {SQLITE_PATH}")
+            return _sqlite_storage
+    if STORAGE_BACKEND != 'dynamodb':
+        raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND}, use dynamodb or sqlite")
+    return boto3.resource('dynamodb', region_name=get_aws_region(), endpoint_url=DYNAMODB_ENDPOINT or None)
+
+
+__all__ = ['get_storage', 'SQLiteStorage', 'TableSchema', 'TABLE_SCHEMAS', 'STORAGE_BACKEND']
@@ -0,0 +1,206 @@
+import re
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from boto3.dynamodb.conditions import (
+    And, AttributeBase, AttributeExists, AttributeNotExists, AttributeType, BeginsWith, Between, ConditionBase,
+    Contains, Equals, GreaterThan, GreaterThanEquals, In, LessThan, LessThanEquals, Not, NotEquals, Or, Size
+)
+from boto3.dynamodb.types import Binary
+
+_COMPARISONS = {
+    Equals: lambda a, b: a == b,
+    NotEquals: lambda a, b: a != b,
+    LessThan: lambda a, b: a < b,
+    LessThanEquals: lambda a, b: a <= b,
+    GreaterThan: lambda a, b: a > b,
+    GreaterThanEquals: lambda a, b: a >= b,
+}
+
+_MISSING = object()
+
+
+def _operand(value: Any, item: Dict[str, Any]) -> Any:
+    if isinstance(value, Size):
+        attribute = _operand(value.get_expression()['values'][0], item)
+        return _MISSING if attribute is _MISSING else len(attribute)
+    if isinstance(value, AttributeBase):
+        return item.get(value.name, _MISSING)
+    return value
+
+
+def _type_of(value: Any) -> str:
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, (int, float, Decimal)):
+        return 'N'
+    if isinstance(value, (bytes, Binary)):
+        return 'B'
+    if value is None:
+        return 'NULL'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, dict):
+        return 'M'
+    return 'SS' if all(isinstance(v, str) for v in value) else 'NS'
+
+
+def evaluate_condition(condition: Optional[ConditionBase], item: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a boto3 condition object (Key/Attr expressions) against an item, as DynamoDB would.
+
+    :param condition: The condition, None always matches.
+    :param item: The item, None if it does not exist.
+    :raises NotImplementedError: If the condition is a string expression.
+    :return: Whether the item satisfies the condition.
+    """
+    if condition is None:
+        return True
+    if not isinstance(condition, ConditionBase):
+        raise NotImplementedError("Only boto3 condition objects are supported, not string expressions")
+    item = item or {}
+    values = condition.get_expression()['values']
+
+    if isinstance(condition, And):
+        return all(evaluate_condition(value, item) for value in values)
+    if isinstance(condition, Or):
+        return any(evaluate_condition(value, item) for value in values)
+    if isinstance(condition, Not):
+        return not evaluate_condition(values[0], item)
+    if isinstance(condition, AttributeExists):
+        return _operand(values[0], item) is not _MISSING
+    if isinstance(condition, AttributeNotExists):
+        return _operand(values[0], item) is _MISSING
+
+    operands = [_operand(value, item) for value in values]
+    if any(operand is _MISSING for operand in operands):
+        return False
+    try:
+        if type(condition) in _COMPARISONS:
+            return _COMPARISONS[type(condition)](operands[0], operands[1])
+        if isinstance(condition, Between):
+            return operands[1] <= operands[0] <= operands[2]
+        if isinstance(condition, In):
+            return operands[0] in operands[1]
+        if isinstance(condition, BeginsWith):
+            return operands[0].startswith(operands[1])
+        if isinstance(condition, Contains):
+            return operands[1] in operands[0]
+        if isinstance(condition, AttributeType):
+            return _type_of(operands[0]) == operands[1]
+    except TypeError:
+        # Values of different types never compare as DynamoDB would, they simply do not match
+        return False
+    raise NotImplementedError(f"Unsupported condition {type(condition).__name__}")
+
+
+def flatten_and(condition: ConditionBase) -> List[ConditionBase]:
+    """
+    Split a conjunction into its terms.
+    """
+    if isinstance(condition, And):
+        return [term for value in condition.get_expression()['values'] for term in flatten_and(value)]
+    return [condition]
+
+
+def project(item: Dict[str, Any], projection: Optional[str], names: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Apply a ProjectionExpression of top-level attributes to an item.
+    """
+    if not projection:
+        return item
+    names = names or {}
+    attributes = [names.get(name.strip(), name.strip()) for name in projection.split(',')]
+    return {name: item[name] for name in attributes if name in item}
+
+
+_CLAUSE = re.compile(r'\b(SET|REMOVE|ADD|DELETE)\b', re.IGNORECASE)
+
+
+def _split_actions(clause: str) -> List[str]:
+    actions, depth, current = [], 0, ''
+    for char in clause:
+        if char == ',' and depth == 0:
+            actions.append(current.strip())
+            current = ''
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    if current.strip():
+        actions.append(current.strip())
+    return actions
+
+
+def _arithmetic_operator(operand: str) -> Optional[int]:
+    # Position of a "+" or "-" outside of function calls, if any
+    depth = 0
+    for position, char in enumerate(operand):
+        depth += char == '('
+        depth -= char == ')'
+        if char in '+-' and depth == 0:
+            return position
+    return None
+
+
+def apply_update(item: Dict[str, Any], expression: str, names: Optional[Dict[str, str]] = None,
+                 values: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Apply an UpdateExpression of top-level attributes to an item in place.
+
+    Supports SET (plain values, ``if_not_exists`` and ``+``/``-`` arithmetic), REMOVE, ADD (numbers and sets)
+    and DELETE (sets).
+
+    :return: The names of the updated attributes.
+    """
+    names = names or {}
+    values = values or {}
+
+    def name(token: str) -> str:
+        token = token.strip()
+        return names.get(token, token)
+
+    def value(token: str) -> Any:
+        token = token.strip()
+        match = re.fullmatch(r'if_not_exists\s*\(\s*([^,]+?)\s*,\s*(.+?)\s*\)', token)
+        if match:
+            current = item.get(name(match.group(1)))
+            return current if current is not None else value(match.group(2))
+        if token.startswith(':'):
+            return values[token]
+        return item[name(token)]
+
+    updated = []
+    parts = _CLAUSE.split(expression)
+    for keyword, clause in zip(parts[1::2], parts[2::2]):
+        keyword = keyword.upper()
+        for action in _split_actions(clause):
+            if keyword == 'SET':
+                target, operand = action.split('=', 1)
+                target = name(target)
+                operator = _arithmetic_operator(operand)
+                if operator:
+                    left, right = value(operand[:operator]), value(operand[operator + 1:])
+                    item[target] = left + right if operand[operator] == '+' else left - right
+                else:
+                    item[target] = value(operand)
+            elif keyword == 'REMOVE':
+                target = name(action)
+                item.pop(target, None)
+            else:
+                target, operand = action.split(None, 1)
+                target, operand = name(target), value(operand)
+                current = item.get(target)
+                if keyword == 'ADD':
+                    if isinstance(operand, (set, frozenset)):
+                        item[target] = set(current or set()) | operand
+                    else:
+                        item[target] = (current or 0) + operand
+                else:
+                    item[target] = set(current or set()) - operand
+                    if not item[target]:
+                        del item[target]
+            updated.append(target)
+    return updated
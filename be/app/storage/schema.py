@@ -0,0 +1,39 @@
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+class TableSchema(BaseModel):
+    """
+    The key schema of a table, mirroring the DynamoDB tables created by the CDK stacks.
+
+    Backends that do not get their schema from DynamoDB itself (e.g. SQLite) create tables and indexes from it.
+    """
+    hash_key: str
+    range_key: Optional[str] = None
+    # Type of the range key, "S" for strings or "N" for numbers
+    range_type: str = "S"
+    # Global secondary indexes as {index name: (hash key, range key)}, all keys being strings
+    indexes: Dict[str, Tuple[str, str]] = {}
+    # Attribute holding the epoch seconds after which an item expires
+    ttl_attribute: Optional[str] = None
+
+
+TABLE_SCHEMAS: Dict[str, TableSchema] = {
+    "AgentTable": TableSchema(hash_key="id"),
+    "ChatRecordTable": TableSchema(
+        hash_key="id",
+        indexes={
+            "agent_id-create_time-index": ("agent_id", "create_time"),
+            "time_bucket-create_time-index": ("time_bucket", "create_time"),
+        },
+        ttl_attribute="expire_at",
+    ),
+    "ChatResponseTable": TableSchema(hash_key="id", range_key="resp_no", range_type="N", ttl_attribute="expire_at"),
+    "ChatDeletionJobTable": TableSchema(hash_key="id", ttl_attribute="expire_at"),
+    "HttpMCPTable": TableSchema(hash_key="id"),
+    "AgentScheduleTable": TableSchema(hash_key="id"),
+    "UploadedFileTable": TableSchema(hash_key="sha256"),
+    "CatalogVersionTable": TableSchema(hash_key="id"),
+    "ChatSessionTable": TableSchema(hash_key="id", ttl_attribute="expire_at"),
+}
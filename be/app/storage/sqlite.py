@@ -0,0 +1,347 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import BeginsWith, Between, ConditionBase, Equals, GreaterThan, \
+    GreaterThanEquals, LessThan, LessThanEquals
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+from .expressions import apply_update, evaluate_condition, flatten_and, project
+from .schema import TABLE_SCHEMAS, TableSchema
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+_KEY_OPERATORS = {Equals: '=', LessThan: '<', LessThanEquals: '<=', GreaterThan: '>', GreaterThanEquals: '>='}
+
+
+def _to_json(typed: Dict[str, Any]) -> Dict[str, Any]:
+    # Binary values are not JSON serializable, store them base64 encoded
+    (tag, value), = typed.items()
+    if tag == 'B':
+        return {'B': base64.b64encode(bytes(value)).decode('ascii')}
+    if tag == 'BS':
+        return {'BS': [base64.b64encode(bytes(v)).decode('ascii') for v in value]}
+    if tag == 'L':
+        return {'L': [_to_json(v) for v in value]}
+    if tag == 'M':
+        return {'M': {k: _to_json(v) for k, v in value.items()}}
+    return typed
+
+
+def _from_json(typed: Dict[str, Any]) -> Dict[str, Any]:
+    (tag, value), = typed.items()
+    if tag == 'B':
+        return {'B': base64.b64decode(value)}
+    if tag == 'BS':
+        return {'BS': [base64.b64decode(v) for v in value]}
+    if tag == 'L':
+        return {'L': [_from_json(v) for v in value]}
+    if tag == 'M':
+        return {'M': {k: _from_json(v) for k, v in value.items()}}
+    return typed
+
+
+def encode_item(item: Dict[str, Any]) -> str:
+    """
+    Encode an item as DynamoDB-typed JSON, so it decodes to exactly what boto3 would return.
+    """
+    return json.dumps({k: _to_json(_serializer.serialize(v)) for k, v in item.items()}, separators=(',', ':'))
+
+
+def decode_item(data: str) -> Dict[str, Any]:
+    return {k: _deserializer.deserialize(_from_json(v)) for k, v in json.loads(data).items()}
+
+
+def _conditional_check_failed(operation: str) -> ClientError:
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                  'Message': 'The conditional request failed'}}, operation)
+
+
+def _key_value(value: Any) -> Any:
+    # Numeric range keys are stored as SQLite numbers so they sort numerically
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class SQLiteTable:
+    """
+    A table stored in SQLite that implements the subset of the boto3 DynamoDB Table API used by the services.
+
+    Every item is one row holding its hash key, range key and the item itself as DynamoDB-typed JSON. Secondary
+    indexes are SQLite expression indexes over the JSON.
+    """
+
+    def __init__(self, storage: "SQLiteStorage", name: str, schema: TableSchema):
+        self.storage = storage
+        self.name = name
+        self.schema = schema
+
+    # Keys and SQL helpers
+
+    def _key(self, key: Dict[str, Any]) -> Tuple[Any, Any]:
+        hash_value = key[self.schema.hash_key]
+        range_value = _key_value(key[self.schema.range_key]) if self.schema.range_key else ''
+        return hash_value, range_value
+
+    def _index_column(self, attribute: str) -> str:
+        return f"json_extract(item, '$.\"{attribute}\".S')"
+
+    def _load(self, connection: sqlite3.Connection, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = connection.execute(f'SELECT item FROM "{self.name}" WHERE pk = ? AND sk = ?', self._key(key)).fetchone()
+        return decode_item(row[0]) if row else None
+
+    def _save(self, connection: sqlite3.Connection, item: Dict[str, Any]):
+        connection.execute(f'INSERT OR REPLACE INTO "{self.name}" (pk, sk, item) VALUES (?, ?, ?)',
+                           (*self._key(item), encode_item(item)))
+
+    def _delete(self, connection: sqlite3.Connection, key: Dict[str, Any]):
+        connection.execute(f'DELETE FROM "{self.name}" WHERE pk = ? AND sk = ?', self._key(key))
+
+    # Item operations
+
+    def put_item(self, Item: Dict[str, Any], ConditionExpression: Optional[ConditionBase] = None, **kwargs) -> dict:
+        with self.storage.transaction() as connection:
+            if ConditionExpression is not None and not evaluate_condition(ConditionExpression, self._load(connection, Item)):
+                raise _conditional_check_failed('PutItem')
+            self._save(connection, Item)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def get_item(self, Key: Dict[str, Any], ProjectionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[Dict[str, str]] = None, **kwargs) -> dict:
+        item = self._load(self.storage.connection(), Key)
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if item is not None:
+            response['Item'] = project(item, ProjectionExpression, ExpressionAttributeNames)
+        return response
+
+    def delete_item(self, Key: Dict[str, Any], ConditionExpression: Optional[ConditionBase] = None,
+                    ReturnValues: str = 'NONE', **kwargs) -> dict:
+        with self.storage.transaction() as connection:
+            old = self._load(connection, Key)
+            if ConditionExpression is not None and not evaluate_condition(ConditionExpression, old):
+                raise _conditional_check_failed('DeleteItem')
+            self._delete(connection, Key)
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+        return response
+
+    def update_item(self, Key: Dict[str, Any], UpdateExpression: str,
+                    ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+                    ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                    ConditionExpression: Optional[ConditionBase] = None, ReturnValues: str = 'NONE', **kwargs) -> dict:
+        with self.storage.transaction() as connection:
+            old = self._load(connection, Key)
+            if ConditionExpression is not None and not evaluate_condition(ConditionExpression, old):
+                raise _conditional_check_failed('UpdateItem')
+            item = dict(old or Key)
+            updated = apply_update(item, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+            self._save(connection, item)
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if ReturnValues == 'ALL_NEW':
+            response['Attributes'] = item
+        elif ReturnValues == 'UPDATED_NEW':
+            response['Attributes'] = {name: item[name] for name in updated if name in item}
+        elif ReturnValues == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+        return response
+
+    def batch_writer(self, overwrite_by_pkeys: Optional[List[str]] = None) -> "SQLiteBatchWriter":
+        return SQLiteBatchWriter(self)
+
+    # Reads
+
+    def query(self, KeyConditionExpression: ConditionBase, IndexName: Optional[str] = None,
+              FilterExpression: Optional[ConditionBase] = None, ProjectionExpression: Optional[str] = None,
+              ExpressionAttributeNames: Optional[Dict[str, str]] = None, ScanIndexForward: bool = True,
+              Limit: Optional[int] = None, ExclusiveStartKey: Optional[Dict[str, Any]] = None, **kwargs) -> dict:
+        if IndexName:
+            hash_key, range_key = self.schema.indexes[IndexName]
+            hash_column, range_column = self._index_column(hash_key), self._index_column(range_key)
+            # Index entries are not unique, table keys break ties
+            order_columns = [range_column, 'pk', 'sk']
+        else:
+            hash_key, range_key = self.schema.hash_key, self.schema.range_key
+            hash_column, range_column = 'pk', 'sk'
+            order_columns = ['sk']
+
+        where, params = [], []
+        for term in flatten_and(KeyConditionExpression):
+            attribute, *operands = term.get_expression()['values']
+            column = hash_column if attribute.name == hash_key else range_column
+            operands = [_key_value(operand) for operand in operands]
+            if isinstance(term, Between):
+                where.append(f"{column} BETWEEN ? AND ?")
+                params.extend(operands)
+            elif isinstance(term, BeginsWith):
+                where.append(f"substr({column}, 1, ?) = ?")
+                params.extend([len(operands[0]), operands[0]])
+            elif type(term) in _KEY_OPERATORS:
+                where.append(f"{column} {_KEY_OPERATORS[type(term)]} ?")
+                params.append(operands[0])
+            else:
+                raise NotImplementedError(f"Unsupported key condition {type(term).__name__}")
+        if IndexName:
+            # Items without the index keys are not part of a DynamoDB index
+            where.append(f"{range_column} IS NOT NULL")
+
+        if ExclusiveStartKey:
+            table_key = self._key(ExclusiveStartKey)
+            start = [ExclusiveStartKey[range_key], *table_key] if IndexName else [table_key[1]]
+            where.append(f"({', '.join(order_columns)}) {'>' if ScanIndexForward else '<'} ({', '.join('?' * len(start))})")
+            params.extend(start)
+
+        return self._read(where, params, order_columns, ScanIndexForward, Limit, FilterExpression,
+                          ProjectionExpression, ExpressionAttributeNames, (hash_key, range_key) if IndexName else ())
+
+    def scan(self, FilterExpression: Optional[ConditionBase] = None, ProjectionExpression: Optional[str] = None,
+             ExpressionAttributeNames: Optional[Dict[str, str]] = None, Limit: Optional[int] = None,
+             ExclusiveStartKey: Optional[Dict[str, Any]] = None, **kwargs) -> dict:
+        where, params = [], []
+        if ExclusiveStartKey:
+            where.append("(pk, sk) > (?, ?)")
+            params.extend(self._key(ExclusiveStartKey))
+        return self._read(where, params, ['pk', 'sk'], True, Limit, FilterExpression, ProjectionExpression,
+                          ExpressionAttributeNames, ())
+
+    def _read(self, where: List[str], params: List[Any], order_columns: List[str], ascending: bool,
+              limit: Optional[int], filter_expression: Optional[ConditionBase], projection: Optional[str],
+              names: Optional[Dict[str, str]], index_keys: Tuple[str, ...]) -> dict:
+        direction = 'ASC' if ascending else 'DESC'
+        sql = f'SELECT item FROM "{self.name}"'
+        if where:
+            sql += f" WHERE {' AND '.join(where)}"
+        sql += f" ORDER BY {', '.join(f'{column} {direction}' for column in order_columns)}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        rows = self.storage.connection().execute(sql, params).fetchall()
+
+        # As in DynamoDB, Limit counts items read before the filter is applied
+        items = [decode_item(row[0]) for row in rows]
+        response = {
+            'Items': [project(item, projection, names) for item in items if evaluate_condition(filter_expression, item)],
+            'ScannedCount': len(items),
+            'ResponseMetadata': {'HTTPStatusCode': 200},
+        }
+        response['Count'] = len(response['Items'])
+        if limit and len(items) == limit:
+            last = items[-1]
+            last_key = {self.schema.hash_key: last[self.schema.hash_key]}
+            if self.schema.range_key:
+                last_key[self.schema.range_key] = last[self.schema.range_key]
+            for attribute in index_keys:
+                last_key[attribute] = last[attribute]
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+
+class SQLiteBatchWriter:
+    """
+    Buffers puts and deletes and writes them in one transaction per flush, like boto3's batch_writer.
+    """
+
+    def __init__(self, table: SQLiteTable, flush_amount: int = 500):
+        self.table = table
+        self.flush_amount = flush_amount
+        self.operations: List[Tuple[str, Dict[str, Any]]] = []
+
+    def put_item(self, Item: Dict[str, Any]):
+        self.operations.append(('put', Item))
+        if len(self.operations) >= self.flush_amount:
+            self.flush()
+
+    def delete_item(self, Key: Dict[str, Any]):
+        self.operations.append(('delete', Key))
+        if len(self.operations) >= self.flush_amount:
+            self.flush()
+
+    def flush(self):
+        with self.table.storage.transaction() as connection:
+            for operation, value in self.operations:
+                if operation == 'put':
+                    self.table._save(connection, value)
+                else:
+                    self.table._delete(connection, value)
+        self.operations = []
+
+    def __enter__(self) -> "SQLiteBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        # Take the write lock up front so read-modify-write operations are atomic across threads and processes
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SQLiteStorage:
+    """
+    An embedded storage backend keeping all tables in one SQLite database in WAL mode.
+
+    Each thread gets its own connection, so reads run concurrently with each other and with the single writer.
+    Tables and indexes are created from TABLE_SCHEMAS on first use; expired items (see TableSchema.ttl_attribute)
+    are purged when a table is opened, standing in for DynamoDB TTL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.tables: Dict[str, SQLiteTable] = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def transaction(self) -> _Transaction:
+        return _Transaction(self.connection())
+
+    def Table(self, name: str) -> SQLiteTable:
+        with self.lock:
+            table = self.tables.get(name)
+            if table is None:
+                if name not in TABLE_SCHEMAS:
+                    raise ValueError(f"Unknown table {name}, add its schema to TABLE_SCHEMAS")
+                table = SQLiteTable(self, name, TABLE_SCHEMAS[name])
+                self._create(table)
+                self.tables[name] = table
+            return table
+
+    def _create(self, table: SQLiteTable):
+        connection = self.connection()
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{table.name}" '
+                           f'(pk TEXT NOT NULL, sk NOT NULL, item TEXT NOT NULL, PRIMARY KEY (pk, sk)) WITHOUT ROWID')
+        for index_name, (hash_key, range_key) in table.schema.indexes.items():
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{table.name}.{index_name}" ON "{table.name}" '
+                               f'({table._index_column(hash_key)}, {table._index_column(range_key)})')
+        if table.schema.ttl_attribute:
+            expired = connection.execute(
+                f'DELETE FROM "{table.name}" WHERE CAST(json_extract(item, \'$."{table.schema.ttl_attribute}".N\') '
+                f'AS INTEGER) < ?', (int(time.time()),))
+            if expired.rowcount:
+                print(f"Purged {expired.rowcount} expired items from {table.name}")
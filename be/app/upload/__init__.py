@@ -0,0 +1,17 @@
+# This file makes the upload directory a Python package
+from .models import UploadedFile, PresignedUpload
+from .streaming import StreamingUploader
+from .service import UploadService, UploadReleased, hash_fileobj
+from .extraction import ExtractionPipeline, extract_file, get_extraction_pipeline
+
+__all__ = [
+    'UploadedFile',
+    'PresignedUpload',
+    'StreamingUploader',
+    'UploadService',
+    'UploadReleased',
+    'hash_fileobj',
+    'ExtractionPipeline',
+    'extract_file',
+    'get_extraction_pipeline'
+]
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from .models import UploadedFile
+from .service import UploadService
+from ..utils.doc_index import DocumentIndex
+from ..utils.file_processor import FileProcessor
+
+EXTRACTION_THREADS = int(os.environ.get('EXTRACTION_THREADS', 4))
+EXTRACTION_PROCESSES = int(os.environ.get('EXTRACTION_PROCESSES', 2))
+EXTRACTION_MAX_PENDING = int(os.environ.get('EXTRACTION_MAX_PENDING', 64))
+
+# Formats whose parsing is CPU bound and would hold the GIL for long stretches
+PROCESS_POOL_FORMATS = {'.docx', '.csv'}
+
+
+def extract_file(file_path: str, sha256: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Extract normalized text and metadata from a file.
+
+    Defined at module level so it can run in a worker process.
+
+    :param file_path: The local path of the file.
+    :param sha256: The hex digest of the file content, used as the extraction cache key.
+    :return: A dict with 'content', 'type' and 'metadata', or None if the format is not supported.
+    """
+    result = FileProcessor.process_file(file_path, sha256)
+    if result is None:
+        return None
+    content = FileProcessor.normalize_text(result['content'])
+    metadata = dict(result.get('metadata', {}))
+    metadata['chars'] = len(content)
+    return {'content': content, 'type': result['type'], 'metadata': metadata}
+
+
+class ExtractionPipeline:
+    """
+    Extract text from uploaded files in the background so it is ready before the first prompt.
+
+    Jobs run on a bounded thread pool, or on a process pool for CPU-heavy formats. The extracted text and a
+    retrieval index over it are written next to the upload and its metadata is recorded on the UploadedFile
+    item. At most ``max_pending`` jobs are queued at once; uploads beyond that are extracted on demand instead.
+    """
+
+    def __init__(self, upload_service: UploadService, threads: int = EXTRACTION_THREADS,
+                 processes: int = EXTRACTION_PROCESSES, max_pending: int = EXTRACTION_MAX_PENDING):
+        self.upload_service = upload_service
+        self.thread_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="extraction")
+        self.processes = processes
+        self.process_pool = self._new_process_pool()
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Future] = {}
+
+    def submit(self, uploaded: UploadedFile) -> Optional[Future]:
+        """
+        Queue text extraction for an uploaded file.
+
+        :param uploaded: The uploaded file, whose local copy must exist when the job runs.
+        :return: The job future, or None if the file is already extracted or the queue is full.
+        """
+        if uploaded.extraction_status:
+            return None
+        with self.lock:
+            job = self.jobs.get(uploaded.sha256)
+            if job:
+                return job
+            if not self.slots.acquire(blocking=False):
+                print(f"Extraction queue full, skipping {uploaded.file_path}")
+                return None
+            job = self.thread_pool.submit(self._run, uploaded)
+            self.jobs[uploaded.sha256] = job
+        # Outside the lock: a job that already finished runs the callback right away, on this thread
+        job.add_done_callback(lambda done: self._finish(uploaded.sha256, done))
+        return job
+
+    def wait(self, sha256: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for an in-flight extraction job.
+
+        :param sha256: The hex digest of the file content.
+        :param timeout: The maximum number of seconds to wait.
+        :return: The extraction result, or None if there is no job or it did not finish in time.
+        """
+        job = self.jobs.get(sha256)
+        if not job:
+            return None
+        try:
+            return job.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def _new_process_pool(self) -> ProcessPoolExecutor:
+        # Workers are spawned rather than forked, forking a process that runs threads is unsafe
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def _finish(self, sha256: str, job: Future):
+        with self.lock:
+            if self.jobs.get(sha256) is job:
+                del self.jobs[sha256]
+        self.slots.release()
+
+    def _run(self, uploaded: UploadedFile) -> Optional[Dict[str, Any]]:
+        file_ext = os.path.splitext(uploaded.file_path)[1].lower()
+        try:
+            if file_ext in PROCESS_POOL_FORMATS:
+                result = self.process_pool.submit(extract_file, uploaded.file_path, uploaded.sha256).result()
+            else:
+                result = extract_file(uploaded.file_path, uploaded.sha256)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM), replace the pool so later jobs can still run
+            print(f"Error extracting {uploaded.file_path}: {str(e)}")
+            with self.lock:
+                self.process_pool = self._new_process_pool()
+            self.upload_service.set_extraction(uploaded.sha256, "failed")
+            return None
+        except Exception as e:
+            print(f"Error extracting {uploaded.file_path}: {str(e)}")
+            self.upload_service.set_extraction(uploaded.sha256, "failed")
+            return None
+
+        if result is None:
+            self.upload_service.set_extraction(uploaded.sha256, "unsupported")
+            return None
+
+        extracted_path = f"{os.path.splitext(uploaded.file_path)[0]}.extracted.txt"
+        tmp_path = f"{extracted_path}.part"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(result['content'])
+        os.replace(tmp_path, extracted_path)
+        # Index the text for retrieval, so agents can fetch relevant chunks instead of the whole document
+        index = DocumentIndex.from_text(result['content'])
+        index.save(self.upload_service.index_path(uploaded))
+
+        metadata = {'type': result['type'], 'chunks': len(index.chunks), **result['metadata']}
+        if not self.upload_service.set_extraction(uploaded.sha256, "done", extracted_path, metadata):
+            # The file was released meanwhile, its release already removed the files that existed then
+            for path in (extracted_path, self.upload_service.index_path(uploaded)):
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"Discarded extraction of released file {uploaded.file_path}")
+            return None
+        print(f"Extracted {metadata['chars']} chars from {uploaded.file_path}")
+        return result
+
+
+_pipeline: Optional[ExtractionPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_extraction_pipeline() -> ExtractionPipeline:
+    """
+    Get the process-wide extraction pipeline, creating it on first use.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ExtractionPipeline(UploadService())
+        return _pipeline
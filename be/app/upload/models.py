@@ -0,0 +1,30 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class UploadedFile(BaseModel):
+    """Model representing a content-addressed uploaded file."""
+    sha256: str
+    size: int
+    filename: str
+    content_type: Optional[str] = None
+    s3_path: str
+    file_path: str
+    chat_id: str
+    ref_count: int = 1
+    extracted_path: Optional[str] = None
+    extraction_status: Optional[str] = None
+    extraction_metadata: Optional[Dict[str, Any]] = None
+    create_time: str
+
+class PresignedUpload(BaseModel):
+    """Model describing how a client should upload a file directly to S3."""
+    sha256: str
+    s3_path: str
+    generation: Optional[str] = None
+    method: str = "PUT"
+    urls: List[str] = []
+    headers: Dict[str, str] = {}
+    upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    deduplicated: bool = False
+    uploaded: Optional[UploadedFile] = None
@@ -0,0 +1,479 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import BinaryIO, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from .models import UploadedFile, PresignedUpload
+from .streaming import StreamingUploader, DEFAULT_PART_SIZE, DEFAULT_MAX_CONCURRENCY
+from ..storage import get_storage
+
+# S3 bucket, key prefix and local directory for uploaded files
+UPLOAD_BUCKET = os.environ.get('UPLOAD_BUCKET', 'a-web-uw2')
+UPLOAD_KEY_PREFIX = os.environ.get('UPLOAD_KEY_PREFIX', 'agentx')
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', '/Users/anbei/Desktop/AgentX/be/uploads')
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', DEFAULT_PART_SIZE))
+UPLOAD_MAX_CONCURRENCY = int(os.environ.get('UPLOAD_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+UPLOAD_PRESIGN_EXPIRES = int(os.environ.get('UPLOAD_PRESIGN_EXPIRES', 3600))
+
+MAX_PARTS = 10000
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Times a stored file is recorded again when the content it lost the race to was released in between
+SAVE_UPLOAD_ATTEMPTS = 3
+
+
+def hash_fileobj(fileobj: BinaryIO, chunk_size: int = HASH_CHUNK_SIZE) -> Tuple[str, int]:
+    """
+    Compute the SHA-256 digest and size of a seekable file object, then rewind it.
+
+    :param fileobj: The file object to hash.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A tuple of (hex digest, size in bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while chunk := fileobj.read(chunk_size):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+class UploadReleased(Exception):
+    """
+    Raised when a stored file kept losing the race to be recorded to concurrent uploads of the same content, which
+    were released again every time. The stored copy is deleted, so the file must be uploaded again.
+    """
+
+    def __init__(self, sha256: str):
+        super().__init__(f"Upload {sha256} was released repeatedly while it was being stored, upload it again")
+        self.sha256 = sha256
+
+
+class UploadService:
+    """
+    A service to store uploaded files in Amazon S3 and on the local disk.
+
+    Files are content-addressed by their SHA-256 digest and reference counted in Amazon DynamoDB, so
+    uploading the same bytes again only bumps the reference count and returns the existing paths.
+    Every stored copy gets its own generation in its S3 key and local path, so deleting a released copy never
+    touches the copy of a concurrent upload of the same content.
+    """
+
+    uploaded_file_table_name = "UploadedFileTable"
+
+    def __init__(self):
+        self.dynamodb = get_storage()
+        self.bucket = UPLOAD_BUCKET
+        self.uploader = StreamingUploader(self.bucket, part_size=UPLOAD_PART_SIZE,
+                                          max_concurrency=UPLOAD_MAX_CONCURRENCY)
+
+    @staticmethod
+    def check_sha256(sha256: str):
+        """
+        Check that a client supplied digest is a hex SHA-256 digest before it is used in keys and paths.
+
+        :raises ValueError: If it is not.
+        """
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            raise ValueError("sha256 must be a lowercase hex SHA-256 digest")
+
+    @staticmethod
+    def new_generation() -> str:
+        """
+        Create the generation of a new stored copy.
+        """
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def content_key(sha256: str, filename: str, generation: str) -> str:
+        """
+        Build the content-addressed name of a stored copy, keeping the original extension for file processors.
+
+        :raises ValueError: If the generation is not one created by new_generation.
+        """
+        if len(generation) != 32 or any(c not in "0123456789abcdef" for c in generation):
+            raise ValueError("generation must be the one returned by /upload/presign")
+        return f"{sha256}.{generation}{os.path.splitext(filename)[1].lower()}"
+
+    def save_upload(self, fileobj: BinaryIO, filename: str, chat_id: str,
+                    content_type: Optional[str] = None) -> Tuple[UploadedFile, bool]:
+        """
+        Store an uploaded file, reusing the existing copy if the same content was uploaded before.
+
+        This call blocks, run it in a worker thread from async handlers.
+
+        :param fileobj: The seekable uploaded file object to read from.
+        :param filename: The original file name.
+        :param chat_id: The chat ID to associate with the file if it is new.
+        :param content_type: The Content-Type of the upload.
+        :return: A tuple of (UploadedFile, created) where created is False for a deduplicated upload.
+        """
+        sha256, size = hash_fileobj(fileobj)
+        existing = self.acquire_upload(sha256)
+        if existing:
+            print(f"Deduplicated upload {filename} -> {existing.s3_path} (refs: {existing.ref_count})")
+            return existing, False
+
+        s3_key, local_file_path = self.content_location(sha256, filename, self.new_generation())
+        self.uploader.upload(fileobj, s3_key, local_file_path, content_type)
+        print(f"Uploaded {size} bytes to s3://{self.bucket}/{s3_key}, local copy at {local_file_path}")
+        return self.register_upload(UploadedFile(
+            sha256=sha256,
+            size=size,
+            filename=filename,
+            content_type=content_type,
+            s3_path=f's3://{self.bucket}/{s3_key}',
+            file_path=local_file_path,
+            chat_id=chat_id,
+            create_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ))
+
+    def content_location(self, sha256: str, filename: str, generation: str) -> Tuple[str, str]:
+        """
+        Get the content-addressed S3 key and local path of a stored copy.
+
+        :param sha256: The hex digest of the file content.
+        :param filename: The original file name.
+        :param generation: The generation of the stored copy.
+        :return: A tuple of (s3_key, local_file_path).
+        """
+        name = self.content_key(sha256, filename, generation)
+        return f'{UPLOAD_KEY_PREFIX}/cas/{name}', os.path.join(UPLOAD_DIR, 'cas', name)
+
+    def staging_key(self, sha256: str, filename: str, generation: str) -> str:
+        """
+        Get the S3 key presigned multipart uploads are written to until their content is verified.
+        """
+        return f'{UPLOAD_KEY_PREFIX}/staging/{self.content_key(sha256, filename, generation)}'
+
+    def register_upload(self, uploaded: UploadedFile) -> Tuple[UploadedFile, bool]:
+        """
+        Record a stored copy in Amazon DynamoDB, or take a reference on the content if it is already known and
+        delete the now redundant copy.
+
+        :param uploaded: The UploadedFile to record.
+        :raises UploadReleased: If the content was recorded and released by concurrent uploads on every attempt.
+        :return: A tuple of (UploadedFile, created) where created is False for a deduplicated upload.
+        """
+        table = self.dynamodb.Table(self.uploaded_file_table_name)
+        for _ in range(SAVE_UPLOAD_ATTEMPTS):
+            try:
+                table.put_item(Item=uploaded.model_dump(exclude_none=True),
+                               ConditionExpression=Attr('sha256').not_exists())
+                return uploaded, True
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+            # A concurrent upload of the same content won the race, unless it was released since
+            existing = self.acquire_upload(uploaded.sha256)
+            if existing is not None:
+                self.delete_content(uploaded)
+                return existing, False
+        self.delete_content(uploaded)
+        raise UploadReleased(uploaded.sha256)
+
+    def presign_upload(self, sha256: str, filename: str, size: int,
+                       content_type: Optional[str] = None) -> PresignedUpload:
+        """
+        Issue presigned URLs so a client can upload a file directly to S3.
+
+        Content that is already stored is deduplicated immediately and no URLs are issued. Files up to one
+        part in size get a single presigned PUT, which carries the SHA-256 checksum so S3 rejects content that
+        does not match the declared digest. Larger files get a multipart upload with one URL per part, to a
+        staging key: S3 has no full-object SHA-256 for multipart uploads, so the content is hashed when the
+        upload is completed and only then copied to its content-addressed key.
+
+        :param sha256: The hex digest of the file content, computed by the client.
+        :param filename: The original file name.
+        :param size: The file size in bytes.
+        :param content_type: The Content-Type of the file.
+        :raises ValueError: If the digest is not a hex SHA-256 digest.
+        :return: A PresignedUpload describing how to upload the file, its generation must be passed to
+            complete_presigned_upload.
+        """
+        self.check_sha256(sha256)
+        existing = self.acquire_upload(sha256)
+        if existing:
+            return PresignedUpload(sha256=sha256, s3_path=existing.s3_path, deduplicated=True, uploaded=existing)
+
+        generation = self.new_generation()
+        s3_key, _ = self.content_location(sha256, filename, generation)
+        s3 = self.uploader.s3
+        extra_args = {'ContentType': content_type} if content_type else {}
+        if size <= UPLOAD_PART_SIZE:
+            checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+            url = s3.generate_presigned_url(
+                'put_object',
+                Params={'Bucket': self.bucket, 'Key': s3_key, 'ChecksumSHA256': checksum, **extra_args},
+                ExpiresIn=UPLOAD_PRESIGN_EXPIRES
+            )
+            headers = {'x-amz-checksum-sha256': checksum, **({'Content-Type': content_type} if content_type else {})}
+            return PresignedUpload(sha256=sha256, s3_path=f's3://{self.bucket}/{s3_key}', generation=generation,
+                                   urls=[url], headers=headers)
+
+        # S3 allows at most 10,000 parts per upload
+        part_size = max(UPLOAD_PART_SIZE, math.ceil(size / MAX_PARTS))
+        staging_key = self.staging_key(sha256, filename, generation)
+        upload_id = s3.create_multipart_upload(Bucket=self.bucket, Key=staging_key, **extra_args)['UploadId']
+        urls = [
+            s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': self.bucket, 'Key': staging_key, 'UploadId': upload_id, 'PartNumber': part_number},
+                ExpiresIn=UPLOAD_PRESIGN_EXPIRES
+            )
+            for part_number in range(1, math.ceil(size / part_size) + 1)
+        ]
+        return PresignedUpload(sha256=sha256, s3_path=f's3://{self.bucket}/{s3_key}', generation=generation,
+                               upload_id=upload_id, part_size=part_size, urls=urls)
+
+    def complete_presigned_upload(self, sha256: str, filename: str, generation: str, chat_id: str,
+                                  content_type: Optional[str] = None, upload_id: Optional[str] = None,
+                                  parts: Optional[List[dict]] = None) -> Tuple[UploadedFile, bool]:
+        """
+        Finish a presigned upload and record the stored file.
+
+        :param sha256: The hex digest the upload was presigned for.
+        :param filename: The original file name.
+        :param generation: The generation returned by presign_upload.
+        :param chat_id: The chat ID to associate with the file if it is new.
+        :param content_type: The Content-Type of the file.
+        :param upload_id: The multipart upload ID, or None for a single-part upload.
+        :param parts: The uploaded parts as a list of {"PartNumber", "ETag"} for a multipart upload.
+        :raises ValueError: If the digest or the generation is malformed, or the multipart upload is missing its parts or its
+            content does not match sha256.
+        :raises UploadReleased: If the content was released by concurrent uploads while the upload was recorded.
+        :return: A tuple of (UploadedFile, created) where created is False for a deduplicated upload.
+        """
+        self.check_sha256(sha256)
+        s3_key, local_file_path = self.content_location(sha256, filename, generation)
+        s3 = self.uploader.s3
+        if upload_id:
+            if not parts:
+                raise ValueError("parts are required to complete a multipart upload")
+            parts = sorted(({'PartNumber': int(p['PartNumber']), 'ETag': p['ETag']} for p in parts),
+                           key=lambda p: p['PartNumber'])
+            staging_key = self.staging_key(sha256, filename, generation)
+            s3.complete_multipart_upload(Bucket=self.bucket, Key=staging_key, UploadId=upload_id,
+                                         MultipartUpload={'Parts': parts})
+            try:
+                etag = self._verify_staged_upload(staging_key, sha256, local_file_path)
+                # Copy exactly the object that was hashed, even if the staging key was written again meanwhile
+                s3.copy({'Bucket': self.bucket, 'Key': staging_key}, self.bucket, s3_key,
+                        ExtraArgs={'CopySourceIfMatch': etag})
+            finally:
+                s3.delete_object(Bucket=self.bucket, Key=staging_key)
+        size = s3.head_object(Bucket=self.bucket, Key=s3_key)['ContentLength']
+
+        return self.register_upload(UploadedFile(
+            sha256=sha256,
+            size=size,
+            filename=filename,
+            content_type=content_type,
+            s3_path=f's3://{self.bucket}/{s3_key}',
+            file_path=local_file_path,
+            chat_id=chat_id,
+            create_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ))
+
+    def _verify_staged_upload(self, staging_key: str, sha256: str, local_file_path: str) -> str:
+        """
+        Hash a staged upload while downloading it as the local copy, so the content is only read once.
+
+        :raises ValueError: If the content does not match sha256, in which case no local copy is kept.
+        :return: The ETag of the object that was hashed.
+        """
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        tmp_path = f"{local_file_path}.{uuid.uuid4().hex}.part"
+        response = self.uploader.s3.get_object(Bucket=self.bucket, Key=staging_key)
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response['Body'].iter_chunks(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != sha256:
+                raise ValueError(f"Uploaded content does not match sha256 {sha256}")
+            os.replace(tmp_path, local_file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return response['ETag']
+
+    def fetch_local_copy(self, uploaded: UploadedFile):
+        """
+        Download an uploaded file from S3 to its local path if it is not there yet.
+
+        :param uploaded: The uploaded file.
+        """
+        if os.path.exists(uploaded.file_path):
+            return
+        os.makedirs(os.path.dirname(uploaded.file_path), exist_ok=True)
+        s3_key = uploaded.s3_path.split('/', 3)[3]
+        tmp_path = f"{uploaded.file_path}.part"
+        self.uploader.s3.download_file(self.bucket, s3_key, tmp_path)
+        os.replace(tmp_path, uploaded.file_path)
+        print(f"Fetched local copy of {uploaded.s3_path} to {uploaded.file_path}")
+
+    def get_upload(self, sha256: str) -> Optional[UploadedFile]:
+        """
+        Retrieve an uploaded file by its SHA-256 digest.
+
+        :param sha256: The hex digest of the file content.
+        :return: An UploadedFile object if found, otherwise None.
+        """
+        response = self.dynamodb.Table(self.uploaded_file_table_name).get_item(Key={'sha256': sha256})
+        item = response.get('Item')
+        if item:
+            return UploadedFile.model_validate(item)
+        return None
+
+    def acquire_upload(self, sha256: str) -> Optional[UploadedFile]:
+        """
+        Increment the reference count of an uploaded file if it exists.
+
+        :param sha256: The hex digest of the file content.
+        :return: The updated UploadedFile object, or None if the content is unknown.
+        """
+        table = self.dynamodb.Table(self.uploaded_file_table_name)
+        try:
+            response = table.update_item(
+                Key={'sha256': sha256},
+                UpdateExpression="ADD ref_count :one",
+                ConditionExpression=Attr('sha256').exists(),
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise
+        return UploadedFile.model_validate(response['Attributes'])
+
+    def release_upload(self, sha256: str) -> bool:
+        """
+        Decrement the reference count of an uploaded file and delete it once it is no longer referenced.
+
+        :param sha256: The hex digest of the file content.
+        :return: True if the file content was deleted, False otherwise.
+        """
+        table = self.dynamodb.Table(self.uploaded_file_table_name)
+        try:
+            response = table.update_item(
+                Key={'sha256': sha256},
+                UpdateExpression="ADD ref_count :minus_one",
+                ConditionExpression=Attr('sha256').exists(),
+                ExpressionAttributeValues={':minus_one': -1},
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+        uploaded = UploadedFile.model_validate(response['Attributes'])
+        if uploaded.ref_count > 0:
+            return False
+
+        try:
+            table.delete_item(Key={'sha256': sha256}, ConditionExpression=Attr('ref_count').lte(0))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                # Re-acquired by a concurrent upload
+                return False
+            raise
+        # Only this generation is stored under these paths, a concurrent upload of the content has its own
+        self.delete_content(uploaded)
+        print(f"Deleted uploaded file {sha256}")
+        return True
+
+    def delete_content(self, uploaded: UploadedFile):
+        """
+        Delete the S3 object, local copy and derived files of a stored copy.
+
+        :param uploaded: The stored copy, no longer recorded in Amazon DynamoDB.
+        """
+        s3_key = uploaded.s3_path.split('/', 3)[3]
+        self.uploader.s3.delete_object(Bucket=self.bucket, Key=s3_key)
+        for path in (uploaded.file_path, uploaded.extracted_path, self.index_path(uploaded)):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def find_upload_by_path(self, file_path: str) -> Optional[UploadedFile]:
+        """
+        Retrieve the uploaded file stored at a local path.
+
+        :param file_path: The local path of a content-addressed upload.
+        :return: An UploadedFile object if the path belongs to a known upload, otherwise None.
+        """
+        sha256 = os.path.basename(file_path).split('.', 1)[0]
+        uploaded = self.get_upload(sha256) if len(sha256) == 64 else None
+        if uploaded and uploaded.file_path == file_path:
+            return uploaded
+        return None
+
+    def set_extraction(self, sha256: str, status: str, extracted_path: Optional[str] = None,
+                       metadata: Optional[dict] = None) -> bool:
+        """
+        Record the text extraction state of an uploaded file.
+
+        :param sha256: The hex digest of the file content.
+        :param status: The extraction status, one of "done", "failed" or "unsupported".
+        :param extracted_path: The local path of the extracted text, if any.
+        :param metadata: The extraction metadata, e.g. pages, rows or encoding.
+        :return: True if recorded, False if the file was released while it was being extracted.
+        """
+        names = {'#status': 'extraction_status'}
+        values = {':status': status}
+        update = "SET #status = :status"
+        if extracted_path:
+            names['#path'] = 'extracted_path'
+            values[':path'] = extracted_path
+            update += ", #path = :path"
+        if metadata:
+            names['#meta'] = 'extraction_metadata'
+            values[':meta'] = json.loads(json.dumps(metadata), parse_float=Decimal)
+            update += ", #meta = :meta"
+        try:
+            self.dynamodb.Table(self.uploaded_file_table_name).update_item(
+                Key={'sha256': sha256},
+                UpdateExpression=update,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                # Do not recreate the item of a file released while it was being extracted
+                ConditionExpression=Attr('sha256').exists()
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        return True
+
+    @staticmethod
+    def index_path(uploaded: UploadedFile) -> str:
+        """
+        Get the local path of the retrieval index built from an uploaded file.
+        """
+        return f"{os.path.splitext(uploaded.file_path)[0]}.index.json"
+
+    @staticmethod
+    def load_extracted_text(uploaded: UploadedFile) -> Optional[str]:
+        """
+        Read the cached extracted text of an uploaded file, if any.
+
+        :param uploaded: The uploaded file.
+        :return: The extracted text, or None if the file has not been extracted yet.
+        """
+        if uploaded.extracted_path and os.path.exists(uploaded.extracted_path):
+            with open(uploaded.extracted_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        return None
@@ -0,0 +1,121 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+import boto3
+
+from ..utils.aws_config import get_aws_region
+
+# S3 requires every part except the last one to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class StreamingUploader:
+    """
+    Stream a file-like object to S3 and to a local file in a single pass.
+
+    The source is read in part-sized chunks. Each chunk is written to the local copy and handed to a
+    thread pool that uploads it as an S3 multipart part. At most ``max_concurrency`` parts are in flight
+    at once, so memory stays bounded at roughly ``(max_concurrency + 1) * part_size`` regardless of the
+    file size. Files smaller than one part are sent with a single ``put_object`` call.
+
+    All methods are blocking and are meant to be run off the event loop (e.g. ``run_in_threadpool``).
+    """
+
+    def __init__(self, bucket: str, part_size: int = DEFAULT_PART_SIZE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, s3_client=None):
+        self.bucket = bucket
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.s3 = s3_client or boto3.client('s3', region_name=get_aws_region())
+
+    def upload(self, fileobj: BinaryIO, s3_key: str, local_path: Optional[str] = None,
+               content_type: Optional[str] = None) -> int:
+        """
+        Upload ``fileobj`` to ``s3://{bucket}/{s3_key}`` and optionally mirror it to ``local_path``.
+
+        :param fileobj: A readable binary file-like object, e.g. ``UploadFile.file``.
+        :param s3_key: The S3 object key to write.
+        :param local_path: Where to write the local copy, or None to skip it.
+        :param content_type: The Content-Type to store on the S3 object.
+        :return: The number of bytes uploaded.
+        """
+        extra_args = {'ContentType': content_type} if content_type else {}
+        local_file = None
+        if local_path:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            local_file = open(local_path, "wb")
+
+        try:
+            first_chunk = fileobj.read(self.part_size)
+            if local_file:
+                local_file.write(first_chunk)
+
+            next_chunk = fileobj.read(self.part_size) if len(first_chunk) == self.part_size else b""
+            if not next_chunk:
+                # Small file: one request is cheaper than a multipart upload
+                self.s3.put_object(Bucket=self.bucket, Key=s3_key, Body=first_chunk, **extra_args)
+                return len(first_chunk)
+
+            return len(first_chunk) + self._upload_multipart(fileobj, s3_key, local_file, extra_args,
+                                                              first_chunk, next_chunk)
+        except Exception:
+            if local_file:
+                local_file.close()
+                local_file = None
+                os.remove(local_path)
+            raise
+        finally:
+            if local_file:
+                local_file.close()
+
+    def _upload_multipart(self, fileobj: BinaryIO, s3_key: str, local_file, extra_args: dict,
+                          first_chunk: bytes, next_chunk: bytes) -> int:
+        """
+        Upload the remainder of ``fileobj`` as a multipart upload whose first part is ``first_chunk``.
+
+        :return: The number of bytes uploaded after ``first_chunk``.
+        """
+        upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=s3_key, **extra_args)['UploadId']
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+        futures = []
+        total = 0
+
+        def upload_part(part_number: int, data: bytes) -> dict:
+            try:
+                resp = self.s3.upload_part(Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+                                           PartNumber=part_number, Body=data)
+                return {'PartNumber': part_number, 'ETag': resp['ETag']}
+            finally:
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                slots.acquire()
+                futures.append(executor.submit(upload_part, 1, first_chunk))
+                part_number = 2
+                chunk = next_chunk
+                while chunk:
+                    if local_file:
+                        local_file.write(chunk)
+                    total += len(chunk)
+                    # Blocks until a part finishes once max_concurrency parts are in flight
+                    slots.acquire()
+                    futures.append(executor.submit(upload_part, part_number, chunk))
+                    part_number += 1
+                    chunk = fileobj.read(self.part_size)
+                    # Fail fast instead of streaming the rest of the file after a part failed
+                    for f in futures:
+                        if f.done() and f.exception():
+                            raise f.exception()
+                parts = [f.result() for f in futures]
+
+            self.s3.complete_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+            return total
+        except Exception:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id)
+            raise
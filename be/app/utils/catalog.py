@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from ..storage import get_storage
+
+# How often a cached catalog checks the shared version for writes made by other tasks
+CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', 1))
+# How long a rendered catalog response is reused by other requests for the same catalog versions
+CATALOG_RESPONSE_CACHE_SECONDS = float(os.environ.get('CATALOG_RESPONSE_CACHE_SECONDS', 30))
+CATALOG_RESPONSE_CACHE_SIZE = 256
+
+T = TypeVar('T')
+
+
+class CatalogVersionService:
+    """
+    A service to manage the version counters of catalogs (agents, MCP servers, schedules).
+
+    Every write to a catalog bumps its counter, so a reader can tell whether its copy of the catalog is current
+    with one small consistent read instead of reading the catalog itself.
+    """
+
+    dynamodb_table_name = "CatalogVersionTable"
+
+    def __init__(self):
+        self.dynamodb = get_storage()
+
+    def get_version(self, catalog: str) -> int:
+        """
+        Get the current version of a catalog.
+
+        :param catalog: The name of the catalog.
+        :return: The version, 0 if the catalog was never written.
+        """
+        table = self.dynamodb.Table(self.dynamodb_table_name)
+        response = table.get_item(Key={'id': catalog}, ConsistentRead=True)
+        return int(response['Item']['version']) if 'Item' in response else 0
+
+    def bump(self, catalog: str) -> int:
+        """
+        Increment the version of a catalog after a write.
+
+        :param catalog: The name of the catalog.
+        :return: The new version.
+        """
+        table = self.dynamodb.Table(self.dynamodb_table_name)
+        response = table.update_item(
+            Key={'id': catalog},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['version'])
+
+
+class CatalogCache(Generic[T]):
+    """
+    A process-wide snapshot of a catalog, rebuilt only when the catalog's version changes.
+
+    The shared version is checked at most every CATALOG_VERSION_CHECK_SECONDS, so writes made by other tasks
+    become visible within that interval and writes made through ``bump`` immediately, applied to the snapshot
+    in memory when possible. Snapshots are shared by all callers and must be treated as read-only.
+    """
+
+    def __init__(self, catalog: str, load: Callable[[], T], check_seconds: float = CATALOG_VERSION_CHECK_SECONDS):
+        self.catalog = catalog
+        self.load = load
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.value: Optional[T] = None
+        self.version: Optional[int] = None
+        self.next_check = 0.0
+        self._versions: Optional[CatalogVersionService] = None
+
+    @property
+    def versions(self) -> CatalogVersionService:
+        # Created on first use, so that defining a cache at import time does not touch the store
+        if self._versions is None:
+            self._versions = CatalogVersionService()
+        return self._versions
+
+    def get(self) -> T:
+        """
+        Get the current snapshot, reloading the catalog if its version changed.
+        """
+        with self.lock:
+            self._refresh()
+            return self.value
+
+    def current_version(self) -> int:
+        """
+        Get the version of the current snapshot, checking the shared version if it is due.
+        """
+        with self.lock:
+            self._refresh()
+            return self.version
+
+    def bump(self, update: Optional[Callable[[T], Optional[T]]] = None) -> int:
+        """
+        Record a write to the catalog: bump the shared version and apply the write to the snapshot.
+
+        Writes are bumped after they are stored, so two writes can bump in the opposite order to the one they
+        were stored in; an update must therefore be order-aware, e.g. compare item versions, and return None
+        when it cannot tell. Catalogs without versioned items should bump without an update.
+
+        :param update: Returns the snapshot with the write applied, without modifying the snapshot it is given,
+            or None if the write cannot be ordered against it. It is only used if no other write was bumped since
+            the snapshot was loaded; otherwise, without an update or if it returns None, the catalog is reloaded
+            on next access.
+        :return: The new version.
+        """
+        version = self.versions.bump(self.catalog)
+        with self.lock:
+            value = update(self.value) if update is not None and self.value is not None \
+                and self.version == version - 1 else None
+            if value is not None:
+                self.value = value
+                self.version = version
+            else:
+                self.next_check = 0.0
+        return version
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.value is not None and now < self.next_check:
+            return
+        # Read the version before the catalog, so a write racing with the load bumps it past the stored version
+        version = self.versions.get_version(self.catalog)
+        if self.value is None or version != self.version:
+            self.value = self.load()
+            self.version = version
+        self.next_check = now + self.check_seconds
+
+
+class CatalogResponseCache:
+    """
+    A short-lived cache of rendered catalog responses, shared by all requests of the process.
+
+    Entries are keyed by the response's ETag, which is derived from the versions of the catalogs it was rendered
+    from, so an entry never outlives a write; the time limit only bounds the memory held by idle entries.
+    """
+
+    def __init__(self, ttl_seconds: float = CATALOG_RESPONSE_CACHE_SECONDS,
+                 max_entries: int = CATALOG_RESPONSE_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, Tuple[float, bytes, Dict[str, str]]] = OrderedDict()
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """
+        Get the body and headers of a cached response, None if it is not cached or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(etag)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[etag]
+                return None
+            self.entries.move_to_end(etag)
+            return entry[1], entry[2]
+
+    def put(self, etag: str, body: bytes, headers: Dict[str, str]):
+        with self.lock:
+            self.entries[etag] = (time.monotonic() + self.ttl_seconds, body, headers)
+            self.entries.move_to_end(etag)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+catalog_responses = CatalogResponseCache()
+
+
+def catalog_etag(request: Request, versions: List[int]) -> str:
+    """
+    The strong ETag of a catalog response: the same request over the same catalog versions renders the same body.
+    """
+    variant = f"{request.url.path}?{sorted(request.query_params.multi_items())}|{versions}"
+    return '"' + hashlib.sha256(variant.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, a client or proxy may have marked our tag as weak
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def catalog_response(request: Request, catalogs: List[CatalogCache],
+                     render: Callable[[], Tuple[Any, Dict[str, str]]]) -> Response:
+    """
+    Serve a response rendered from catalogs, conditionally on the catalogs' versions.
+
+    The ETag is derived from the versions, which are checked without reading the catalogs. A request whose
+    If-None-Match holds the current ETag gets a 304 without a body, and a rendered body is shared by all requests
+    for the same versions for CATALOG_RESPONSE_CACHE_SECONDS.
+
+    :param request: The request, whose path and query parameters select what is rendered.
+    :param catalogs: The catalogs the response is rendered from.
+    :param render: Renders the content of the response and its extra headers.
+    :return: The response.
+    """
+    versions = [catalog.current_version() for catalog in catalogs]
+    etag = catalog_etag(request, versions)
+    # Clients may keep the response but must revalidate it, which costs them a 304 while nothing changed
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        cached = catalog_responses.get(etag)
+        return Response(status_code=304, headers={**headers, **(cached[1] if cached else {})})
+
+    cached = catalog_responses.get(etag)
+    if cached is None:
+        content, extra_headers = render()
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+        if [catalog.current_version() for catalog in catalogs] != versions:
+            # A catalog changed while rendering, the body may not match the ETag
+            return Response(body, media_type="application/json", headers=extra_headers)
+        cached = body, extra_headers
+        catalog_responses.put(etag, *cached)
+    return Response(cached[0], media_type="application/json", headers={**headers, **cached[1]})
@@ -0,0 +1,262 @@
+import csv
+import io
+import math
+import os
+import random
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .file_processor import detect_encoding
+
+# Rows parsed and profiled per batch
+BATCH_ROWS = int(os.environ.get('CSV_PROFILE_BATCH_ROWS', 10000))
+TOP_K = 5
+SAMPLE_ROWS = 20
+# Distinct values tracked per column before the long tail is pruned
+MAX_TRACKED_VALUES = 5000
+# Strata kept for stratified sampling, further values share one "other" stratum
+MAX_STRATA = 50
+NULL_VALUES = {'', 'na', 'n/a', 'nan', 'null', 'none', '-'}
+BOOL_VALUES = {'true', 'false', 'yes', 'no', 't', 'f'}
+
+
+def _value_type(value: str) -> str:
+    lowered = value.lower()
+    if lowered in BOOL_VALUES:
+        return 'bool'
+    try:
+        int(value)
+        return 'int'
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return 'float'
+    except ValueError:
+        pass
+    try:
+        datetime.fromisoformat(value)
+        return 'datetime'
+    except ValueError:
+        return 'string'
+
+
+def _widen(current: Optional[str], new: str) -> str:
+    # A column widens from the most specific type that fits all values seen so far
+    if current is None or current == new:
+        return new
+    # int and float mix into float, anything else mixed falls back to string
+    if {current, new} == {'int', 'float'}:
+        return 'float'
+    return 'string'
+
+
+class ColumnProfile:
+    """
+    Running statistics of one CSV column, updated one batch of values at a time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.type: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.total = 0.0
+        self.numeric = 0
+        # Numeric and text bounds are kept apart, a numeric column may widen to string in a later batch
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.text_min: Optional[str] = None
+        self.text_max: Optional[str] = None
+        self.values: Counter = Counter()
+
+    def update(self, values: List[str]):
+        present = [v for v in values if v.strip().lower() not in NULL_VALUES]
+        self.count += len(values)
+        self.nulls += len(values) - len(present)
+        if not present:
+            return
+
+        if self.type != 'string':
+            for value_type in {_value_type(v) for v in present}:
+                self.type = _widen(self.type, value_type)
+
+        if self.type in ('int', 'float'):
+            numbers = [float(v) for v in present]
+            self.total += math.fsum(numbers)
+            self.numeric += len(numbers)
+            batch_min, batch_max = min(numbers), max(numbers)
+            self.min = batch_min if self.min is None else min(self.min, batch_min)
+            self.max = batch_max if self.max is None else max(self.max, batch_max)
+        batch_min, batch_max = min(present), max(present)
+        self.text_min = batch_min if self.text_min is None else min(self.text_min, batch_min)
+        self.text_max = batch_max if self.text_max is None else max(self.text_max, batch_max)
+
+        self.values.update(present)
+        if len(self.values) > MAX_TRACKED_VALUES:
+            # Keep the heavy hitters only, top-k of the long tail becomes approximate
+            self.values = Counter(dict(self.values.most_common(MAX_TRACKED_VALUES // 2)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        column_type = self.type or 'string'
+        profile = {
+            'name': self.name,
+            'type': column_type,
+            'nulls': self.nulls,
+            'distinct': len(self.values) if len(self.values) < MAX_TRACKED_VALUES // 2 else f">={len(self.values)}",
+            'top': [[value, count] for value, count in self.values.most_common(TOP_K)],
+        }
+        if column_type in ('int', 'float') and self.min is not None:
+            profile['min'] = int(self.min) if column_type == 'int' else self.min
+            profile['max'] = int(self.max) if column_type == 'int' else self.max
+            profile['mean'] = round(self.total / self.numeric, 6) if self.numeric else None
+        elif self.text_min is not None:
+            profile['min'] = self.text_min
+            profile['max'] = self.text_max
+        return profile
+
+
+class CsvProfiler:
+    """
+    Build a compact profile of a CSV file without loading it into memory.
+
+    Rows are parsed in batches and each batch is transposed into columns, so every column is profiled
+    with one pass over a list of values: inferred type, null count, min/max/mean and top-k values. A row
+    sample is drawn with reservoir sampling, stratified by ``stratify_by`` if given (one reservoir per
+    value), otherwise uniformly.
+    """
+
+    def __init__(self, file_path: str, stratify_by: Optional[str] = None, sample_rows: int = SAMPLE_ROWS,
+                 batch_rows: int = BATCH_ROWS, seed: int = 0):
+        self.file_path = file_path
+        self.stratify_by = stratify_by
+        self.sample_rows = sample_rows
+        self.batch_rows = batch_rows
+        self.random = random.Random(seed)
+
+    def profile(self) -> Dict[str, Any]:
+        """
+        Profile the CSV file.
+
+        :return: A dict with the encoding, row count, per-column profiles and a row sample.
+        """
+        with open(self.file_path, 'rb') as raw:
+            encoding = detect_encoding(raw)
+            with io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='') as file:
+                reader = csv.reader(file)
+                header = next(reader, [])
+                columns = [ColumnProfile(name) for name in header]
+                strata_index = header.index(self.stratify_by) if self.stratify_by in header else None
+                reservoirs: Dict[str, list] = {}
+                seen: Counter = Counter()
+                rows = 0
+
+                batch = []
+                for row in reader:
+                    batch.append(row)
+                    if len(batch) >= self.batch_rows:
+                        self._profile_batch(batch, columns, rows, strata_index, reservoirs, seen)
+                        rows += len(batch)
+                        batch = []
+                if batch:
+                    self._profile_batch(batch, columns, rows, strata_index, reservoirs, seen)
+                    rows += len(batch)
+
+        # Share the sample evenly between strata
+        quota = max(1, self.sample_rows // max(len(reservoirs), 1))
+        picked = [item for reservoir in reservoirs.values()
+                  for item in self.random.sample(reservoir, min(quota, len(reservoir)))]
+        sample = [row for _, row in sorted(picked)]
+        return {
+            'encoding': encoding,
+            'rows': rows,
+            'columns': [column.to_dict() for column in columns],
+            'sample': sample,
+            'stratified_by': self.stratify_by if strata_index is not None else None,
+        }
+
+    def _profile_batch(self, batch: List[List[str]], columns: List[ColumnProfile], offset: int,
+                       strata_index: Optional[int], reservoirs: Dict[str, list], seen: Counter):
+        width = len(columns)
+        # Pad or cut ragged rows so the batch transposes into one list per column
+        normalized = [row[:width] + [''] * (width - len(row)) for row in batch]
+        for column, values in zip(columns, zip(*normalized)):
+            column.update(list(values))
+
+        per_stratum = self.sample_rows
+        for i, row in enumerate(normalized):
+            stratum = row[strata_index] if strata_index is not None else ''
+            if stratum not in reservoirs and len(reservoirs) >= MAX_STRATA:
+                stratum = '__other__'
+            seen[stratum] += 1
+            reservoir = reservoirs.setdefault(stratum, [])
+            # Algorithm R: keep row n with probability k/n, tagged with its position for stable output
+            if len(reservoir) < per_stratum:
+                reservoir.append((offset + i, row))
+            else:
+                j = self.random.randrange(seen[stratum])
+                if j < per_stratum:
+                    reservoir[j] = (offset + i, row)
+
+    @staticmethod
+    def to_text(profile: Dict[str, Any]) -> str:
+        """
+        Render a profile as compact text for a model prompt.
+        """
+        lines = [f"CSV profile: {profile['rows']} rows, {len(profile['columns'])} columns, "
+                 f"encoding {profile['encoding']}"]
+        for column in profile['columns']:
+            stats = [f"type={column['type']}", f"nulls={column['nulls']}", f"distinct={column['distinct']}"]
+            for key in ('min', 'max', 'mean'):
+                if column.get(key) is not None:
+                    stats.append(f"{key}={column[key]}")
+            top = ', '.join(f"{value} ({count})" for value, count in column['top'])
+            lines.append(f"- {column['name']}: {' '.join(stats)}; top: {top}")
+        if profile['sample']:
+            header = ','.join(column['name'] for column in profile['columns'])
+            stratified = f", stratified by {profile['stratified_by']}" if profile.get('stratified_by') else ''
+            lines.append(f"Sample rows{stratified}:")
+            lines.append(header)
+            lines.extend(','.join(row) for row in profile['sample'])
+        return '\n'.join(lines)
+
+
+def query_csv(file_path: str, columns: Optional[List[str]] = None, where: Optional[Dict[str, str]] = None,
+              offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """
+    Return a slice of a CSV file, streaming over it rather than loading it.
+
+    :param file_path: The local path of the CSV file.
+    :param columns: The columns to return, all columns if None.
+    :param where: Equality filters as {column: value}; rows must match all of them.
+    :param offset: The number of matching rows to skip.
+    :param limit: The maximum number of rows to return.
+    :raises ValueError: If a requested column does not exist.
+    :return: A dict with 'columns', 'rows' and 'has_more'.
+    """
+    with open(file_path, 'rb') as raw:
+        encoding = detect_encoding(raw)
+        with io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            columns = columns or header
+            where = where or {}
+            unknown = [c for c in list(columns) + list(where) if c not in header]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+            selected = [header.index(c) for c in columns]
+            filters = [(header.index(c), v) for c, v in where.items()]
+
+            rows = []
+            matched = 0
+            for row in reader:
+                if any(i >= len(row) or row[i] != v for i, v in filters):
+                    continue
+                matched += 1
+                if matched <= offset:
+                    continue
+                if len(rows) == limit:
+                    return {'columns': columns, 'rows': rows, 'has_more': True}
+                rows.append([row[i] if i < len(row) else '' for i in selected])
+    return {'columns': columns, 'rows': rows, 'has_more': False}
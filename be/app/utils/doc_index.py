@@ -0,0 +1,138 @@
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
+
+# Characters per indexed chunk and overlap between consecutive chunks
+INDEX_CHUNK_CHARS = int(os.environ.get('DOC_INDEX_CHUNK_CHARS', 1500))
+INDEX_CHUNK_OVERLAP = 200
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+WORD_PATTERN = re.compile(r'[^\W\d_]+|\d+', re.UNICODE)
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase index terms.
+
+    Words are split on non-letters. CJK text has no word separators, so runs of CJK characters are
+    indexed as overlapping character bigrams instead.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.search(word):
+            terms.extend(word if len(word) == 1 else [a + b for a, b in zip(word, word[1:])])
+        else:
+            terms.append(word)
+    return terms
+
+
+def split_chunks(text: str, chunk_chars: int = INDEX_CHUNK_CHARS, overlap: int = INDEX_CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping chunks, preferably on paragraph or line breaks.
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            cut = max(text.rfind('\n\n', start + chunk_chars // 2, end), text.rfind('\n', start + chunk_chars // 2, end))
+            if cut > start:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        # Start the overlap on a word boundary
+        start = max(end - overlap, start + 1)
+        space = text.find(' ', start, end)
+        if space != -1:
+            start = space + 1
+    return chunks
+
+
+class DocumentIndex:
+    """
+    A BM25 inverted index over the chunks of one document.
+
+    The index is small enough to be kept as a JSON file next to the upload it was built from.
+    """
+
+    def __init__(self, chunks: List[str], postings: Dict[str, List[List[int]]], lengths: List[int]):
+        self.chunks = chunks
+        self.postings = postings
+        self.lengths = lengths
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, chunks: Iterable[str]) -> "DocumentIndex":
+        """
+        Build an index from document chunks.
+        """
+        chunks = list(chunks)
+        postings: Dict[str, List[List[int]]] = {}
+        lengths = []
+        for chunk_id, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append([chunk_id, tf])
+        return cls(chunks, postings, lengths)
+
+    @classmethod
+    def from_text(cls, text: str) -> "DocumentIndex":
+        return cls.build(split_chunks(text))
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most relevant to a query.
+
+        :param query: The search query.
+        :param top_k: The maximum number of chunks to return.
+        :return: A list of {"chunk_id", "score", "text"} sorted by descending score.
+        """
+        n = len(self.chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[chunk_id] / (self.avg_length or 1))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{'chunk_id': chunk_id, 'score': round(score, 4), 'text': self.chunks[chunk_id]}
+                for chunk_id, score in ranked]
+
+    def save(self, path: str):
+        """
+        Write the index to a JSON file atomically.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': self.chunks, 'postings': self.postings, 'lengths': self.lengths}, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "DocumentIndex":
+        """
+        Load an index from a JSON file, reusing recently loaded indexes.
+        """
+        return _load_index(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=32)
+def _load_index(path: str, mtime: float) -> DocumentIndex:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return DocumentIndex(data['chunks'], data['postings'], data['lengths'])
@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import boto3
+
+from .aws_config import get_aws_region
+
+EXTRACTION_CACHE_DIR = os.environ.get('EXTRACTION_CACHE_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'agentx', 'extraction-cache'))
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+# Optional S3 location shared by all BE tasks, e.g. "my-bucket" and "agentx/extraction-cache"
+EXTRACTION_CACHE_S3_BUCKET = os.environ.get('EXTRACTION_CACHE_S3_BUCKET', '')
+EXTRACTION_CACHE_S3_PREFIX = os.environ.get('EXTRACTION_CACHE_S3_PREFIX', 'agentx/extraction-cache')
+
+
+class ExtractionCache:
+    """
+    A persistent cache of file extraction results keyed by content hash and processor version.
+
+    Entries are JSON files in a local directory, evicted least-recently-used first once the directory
+    grows beyond ``max_bytes``. Recency is tracked through file modification times, so it survives
+    restarts; the size accounting is per process and therefore approximate when several worker processes
+    share the directory. If an S3 bucket is configured, local misses fall back to S3 and new entries are
+    written through to it, letting all tasks share one cache.
+    """
+
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES,
+                 s3_bucket: str = EXTRACTION_CACHE_S3_BUCKET, s3_prefix: str = EXTRACTION_CACHE_S3_PREFIX):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.s3 = boto3.client('s3', region_name=get_aws_region()) if s3_bucket else None
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def cache_key(sha256: str, version: int, kind: str = '') -> str:
+        return f"{sha256}-{kind}-v{version}" if kind else f"{sha256}-v{version}"
+
+    def get(self, sha256: str, version: int, kind: str = '') -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached extraction result.
+
+        :param sha256: The hex digest of the file content.
+        :param version: The version of the processor that produced the result.
+        :param kind: The kind of result, for processors that produce more than one (e.g. "csv-profile").
+        :return: The cached result, or None on a miss.
+        """
+        key = self.cache_key(sha256, version, kind)
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = self._get_from_s3(key)
+            if result is not None:
+                self._write_local(key, result)
+            return result
+
+        os.utime(path)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return result
+
+    def put(self, sha256: str, version: int, result: Dict[str, Any], kind: str = ''):
+        """
+        Store an extraction result.
+
+        :param sha256: The hex digest of the file content.
+        :param version: The version of the processor that produced the result.
+        :param result: The JSON-serializable extraction result.
+        :param kind: The kind of result, for processors that produce more than one (e.g. "csv-profile").
+        """
+        key = self.cache_key(sha256, version, kind)
+        self._write_local(key, result)
+        if self.s3:
+            try:
+                self.s3.put_object(Bucket=self.s3_bucket, Key=f"{self.s3_prefix}/{key}.json",
+                                   Body=json.dumps(result).encode('utf-8'), ContentType='application/json')
+            except Exception as e:
+                print(f"Error writing extraction cache entry {key} to S3: {str(e)}")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def _write_local(self, key: str, result: Dict[str, Any]):
+        path = self._path(key)
+        data = json.dumps(result).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and self.entries:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def _get_from_s3(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.s3:
+            return None
+        try:
+            response = self.s3.get_object(Bucket=self.s3_bucket, Key=f"{self.s3_prefix}/{key}.json")
+            return json.loads(response['Body'].read())
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            print(f"Error reading extraction cache entry {key} from S3: {str(e)}")
+            return None
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """
+    Get the process-wide extraction cache, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+        return _cache
@@ -1,67 +1,297 @@
+import codecs
+import hashlib
+import io
 import os
-from typing import Dict, Optional
+import re
+from typing import Any, Dict, Iterator, Optional
 import docx
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
 import csv
 import chardet
 
+from .extraction_cache import get_extraction_cache
+
+# Default chunk size and overall budget of the chunked readers
+CHUNK_CHARS = int(os.environ.get('FILE_PROCESSOR_CHUNK_CHARS', 8000))
+MAX_BYTES = int(os.environ.get('FILE_PROCESSOR_MAX_BYTES', 16 * 1024 * 1024))
+MAX_TOKENS = int(os.environ.get('FILE_PROCESSOR_MAX_TOKENS', 1000000))
+APPROX_CHARS_PER_TOKEN = 4
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# CSV files larger than this are profiled rather than extracted as full text
+CSV_PROFILE_THRESHOLD_BYTES = int(os.environ.get('CSV_PROFILE_THRESHOLD_BYTES', 1024 * 1024))
+READ_BLOCK_BYTES = 64 * 1024
+
+def detect_encoding(file) -> str:
+    """
+    Detect the encoding of a binary file object from a bounded sample, then rewind it.
+    """
+    sample = file.read(ENCODING_SAMPLE_BYTES)
+    file.seek(0)
+    encoding = chardet.detect(sample)['encoding'] or 'utf-8'
+    # An ASCII sample says nothing about the rest of the file, UTF-8 is the safe superset
+    if encoding.lower() == 'ascii':
+        encoding = 'utf-8'
+    return encoding
+
 class FileProcessor:
+    # Bump whenever the output of a processor changes, so cached results are not reused
+    PROCESSOR_VERSION = 3
+    SUPPORTED_EXTENSIONS = ('.docx', '.txt', '.csv')
+
     @staticmethod
-    def process_file(file_path: str) -> Optional[Dict[str, str]]:
+    def process_file(file_path: str, sha256: Optional[str] = None, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
-        Process different types of files and return their content
+        Process different types of files and return their content.
+        Results are cached on disk by content hash, so the same content is only parsed once.
+
+        :param file_path: The local path of the file.
+        :param sha256: The hex digest of the file content, computed from the file if not given.
+        :param use_cache: Whether to read and write the extraction cache.
         """
         file_ext = os.path.splitext(file_path)[1].lower()
-        
+        if file_ext not in FileProcessor.SUPPORTED_EXTENSIONS:
+            return None
+
         try:
+            cache = get_extraction_cache() if use_cache else None
+            if cache:
+                sha256 = sha256 or FileProcessor.file_sha256(file_path)
+                cached = cache.get(sha256, FileProcessor.PROCESSOR_VERSION, FileProcessor._cache_kind(file_ext))
+                if cached is not None:
+                    return cached
+
             if file_ext == '.docx':
-                return FileProcessor._process_docx(file_path)
+                result = FileProcessor._process_docx(file_path)
             elif file_ext == '.txt':
-                return FileProcessor._process_txt(file_path)
-            elif file_ext == '.csv':
-                return FileProcessor._process_csv(file_path)
+                result = FileProcessor._process_txt(file_path)
             else:
-                return None
+                result = FileProcessor._process_csv(file_path)
+            if cache:
+                cache.put(sha256, FileProcessor.PROCESSOR_VERSION, result, FileProcessor._cache_kind(file_ext))
+            return result
         except Exception as e:
             print(f"Error processing file: {str(e)}")
             return None
 
     @staticmethod
-    def _process_docx(file_path: str) -> Dict[str, str]:
-        doc = docx.Document(file_path)
-        content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+    def _cache_kind(file_ext: str) -> str:
+        # The same bytes parse differently per extension and per configured limit, so both are part of the key
+        kind = f"{file_ext.lstrip('.')}-b{MAX_BYTES}-t{MAX_TOKENS}"
+        if file_ext == '.csv':
+            kind += f"-p{CSV_PROFILE_THRESHOLD_BYTES}"
+        return kind
+
+    @staticmethod
+    def file_sha256(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            while chunk := file.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def normalize_text(content: str) -> str:
+        """
+        Normalize extracted text: unify line endings, strip trailing whitespace and collapse blank line runs
+        """
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        content = re.sub(r'[ \t]+\n', '\n', content)
+        content = re.sub(r'\n{3,}', '\n\n', content)
+        return content.strip()
+
+    @staticmethod
+    def _process_docx(file_path: str) -> Dict[str, Any]:
+        reader = ChunkReader(file_path)
+        content = ''.join(reader)
         return {
             'content': content,
             'type': 'docx',
-            'prompt': 'This is a Word document. Please analyze its content:'
+            'prompt': 'This is a Word document. Please analyze its content:',
+            'metadata': reader.metadata
         }
 
     @staticmethod
-    def _process_txt(file_path: str) -> Dict[str, str]:
-        # Detect encoding
-        with open(file_path, 'rb') as file:
-            raw_data = file.read()
-            result = chardet.detect(raw_data)
-            encoding = result['encoding']
+    def _process_txt(file_path: str) -> Dict[str, Any]:
+        reader = ChunkReader(file_path)
+        content = ''.join(reader)
+        return {
+            'content': content,
+            'type': 'txt',
+            'prompt': 'This is a text file. Please analyze its content:',
+            'metadata': reader.metadata
+        }
+
+    @staticmethod
+    def profile_csv(file_path: str, sha256: Optional[str] = None, stratify_by: Optional[str] = None,
+                    use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Profile a CSV file: schema, per-column statistics and a row sample, cached by content hash.
 
-        with open(file_path, 'r', encoding=encoding) as file:
-            content = file.read()
+        :param file_path: The local path of the CSV file.
+        :param sha256: The hex digest of the file content, computed from the file if not given.
+        :param stratify_by: A column to stratify the row sample by.
+        :param use_cache: Whether to read and write the extraction cache.
+        :return: The profile dict, see CsvProfiler.profile.
+        """
+        from .csv_profiler import CsvProfiler
+
+        cache = get_extraction_cache() if use_cache else None
+        kind = f"csv-profile-{stratify_by}" if stratify_by else "csv-profile"
+        if cache:
+            sha256 = sha256 or FileProcessor.file_sha256(file_path)
+            cached = cache.get(sha256, FileProcessor.PROCESSOR_VERSION, kind)
+            if cached is not None:
+                return cached
+        profile = CsvProfiler(file_path, stratify_by=stratify_by).profile()
+        if cache:
+            cache.put(sha256, FileProcessor.PROCESSOR_VERSION, profile, kind)
+        return profile
+
+    @staticmethod
+    def _process_csv(file_path: str) -> Dict[str, Any]:
+        # Large CSV files are summarized instead of dumped, the full text would not fit a prompt anyway
+        if os.path.getsize(file_path) > CSV_PROFILE_THRESHOLD_BYTES:
+            from .csv_profiler import CsvProfiler
+
+            profile = FileProcessor.profile_csv(file_path, use_cache=False)
             return {
-                'content': content,
-                'type': 'txt',
-                'prompt': 'This is a text file. Please analyze its content:'
+                'content': CsvProfiler.to_text(profile),
+                'type': 'csv',
+                'prompt': 'This is a profile of a large CSV file. Please analyze it:',
+                'metadata': {'encoding': profile['encoding'], 'rows': profile['rows'],
+                             'columns': len(profile['columns']), 'mode': 'profile'}
             }
 
-    @staticmethod
-    def _process_csv(file_path: str) -> Dict[str, str]:
-        rows = []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            for row in csv_reader:
-                rows.append(','.join(row))
-        
-        content = '\n'.join(rows)
+        reader = ChunkReader(file_path)
+        content = ''.join(reader)
         return {
             'content': content,
             'type': 'csv',
-            'prompt': 'This is a CSV file. Please analyze its content:'
+            'prompt': 'This is a CSV file. Please analyze its content:',
+            'metadata': reader.metadata
         }
+
+
+class ChunkReader:
+    """
+    Read a file as a stream of bounded-size text chunks.
+
+    The encoding is detected from a bounded sample and the file is decoded incrementally, so memory is
+    bounded by the chunk size rather than the file size. Reading stops once ``max_bytes`` of UTF-8 output
+    or ``max_tokens`` estimated tokens have been produced; ``metadata['truncated']`` tells whether the file
+    was cut short. The remaining metadata (encoding, lines, rows, paragraphs...) covers what was read.
+
+    Usage::
+
+        reader = ChunkReader(path, chunk_chars=8000)
+        for chunk in reader:
+            ...
+        print(reader.metadata)
+    """
+
+    def __init__(self, file_path: str, chunk_chars: int = CHUNK_CHARS, max_bytes: int = MAX_BYTES,
+                 max_tokens: int = MAX_TOKENS):
+        self.file_path = file_path
+        self.chunk_chars = max(chunk_chars, 1)
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.metadata: Dict[str, Any] = {}
+        self.bytes_out = 0
+
+    def __iter__(self) -> Iterator[str]:
+        file_ext = os.path.splitext(self.file_path)[1].lower()
+        if file_ext == '.docx':
+            pieces = self._docx_pieces()
+        elif file_ext == '.csv':
+            pieces = self._csv_pieces()
+        else:
+            pieces = self._text_pieces()
+
+        self.metadata['truncated'] = False
+        buffer = []
+        buffered = 0
+        for piece in pieces:
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered < self.chunk_chars:
+                continue
+            text = ''.join(buffer)
+            # Emit whole chunks, preferably ending on a line break, and keep the remainder buffered
+            while len(text) >= self.chunk_chars:
+                cut = text.rfind('\n', self.chunk_chars // 2, self.chunk_chars) + 1 or self.chunk_chars
+                chunk = self._within_budget(text[:cut])
+                if chunk:
+                    yield chunk
+                if self.metadata['truncated']:
+                    return
+                text = text[cut:]
+            buffer = [text]
+            buffered = len(text)
+
+        chunk = self._within_budget(''.join(buffer))
+        if chunk:
+            yield chunk
+
+    def _within_budget(self, chunk: str) -> str:
+        """
+        Cut a chunk down to the remaining byte and token budget, marking the read as truncated if needed.
+        """
+        max_bytes = min(self.max_bytes, self.max_tokens * APPROX_CHARS_PER_TOKEN)
+        size = len(chunk.encode('utf-8'))
+        if self.bytes_out + size > max_bytes:
+            remaining = max(max_bytes - self.bytes_out, 0)
+            chunk = chunk.encode('utf-8')[:remaining].decode('utf-8', errors='ignore')
+            size = len(chunk.encode('utf-8'))
+            self.metadata['truncated'] = True
+        self.bytes_out += size
+        return chunk
+
+    def _detect_encoding(self, file) -> str:
+        encoding = detect_encoding(file)
+        self.metadata['encoding'] = encoding
+        return encoding
+
+    def _text_pieces(self) -> Iterator[str]:
+        lines = 0
+        with open(self.file_path, 'rb') as file:
+            decoder = codecs.getincrementaldecoder(self._detect_encoding(file))(errors='replace')
+            while block := file.read(READ_BLOCK_BYTES):
+                text = decoder.decode(block)
+                lines += text.count('\n')
+                self.metadata['lines'] = lines + 1
+                yield text
+            yield decoder.decode(b'', final=True)
+
+    def _csv_pieces(self) -> Iterator[str]:
+        rows = 0
+        with open(self.file_path, 'rb') as raw:
+            encoding = self._detect_encoding(raw)
+            with io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='') as file:
+                for row in csv.reader(file):
+                    rows += 1
+                    self.metadata['rows'] = rows
+                    yield ','.join(row) + '\n'
+
+    def _docx_pieces(self) -> Iterator[str]:
+        doc = docx.Document(self.file_path)
+        self.metadata['encoding'] = 'utf-8'
+        self.metadata['tables'] = len(doc.tables)
+        pages = self._docx_page_count(doc)
+        if pages is not None:
+            self.metadata['pages'] = pages
+        paragraphs = 0
+        for element in doc.element.body.iterchildren(qn('w:p')):
+            paragraphs += 1
+            self.metadata['paragraphs'] = paragraphs
+            yield Paragraph(element, doc).text + '\n'
+
+    @staticmethod
+    def _docx_page_count(doc) -> Optional[int]:
+        # Page count is only known if the authoring application recorded it
+        for rel in doc.part.package.rels.values():
+            if rel.reltype.endswith('/extended-properties'):
+                match = re.search(rb'<Pages>(\d+)</Pages>', rel.target_part.blob)
+                if match:
+                    return int(match.group(1))
+        return None
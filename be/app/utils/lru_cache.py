@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+# Tags whose invalidations are counted, beyond it the counters are reset and a new generation starts
+MAX_TRACKED_TAG_VERSIONS = 100000
+
+
+class LRUCache:
+    """
+    A thread-safe in-process cache bounded by total size, evicting least-recently-used entries first.
+
+    Entries can be tagged (e.g. with a chat ID) so that every entry derived from one object is invalidated
+    together when that object is written. An optional TTL bounds staleness against writes made by other
+    processes, which cannot invalidate this cache. Hits, misses and evictions are counted for metrics.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0, sizeof: Callable[[Any], int] = lambda value: 1):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof
+        self.lock = threading.Lock()
+        # key -> (value, size, tag, expires)
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.tags: Dict[Hashable, Set[Hashable]] = {}
+        self.total_bytes = 0
+        # Invalidations per tag, so readers can detect a write to the object they read that raced with their
+        # read. Writes to other objects do not affect them. The generation is bumped when all counters reset.
+        self.tag_versions: Dict[Hashable, int] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        :param key: The cache key.
+        :return: The cached value, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (entry[3] and entry[3] < time.monotonic()):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def version(self, tag: Hashable) -> Tuple[int, int]:
+        """
+        Get the invalidation version of a tag, to pass as ``if_version`` when storing a value read after it.
+        """
+        with self.lock:
+            return self.generation, self.tag_versions.get(tag, 0)
+
+    def put(self, key: Hashable, value: Any, tag: Optional[Hashable] = None,
+            if_version: Optional[Tuple[int, int]] = None):
+        """
+        Store a value, evicting least-recently-used entries if the cache grows beyond its size.
+
+        :param key: The cache key.
+        :param value: The value, which must not be None.
+        :param tag: The tag to invalidate the entry by.
+        :param if_version: Only store the value if the tag was not invalidated since ``version(tag)`` returned
+            this, i.e. since the value was read from the source.
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0
+        with self.lock:
+            if if_version is not None and if_version != (self.generation, self.tag_versions.get(tag, 0)):
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, tag, expires)
+            self.total_bytes += size
+            if tag is not None:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, tag: Hashable):
+        """
+        Remove all entries stored with a tag.
+        """
+        with self.lock:
+            if tag not in self.tag_versions and len(self.tag_versions) >= MAX_TRACKED_TAG_VERSIONS:
+                self._new_generation()
+            self.tag_versions[tag] = self.tag_versions.get(tag, 0) + 1
+            for key in list(self.tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self._new_generation()
+            self.entries.clear()
+            self.tags.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the cache counters, including the hit rate since start.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _new_generation(self):
+        # Values read before now can no longer be checked against their tag's counter, so none are stored
+        self.generation += 1
+        self.tag_versions.clear()
+
+    def _remove(self, key: Hashable):
+        _, size, tag, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        if tag is not None:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
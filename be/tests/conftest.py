@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# Run the services against the embedded SQLite backend and local payload storage, set before app modules import
+_data_dir = tempfile.mkdtemp(prefix="agentx-tests-")
+os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+os.environ.setdefault('UPLOAD_DIR', _data_dir)
+os.environ.setdefault('SQLITE_PATH', os.path.join(_data_dir, 'agentx.db'))
+os.environ.setdefault('CHAT_PAYLOAD_S3_BUCKET', '')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('EXTRACTION_CACHE_DIR', os.path.join(_data_dir, 'extraction-cache'))
+os.environ.setdefault('EXTRACTION_CACHE_S3_BUCKET', '')
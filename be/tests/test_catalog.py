@@ -0,0 +1,55 @@
+from app.agent.agent import AgentCatalogSnapshot, AgentPO
+from app.utils.catalog import CatalogCache
+
+
+def agent(version, name):
+    return AgentPO(id='agent-1', name=name, display_name=name, description='', agent_type=1, model_provider=1,
+                   model_id='model', sys_prompt='', tools=[], version=version)
+
+
+def agent_catalog(table, name):
+    # Never checks the shared version on its own, so only bumps can make it reload
+    return CatalogCache(name, lambda: AgentCatalogSnapshot(list(table.values())), check_seconds=3600)
+
+
+def test_saves_bumped_out_of_order_keep_the_stored_agent():
+    table = {'agent-1': agent(1, 'v1')}
+    catalog = agent_catalog(table, 'test-agents-saves')
+    assert catalog.get().by_id['agent-1'].name == 'v1'
+
+    older, newer = agent(2, 'y'), agent(3, 'x')
+    table['agent-1'] = older
+    table['agent-1'] = newer
+    catalog.bump(lambda snapshot: snapshot.with_agent(newer))
+    catalog.bump(lambda snapshot: snapshot.with_agent(older))
+
+    assert catalog.get().by_id['agent-1'].name == 'x'
+
+
+def test_save_bumped_after_a_delete_does_not_bring_the_agent_back():
+    table = {'agent-1': agent(1, 'v1')}
+    catalog = agent_catalog(table, 'test-agents-delete')
+    catalog.get()
+
+    saved = agent(2, 'v2')
+    table['agent-1'] = saved
+    del table['agent-1']
+    catalog.bump(lambda snapshot: snapshot.without_agent('agent-1', 2))
+    catalog.bump(lambda snapshot: snapshot.with_agent(saved))
+
+    assert 'agent-1' not in catalog.get().by_id
+
+
+def test_saves_bumped_in_order_are_applied_without_reloading():
+    table = {'agent-1': agent(1, 'v1')}
+    loads = []
+    catalog = CatalogCache('test-agents-in-order', lambda: loads.append(1) or AgentCatalogSnapshot(list(table.values())),
+                           check_seconds=3600)
+    catalog.get()
+
+    saved = agent(2, 'v2')
+    table['agent-1'] = saved
+    catalog.bump(lambda snapshot: snapshot.with_agent(saved))
+
+    assert catalog.get().by_id['agent-1'].name == 'v2'
+    assert len(loads) == 1
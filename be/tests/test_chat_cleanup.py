@@ -0,0 +1,90 @@
+import uuid
+
+from app.agent.agent import ChatRecordService
+from app.agent import chat_cleanup
+from app.agent.chat_cleanup import ChatCleanupService, ChatDeletionJob
+from app.agent.chat_payload import PayloadStore
+
+
+def put_record(service, create_time, time_bucket=True):
+    chat_id = uuid.uuid4().hex
+    item = {'id': chat_id, 'agent_id': 'agent', 'user_message': 'hi', 'create_time': create_time}
+    if time_bucket:
+        item['time_bucket'] = create_time[:7]
+    service.dynamodb.Table(service.chat_record_table_name).put_item(Item=item)
+    return chat_id
+
+
+def test_time_range_deletion_reaches_chats_beyond_the_listing_lookback():
+    chats = ChatRecordService()
+    # Written before time_bucket existed, and older than CHAT_LIST_LOOKBACK_MONTHS
+    legacy = put_record(chats, "2001-02-03 04:05:06", time_bucket=False)
+    old = put_record(chats, "2010-06-01 00:00:00")
+    kept = put_record(chats, "2024-01-01 00:00:00")
+
+    cleanup = ChatCleanupService(chats, workers=1)
+    job = cleanup.submit(end_time="2020-01-01")
+    cleanup.executor.shutdown(wait=True)
+
+    job = cleanup.get_job(job.id)
+    assert job.status == "done"
+    assert job.deleted_chats == 2
+    assert chats.get_chat_record(legacy) is None
+    assert chats.get_chat_record(old) is None
+    assert chats.get_chat_record(kept) is not None
+
+
+def test_payload_sweep_deletes_only_unreferenced_payloads(tmp_path):
+    chats = ChatRecordService()
+    chats.payload_store = PayloadStore(local_dir=str(tmp_path), s3_bucket='')
+    referenced = chats.payload_store.put(b"a long user message")
+    orphan = chats.payload_store.put(b"the message of a deleted chat")
+    item = {'id': uuid.uuid4().hex, 'agent_id': 'agent', 'user_message': 'a long', 'create_time': "2024-01-01 00:00:00",
+            'user_message_ref': referenced}
+    chats.dynamodb.Table(chats.chat_record_table_name).put_item(Item=item)
+    cleanup = ChatCleanupService(chats, workers=1)
+
+    # Both were stored just now, the item referencing the orphan may still be on its way
+    assert cleanup.sweep_payloads() == 0
+    assert cleanup.sweep_payloads(grace_hours=0) == 1
+    assert chats.payload_store.get(referenced) == b"a long user message"
+    assert chats.payload_store.get(orphan) is None
+
+
+def test_interrupted_deletion_job_resumes_from_its_cursor():
+    chats = ChatRecordService()
+    chat_ids = [put_record(chats, "2024-02-01 00:00:00") for _ in range(3)]
+    cleanup = ChatCleanupService(chats, workers=1)
+    # Left running with the first chat deleted by a task that was then stopped
+    chats.del_chat(chat_ids[0])
+    job = ChatDeletionJob(id=uuid.uuid4().hex, status="running", chat_ids=chat_ids, cursor="1", deleted_chats=1,
+                          create_time="2024-02-01 00:00:00", update_time="2024-02-01 00:00:00")
+    cleanup._save(job)
+
+    assert cleanup.resume_interrupted_jobs() == 1
+    # Another task starting at the same time does not run it again
+    assert ChatCleanupService(chats, workers=1).resume_interrupted_jobs() == 0
+    cleanup.executor.shutdown(wait=True)
+
+    job = cleanup.get_job(job.id)
+    assert job.status == "done"
+    assert job.deleted_chats == 3
+    assert all(chats.get_chat_record(chat_id) is None for chat_id in chat_ids)
+
+
+def test_time_range_deletion_job_records_its_scan_cursor(monkeypatch):
+    monkeypatch.setattr(chat_cleanup, 'CHAT_DELETE_BATCH_SIZE', 1)
+    chats = ChatRecordService()
+    start = "1999-03-01 00:00:00"
+    for _ in range(2):
+        put_record(chats, start, time_bucket=False)
+    cleanup = ChatCleanupService(chats, workers=1)
+    cursors = []
+    save = cleanup._save
+    monkeypatch.setattr(cleanup, '_save', lambda job: (cursors.append(job.cursor), save(job)))
+
+    job = cleanup.submit(start_time=start, end_time=start)
+    cleanup.executor.shutdown(wait=True)
+
+    assert cleanup.get_job(job.id).deleted_chats == 2
+    assert any(cursors[:-1]) and cursors[-1] is None
@@ -0,0 +1,25 @@
+import os
+from datetime import datetime
+
+import pyarrow.dataset as ds
+
+from app.agent.agent import ChatRecord, ChatRecordService
+from app.agent.chat_export import ChatExportService
+
+
+def test_partitioned_export_keeps_the_agent_id_column(tmp_path):
+    chats = ChatRecordService()
+    create_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    chats.add_chat_record(ChatRecord(id='export-chat', agent_id='team/agent 1', user_message='hello',
+                                     create_time=create_time))
+
+    exports = ChatExportService(chats, export_dir=str(tmp_path), workers=1)
+    job = exports.submit(format="parquet", agent_id='team/agent 1')
+    exports.executor.shutdown(wait=True)
+    job = exports.get_job(job.id)
+    assert job.status == "done"
+
+    dataset = ds.dataset(os.path.join(tmp_path, job.id, 'chat_records'), format='parquet', partitioning='hive')
+    table = dataset.to_table()
+    assert table.column('agent_id').to_pylist() == ['team/agent 1']
+    assert table.column('agent').to_pylist() == ['team_agent_1']
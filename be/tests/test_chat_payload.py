@@ -0,0 +1,52 @@
+import os
+
+from botocore.exceptions import ClientError
+
+from app.agent.chat_payload import PayloadStore
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body = self.objects[Key]
+        return {'Body': type('Body', (), {'read': lambda self: body})()}
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective):
+        if CopySource['Key'] not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'CopyObject')
+
+
+def s3_store(tmp_path, cache_max_bytes):
+    store = PayloadStore(local_dir=str(tmp_path), s3_bucket='', cache_max_bytes=cache_max_bytes)
+    store.s3 = FakeS3()
+    return store
+
+
+def test_local_cache_of_s3_payloads_is_bounded(tmp_path):
+    payloads = [os.urandom(1000) for _ in range(3)]
+    store = s3_store(tmp_path, cache_max_bytes=2500)
+
+    digests = [store.put(data) for data in payloads]
+
+    assert store.total_bytes <= 2500
+    assert not os.path.exists(store._path(digests[0]))
+    # Evicted payloads are read back from S3
+    assert store.get(digests[0]) == payloads[0]
+    assert store.total_bytes <= 2500
+    assert not os.path.exists(store._path(digests[1]))
+
+
+def test_storing_a_payload_again_after_it_was_swept_restores_it(tmp_path):
+    store = s3_store(tmp_path, cache_max_bytes=10000)
+    digest = store.put(b"a reused payload")
+    store.s3.objects.clear()
+
+    assert store.put(b"a reused payload") == digest
+    assert store._s3_key(digest) in store.s3.objects
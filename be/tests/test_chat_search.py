@@ -0,0 +1,46 @@
+import json
+import uuid
+from datetime import datetime
+
+from app.agent.agent import ChatRecordService, ChatResponse
+
+
+def write_chat_elsewhere(service, user_message, reply, finished=True):
+    """Write a chat straight to the tables, as another task does, bypassing this task's search index."""
+    chat_id = uuid.uuid4().hex
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    item = {'id': chat_id, 'agent_id': 'agent', 'user_message': user_message, 'create_time': now,
+            'time_bucket': now[:7]}
+    if finished:
+        item['usage'] = {'input_tokens': 1, 'output_tokens': 1}
+    service.dynamodb.Table(service.chat_record_table_name).put_item(Item=item)
+    content = json.dumps({'message': {'role': 'assistant', 'content': [{'text': reply}]}})
+    service.dynamodb.Table(service.chat_response_table_name).put_item(
+        Item=service._chat_response_item(ChatResponse(chat_id=chat_id, resp_no=0, content=content, create_time=now)))
+    return chat_id
+
+
+def test_sync_indexes_chats_written_by_other_tasks():
+    service = ChatRecordService()
+    running = write_chat_elsewhere(service, "how do I rotate zephyrine keys", "zephyrine keys rotate monthly",
+                                   finished=False)
+    finished = write_chat_elsewhere(service, "what is a zephyrine quota", "the zephyrine quota is ten")
+
+    assert service.search_chats("zephyrine")[0] == []
+    assert service.sync_search_index() >= 2
+
+    hits, _ = service.search_chats("zephyrine")
+    assert {hit.chat_id for hit in hits} == {running, finished}
+    assert [hit.chat_id for hit in service.search_chats("quota ten")[0]] == [finished]
+    # Finished chats are not synced again, running ones are until their metrics are stored
+    assert service.search_index.finished_chats([running, finished]) == {finished}
+
+
+def test_search_leaves_out_chats_deleted_by_other_tasks():
+    service = ChatRecordService()
+    chat_id = write_chat_elsewhere(service, "archive the quillwort report", "archived")
+    service.sync_search_index()
+    service.dynamodb.Table(service.chat_record_table_name).delete_item(Key={'id': chat_id})
+
+    assert service.search_chats("quillwort")[0] == []
+    assert service.search_index.search("quillwort")[0] == []
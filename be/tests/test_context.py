@@ -0,0 +1,60 @@
+from app.agent.context import ContextConfig, ContextWindowManager
+
+
+class FakeAgent:
+    def __init__(self, messages):
+        self.messages = messages
+
+
+def tool_loop(pairs):
+    messages = [{'role': 'user', 'content': [{'text': 'Analyze the sales data'}]}]
+    for i in range(pairs):
+        messages.append({'role': 'assistant', 'content': [
+            {'toolUse': {'toolUseId': f't{i}', 'name': 'query', 'input': {'step': i}}}]})
+        messages.append({'role': 'user', 'content': [
+            {'toolResult': {'toolUseId': f't{i}', 'status': 'success', 'content': [{'text': f'result {i}'}]}}]})
+    return messages
+
+
+def assert_valid(messages):
+    assert messages[0]['role'] == 'user'
+    assert not any('toolResult' in block for block in messages[0]['content'])
+    for previous, message in zip(messages, messages[1:]):
+        assert previous['role'] != message['role']
+        if any('toolResult' in block for block in message['content']):
+            assert any('toolUse' in block for block in previous['content'])
+
+
+def test_trimming_in_the_middle_of_a_tool_loop_keeps_the_prompt():
+    agent = FakeAgent(tool_loop(25))
+    ContextWindowManager(ContextConfig(window_size=40)).apply_management(agent)
+
+    assert len(agent.messages) <= 40
+    assert_valid(agent.messages)
+    assert agent.messages[0]['content'][0]['text'] == 'Analyze the sales data'
+    # The most recent tool call and its result are kept
+    assert agent.messages[-1]['content'][0]['toolResult']['toolUseId'] == 't24'
+
+
+def test_trimming_keeps_the_latest_prompt_of_a_multi_turn_conversation():
+    messages = tool_loop(3)
+    messages.append({'role': 'assistant', 'content': [{'text': 'Done'}]})
+    follow_up = tool_loop(10)
+    follow_up[0] = {'role': 'user', 'content': [{'text': 'Now by region'}]}
+    agent = FakeAgent(messages + follow_up)
+    manager = ContextWindowManager(ContextConfig(window_size=12))
+    manager.apply_management(agent)
+
+    assert len(agent.messages) <= 12
+    assert_valid(agent.messages)
+    assert agent.messages[0]['content'][0]['text'] == 'Now by region'
+    assert manager.removed_message_count == len(messages) + len(follow_up) - len(agent.messages)
+
+
+def test_trimming_stands_in_for_a_prompt_no_longer_in_the_conversation():
+    agent = FakeAgent(tool_loop(10)[1:])
+    ContextWindowManager(ContextConfig(window_size=6)).apply_management(agent)
+
+    assert len(agent.messages) <= 6
+    assert_valid(agent.messages)
+    assert agent.messages[0]['content'][0]['text'].startswith('[Earlier messages were removed')
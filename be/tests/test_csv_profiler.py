@@ -0,0 +1,32 @@
+from app.utils.csv_profiler import CsvProfiler
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / "data.csv"
+    path.write_text("id,value\n" + "".join(f"{i},{value}\n" for i, value in enumerate(rows)), encoding="utf-8")
+    return str(path)
+
+
+def column(profile, name):
+    return next(c for c in profile['columns'] if c['name'] == name)
+
+
+def test_numeric_column_widened_to_string_in_a_later_batch(tmp_path):
+    rows = [str(n) for n in range(25)] + ["abc"]
+    profile = CsvProfiler(write_csv(tmp_path, rows), batch_rows=10).profile()
+
+    value = column(profile, 'value')
+    assert profile['rows'] == 26
+    assert value['type'] == 'string'
+    assert (value['min'], value['max']) == ("0", "abc")
+    assert 'mean' not in value
+
+
+def test_int_column_widened_to_float_across_batches(tmp_path):
+    rows = [str(n) for n in range(10)] + ["-2.5", "11"]
+    profile = CsvProfiler(write_csv(tmp_path, rows), batch_rows=10).profile()
+
+    value = column(profile, 'value')
+    assert value['type'] == 'float'
+    assert (value['min'], value['max']) == (-2.5, 11.0)
+    assert value['mean'] == round((sum(range(10)) - 2.5 + 11) / 12, 6)
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Executor, Future
+
+from app.upload.extraction import ExtractionPipeline
+from app.upload.models import UploadedFile
+from app.upload.service import UploadService
+
+
+class ImmediateExecutor(Executor):
+    """Runs jobs on the submitting thread, so they are done before submit returns."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class FakeUploadService:
+    def __init__(self):
+        self.extractions = []
+
+    def set_extraction(self, sha256, status, *args):
+        self.extractions.append((sha256, status))
+        return True
+
+
+def uploaded_file(tmp_path, sha256="a" * 64):
+    path = tmp_path / f"{sha256}.bin"
+    path.write_bytes(b"\x00\x01")
+    return UploadedFile(sha256=sha256, size=2, filename="file.bin", s3_path=f"s3://bucket/{sha256}.bin",
+                        file_path=str(path), chat_id="chat", create_time="2026-01-01 00:00:00")
+
+
+def test_submit_does_not_deadlock_when_the_job_finishes_immediately(tmp_path):
+    pipeline = ExtractionPipeline(FakeUploadService(), max_pending=1)
+    pipeline.thread_pool = ImmediateExecutor()
+    uploaded = uploaded_file(tmp_path)
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('job', pipeline.submit(uploaded)), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive(), "submit deadlocked"
+    assert result['job'].done()
+    assert pipeline.jobs == {}
+    # The slot was released, so another file can be queued
+    assert pipeline.submit(uploaded_file(tmp_path, "b" * 64)) is not None
+    assert pipeline.upload_service.extractions == [("a" * 64, "unsupported"), ("b" * 64, "unsupported")]
+
+
+def test_extraction_of_a_released_file_does_not_recreate_its_item(tmp_path):
+    service = UploadService()
+    pipeline = ExtractionPipeline(service)
+    uploaded = uploaded_file(tmp_path, "c" * 64).model_copy(update={'file_path': str(tmp_path / ("c" * 64 + ".txt"))})
+    (tmp_path / ("c" * 64 + ".txt")).write_text("released while it was being extracted", encoding="utf-8")
+
+    # The file has no item, as after a release that raced with the job
+    assert pipeline._run(uploaded) is None
+
+    assert service.get_upload(uploaded.sha256) is None
+    assert not (tmp_path / ("c" * 64 + ".extracted.txt")).exists()
+    assert not (tmp_path / ("c" * 64 + ".index.json")).exists()
@@ -0,0 +1,30 @@
+from app.utils import file_processor
+from app.utils.file_processor import FileProcessor
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_same_content_cached_per_extension(tmp_path):
+    text = "id,value\n1,a\n2,b\n"
+    sha256 = "ab" * 32
+
+    as_csv = FileProcessor.process_file(write(tmp_path, "data.csv", text), sha256=sha256)
+    as_txt = FileProcessor.process_file(write(tmp_path, "data.txt", text), sha256=sha256)
+
+    assert as_csv['type'] == 'csv'
+    assert as_txt['type'] == 'txt'
+
+
+def test_changed_limits_miss_the_cache(tmp_path, monkeypatch):
+    path = write(tmp_path, "notes.txt", "x" * 100)
+    sha256 = "cd" * 32
+
+    assert FileProcessor.process_file(path, sha256=sha256)['content'] == "x" * 100
+    monkeypatch.setattr(file_processor, 'MAX_BYTES', 10)
+    monkeypatch.setattr(file_processor.ChunkReader.__init__, '__defaults__', (file_processor.CHUNK_CHARS, 10, file_processor.MAX_TOKENS))
+
+    assert len(FileProcessor.process_file(path, sha256=sha256)['content']) < 100
@@ -0,0 +1,34 @@
+from app.utils import lru_cache
+from app.utils.lru_cache import LRUCache
+
+
+def test_invalidating_one_tag_does_not_reject_concurrent_reads_of_another():
+    cache = LRUCache(max_bytes=100)
+    version = cache.version('chat-a')
+    # A response is added to another chat while chat-a is being read
+    cache.invalidate('chat-b')
+    cache.put('a', 'record a', tag='chat-a', if_version=version)
+    assert cache.get('a') == 'record a'
+
+
+def test_invalidating_the_tag_rejects_a_read_that_raced_with_the_write():
+    cache = LRUCache(max_bytes=100)
+    version = cache.version('chat-a')
+    cache.invalidate('chat-a')
+    cache.put('a', 'stale record', tag='chat-a', if_version=version)
+    assert cache.get('a') is None
+    cache.put('a', 'fresh record', tag='chat-a', if_version=cache.version('chat-a'))
+    assert cache.get('a') == 'fresh record'
+
+
+def test_resetting_tag_counters_rejects_reads_started_before(monkeypatch):
+    monkeypatch.setattr(lru_cache, 'MAX_TRACKED_TAG_VERSIONS', 2)
+    cache = LRUCache(max_bytes=100)
+    cache.invalidate('chat-a')
+    version = cache.version('chat-a')
+    cache.invalidate('chat-b')
+    # A third tag resets the counters, chat-a's count would otherwise start over at 0
+    cache.invalidate('chat-c')
+    cache.invalidate('chat-a')
+    cache.put('a', 'stale record', tag='chat-a', if_version=version)
+    assert cache.get('a') is None
@@ -0,0 +1,70 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+from app.agent.session import ChatSessionManager, ChatSessionService
+
+
+class FakeAgent:
+    def __init__(self):
+        self.messages = []
+
+    async def stream_async(self, user_message):
+        self.messages.append({'role': 'user', 'content': [{'text': user_message}]})
+        reply = f"seen {len(self.messages)}"
+        self.messages.append({'role': 'assistant', 'content': [{'text': reply}]})
+        yield {'data': reply}
+
+
+class FakeAgentService:
+    def get_agent(self, agent_id):
+        return SimpleNamespace(id=agent_id, version=1, manifest_hash=None)
+
+    def build_strands_agent(self, agent, extra_tools=None):
+        return FakeAgent()
+
+
+def take_turn(manager, session_id, message):
+    async def run():
+        return [event async for event in manager.stream_chat(session_id, 'agent', message)]
+    return asyncio.run(run())[-1]['data']
+
+
+def task():
+    return ChatSessionManager(FakeAgentService(), upload_service=None, store=ChatSessionService())
+
+
+def test_session_moves_between_tasks():
+    session_id = uuid.uuid4().hex
+    first, second = task(), task()
+
+    assert take_turn(first, session_id, 'one') == 'seen 1'
+    # Each turn is saved when it finishes, so another task continues the conversation
+    assert take_turn(second, session_id, 'two') == 'seen 3'
+    # The first task's copy is stale and reloaded before its next turn
+    assert take_turn(first, session_id, 'three') == 'seen 5'
+    assert ChatSessionService().get_turns(session_id) == 3
+
+
+def test_stale_save_keeps_the_stored_turns():
+    session_id = uuid.uuid4().hex
+    first, second = task(), task()
+    take_turn(first, session_id, 'one')
+    take_turn(second, session_id, 'two')
+
+    stale = first.sessions[session_id].to_stored()
+
+    assert not ChatSessionService().save_session(stale)
+    assert ChatSessionService().get_turns(session_id) == 2
+
+
+def test_ended_session_is_gone_on_every_task():
+    session_id = uuid.uuid4().hex
+    first, second = task(), task()
+    take_turn(first, session_id, 'one')
+
+    assert asyncio.run(second.end_session(session_id))
+
+    assert ChatSessionService().get_turns(session_id) is None
+    # The first task finds the session ended and starts a new conversation
+    assert take_turn(first, session_id, 'again') == 'seen 1'
@@ -0,0 +1,87 @@
+import io
+import os
+
+from app.upload.service import UploadService
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class FakeUploader:
+    """Stores uploads in memory instead of S3 and writes the local copy like StreamingUploader."""
+
+    def __init__(self):
+        self.s3 = FakeS3()
+
+    def upload(self, fileobj, s3_key, local_path=None, content_type=None):
+        data = fileobj.read()
+        self.s3.objects[s3_key] = data
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+def upload_service():
+    service = UploadService()
+    service.uploader = FakeUploader()
+    return service
+
+
+def test_release_does_not_delete_the_copy_of_a_concurrent_upload():
+    first, second = upload_service(), upload_service()
+    second.uploader = first.uploader
+    content = b"stored, released and stored again"
+
+    released, _ = first.save_upload(io.BytesIO(content), "notes.txt", "chat-1")
+    # A concurrent upload stored its copy after the last reference was released, before the row was deleted
+    s3_key, local_path = second.content_location(released.sha256, "notes.txt", second.new_generation())
+    second.uploader.upload(io.BytesIO(content), s3_key, local_path)
+    assert first.release_upload(released.sha256)
+
+    stored, created = second.register_upload(released.model_copy(update={
+        's3_path': f"s3://{second.bucket}/{s3_key}", 'file_path': local_path, 'ref_count': 1}))
+
+    assert created
+    assert stored.s3_path != released.s3_path
+    assert first.uploader.s3.objects[s3_key] == content
+    assert os.path.exists(local_path)
+    assert first.find_upload_by_path(local_path) == stored
+    first.release_upload(stored.sha256)
+
+
+def test_losing_the_register_race_deletes_the_redundant_copy():
+    service = upload_service()
+    content = b"uploaded twice at once"
+
+    winner, _ = service.save_upload(io.BytesIO(content), "a.txt", "chat-1")
+    s3_key, local_path = service.content_location(winner.sha256, "a.txt", service.new_generation())
+    service.uploader.upload(io.BytesIO(content), s3_key, local_path)
+    existing, created = service.register_upload(winner.model_copy(update={
+        's3_path': f"s3://{service.bucket}/{s3_key}", 'file_path': local_path}))
+
+    assert not created
+    assert existing.file_path == winner.file_path
+    assert existing.ref_count == 2
+    assert s3_key not in service.uploader.s3.objects
+    assert not os.path.exists(local_path)
+    service.release_upload(winner.sha256)
+    assert service.release_upload(winner.sha256)
+    assert service.uploader.s3.objects == {}
+
+
+def test_complete_rejects_a_malformed_digest():
+    service = upload_service()
+
+    for sha256 in ("../" + "a" * 61, "A" * 64, "a" * 63):
+        try:
+            service.complete_presigned_upload(sha256, "a.txt", service.new_generation(), "chat-1")
+        except ValueError as e:
+            assert "sha256" in str(e)
+        else:
+            raise AssertionError(f"{sha256} was accepted")
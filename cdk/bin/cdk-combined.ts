@@ -15,6 +15,7 @@ const deployRedshiftMcpServer = app.node.tryGetContext('deployRedshiftMcpServer'
 const deployDuckDbMcpServer = app.node.tryGetContext('deployDuckDbMcpServer') !== 'false' && process.env.DEPLOY_DUCKDB_MCP !== 'false';
 const deployOpenSearchMcpServer = app.node.tryGetContext('deployOpenSearchMcpServer') !== 'false' && process.env.DEPLOY_OPENSEARCH_MCP !== 'false';
 const createDynamoDBTables = app.node.tryGetContext('createDynamoDBTables') !== 'false' && process.env.CREATE_DYNAMODB_TABLES !== 'false';
+const chatRecordTimeIndex = app.node.tryGetContext('chatRecordTimeIndex') !== 'false' && process.env.CHAT_RECORD_TIME_INDEX !== 'false';
 
 // Create the combined AgentX stack
 new AgentXStack(app, 'AgentXStack', {
@@ -30,6 +31,7 @@ new AgentXStack(app, 'AgentXStack', {
   deployDuckDbMcpServer: deployDuckDbMcpServer,
   deployOpenSearchMcpServer: deployOpenSearchMcpServer,
   createDynamoDBTables: createDynamoDBTables,
+  chatRecordTimeIndex: chatRecordTimeIndex,
 });
 
 // Log configuration
@@ -41,3 +43,4 @@ console.log(`Redshift MCP server deployment: ${deployRedshiftMcpServer ? 'Enable
 console.log(`DuckDB MCP server deployment: ${deployDuckDbMcpServer ? 'Enabled' : 'Disabled'}`);
 console.log(`OpenSearch MCP server deployment: ${deployOpenSearchMcpServer ? 'Enabled' : 'Disabled'}`);
 console.log(`DynamoDB tables creation: ${createDynamoDBTables ? 'Enabled' : 'Disabled'}`);
+console.log(`ChatRecordTable time index: ${chatRecordTimeIndex ? 'Enabled' : 'Disabled'}`);
@@ -14,6 +14,7 @@ const vpcId = app.node.tryGetContext('vpcId') || process.env.VPC_ID;
 const deployMysqlMcpServer = app.node.tryGetContext('deployMysqlMcpServer') !== 'false' && process.env.DEPLOY_MYSQL_MCP !== 'false';
 const deployRedshiftMcpServer = app.node.tryGetContext('deployRedshiftMcpServer') !== 'false' && process.env.DEPLOY_REDSHIFT_MCP !== 'false';
 const createDynamoDBTables = app.node.tryGetContext('createDynamoDBTables') !== 'false' && process.env.CREATE_DYNAMODB_TABLES !== 'false';
+const chatRecordTimeIndex = app.node.tryGetContext('chatRecordTimeIndex') !== 'false' && process.env.CHAT_RECORD_TIME_INDEX !== 'false';
 const deployAgentXStack = app.node.tryGetContext('deployAgentXStack') !== 'false' && process.env.DEPLOY_AGENTX_STACK !== 'false';
 const deployScheduleStack = app.node.tryGetContext('deployScheduleStack') !== 'false' && process.env.DEPLOY_SCHEDULE_STACK !== 'false';
 
@@ -31,6 +32,7 @@ if (deployAgentXStack) {
     deployMysqlMcpServer: deployMysqlMcpServer,
     deployRedshiftMcpServer: deployRedshiftMcpServer,
     createDynamoDBTables: createDynamoDBTables,
+    chatRecordTimeIndex: chatRecordTimeIndex,
   });
 }
 
@@ -41,6 +43,7 @@ console.log(vpcId
 console.log(`MySQL MCP server deployment: ${deployMysqlMcpServer ? 'Enabled' : 'Disabled'}`);
 console.log(`Redshift MCP server deployment: ${deployRedshiftMcpServer ? 'Enabled' : 'Disabled'}`);
 console.log(`DynamoDB tables creation: ${createDynamoDBTables ? 'Enabled' : 'Disabled'}`);
+console.log(`ChatRecordTable time index: ${chatRecordTimeIndex ? 'Enabled' : 'Disabled'}`);
 console.log(`AgentX stack deployment: ${deployAgentXStack ? 'Enabled' : 'Disabled'}`);
 console.log(`Agent Schedule stack deployment: ${deployScheduleStack ? 'Enabled' : 'Disabled'}`);
 
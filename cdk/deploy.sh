@@ -15,6 +15,7 @@ usage() {
   echo "  --no-opensearch-mcp         Disable OpenSearch MCP server deployment"
   echo "  --no-aws-db-mcp             Disable AWS DB MCP server deployment"
   echo "  --no-dynamodb-tables        Disable creation of DynamoDB tables for agent and MCP services"
+  echo "  --no-chat-record-time-index Leave out the ChatRecordTable time index, for the first step of a two-step upgrade"
   echo "  --help                      Display this help message"
   exit 1
 }
@@ -28,6 +29,7 @@ DEPLOY_DUCKDB_MCP=true
 DEPLOY_OPENSEARCH_MCP=true
 DEPLOY_AWS_DB_MCP=true
 CREATE_DYNAMODB_TABLES=true
+CHAT_RECORD_TIME_INDEX=true
 
 # Parse arguments
 while [[ $# -gt 0 ]]; do
@@ -64,6 +66,10 @@ while [[ $# -gt 0 ]]; do
       CREATE_DYNAMODB_TABLES=false
       shift
       ;;
+    --no-chat-record-time-index)
+      CHAT_RECORD_TIME_INDEX=false
+      shift
+      ;;
     --help)
       usage
       ;;
@@ -90,6 +96,7 @@ echo "DuckDB MCP server deployment: $([ "$DEPLOY_DUCKDB_MCP" = true ] && echo "E
 echo "OpenSearch MCP server deployment: $([ "$DEPLOY_OPENSEARCH_MCP" = true ] && echo "Enabled" || echo "Disabled")"
 echo "AWS DB MCP server deployment: $([ "$DEPLOY_AWS_DB_MCP" = true ] && echo "Enabled" || echo "Disabled")"
 echo "DynamoDB tables creation: $([ "$CREATE_DYNAMODB_TABLES" = true ] && echo "Enabled" || echo "Disabled")"
+echo "ChatRecordTable time index: $([ "$CHAT_RECORD_TIME_INDEX" = true ] && echo "Enabled" || echo "Disabled")"
 echo "Agent Schedule functionality: Enabled"
 
 # Bootstrap CDK if not already done
@@ -148,6 +155,11 @@ if [ "$CREATE_DYNAMODB_TABLES" = false ]; then
   export CREATE_DYNAMODB_TABLES=false
 fi
 
+if [ "$CHAT_RECORD_TIME_INDEX" = false ]; then
+  CDK_PARAMS="$CDK_PARAMS -c chatRecordTimeIndex=false"
+  export CHAT_RECORD_TIME_INDEX=false
+fi
+
 
 # Set AWS region
 export AWS_DEFAULT_REGION=$AWS_REGION
@@ -52,6 +52,14 @@ export interface AgentXStackProps extends cdk.StackProps {
    * If not provided, defaults to true.
    */
   createDynamoDBTables?: boolean;
+
+  /**
+   * Whether to add the time_bucket-create_time-index GSI to ChatRecordTable.
+   * CloudFormation creates at most one GSI per table update, so existing deployments first deploy with this
+   * set to false to add agent_id-create_time-index, then deploy again to add this one.
+   * If not provided, defaults to true.
+   */
+  chatRecordTimeIndex?: boolean;
 }
 
 export class AgentXStack extends cdk.Stack {
@@ -419,6 +427,7 @@ export class AgentXStack extends cdk.Stack {
     const deployOpenSearchMcpServer = props?.deployOpenSearchMcpServer !== false; // Default to true if not specified
     const deployAwsDbMcpServer = props?.deployAwsDbMcpServer !== false; // Default to true if not specified
     const createDynamoDBTables = props?.createDynamoDBTables !== false; // Default to true if not specified
+    const chatRecordTimeIndex = props?.chatRecordTimeIndex !== false; // Default to true if not specified
     
     // Conditionally create DynamoDB tables for agent and MCP services
     if (createDynamoDBTables) {
@@ -435,7 +444,24 @@ export class AgentXStack extends cdk.Stack {
         partitionKey: { name: 'id', type: cdk.aws_dynamodb.AttributeType.STRING },
         billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
         removalPolicy: cdk.RemovalPolicy.RETAIN,
+        // Chats of agents with a retention period expire through TTL
+        timeToLiveAttribute: 'expire_at',
       });
+
+      // Time-ordered chat history listing, per agent and across all agents by month
+      chatRecordTable.addGlobalSecondaryIndex({
+        indexName: 'agent_id-create_time-index',
+        partitionKey: { name: 'agent_id', type: cdk.aws_dynamodb.AttributeType.STRING },
+        sortKey: { name: 'create_time', type: cdk.aws_dynamodb.AttributeType.STRING },
+      });
+      // Added in a second deployment on existing tables, CloudFormation creates one GSI per table update
+      if (chatRecordTimeIndex) {
+        chatRecordTable.addGlobalSecondaryIndex({
+          indexName: 'time_bucket-create_time-index',
+          partitionKey: { name: 'time_bucket', type: cdk.aws_dynamodb.AttributeType.STRING },
+          sortKey: { name: 'create_time', type: cdk.aws_dynamodb.AttributeType.STRING },
+        });
+      }
       
       const chatResponseTable = new cdk.aws_dynamodb.Table(this, 'ChatResponseTable', {
         tableName: 'ChatResponseTable',
@@ -443,6 +469,8 @@ export class AgentXStack extends cdk.Stack {
         sortKey: { name: 'resp_no', type: cdk.aws_dynamodb.AttributeType.NUMBER },
         billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
         removalPolicy: cdk.RemovalPolicy.RETAIN,
+        // Chats of agents with a retention period expire through TTL
+        timeToLiveAttribute: 'expire_at',
       });
       
       // Create DynamoDB table used by mcp.py
@@ -461,6 +489,39 @@ export class AgentXStack extends cdk.Stack {
         removalPolicy: cdk.RemovalPolicy.RETAIN,
       });
       
+      // Create DynamoDB table for content-addressed uploaded files
+      const uploadedFileTable = new cdk.aws_dynamodb.Table(this, 'UploadedFileTable', {
+        tableName: 'UploadedFileTable',
+        partitionKey: { name: 'sha256', type: cdk.aws_dynamodb.AttributeType.STRING },
+        billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.RETAIN,
+      });
+      
+      const chatDeletionJobTable = new cdk.aws_dynamodb.Table(this, 'ChatDeletionJobTable', {
+        tableName: 'ChatDeletionJobTable',
+        partitionKey: { name: 'id', type: cdk.aws_dynamodb.AttributeType.STRING },
+        billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.RETAIN,
+        timeToLiveAttribute: 'expire_at',
+      });
+      
+      // Create DynamoDB table for catalog versions, one counter per catalog (agents, MCP servers, schedules)
+      const catalogVersionTable = new cdk.aws_dynamodb.Table(this, 'CatalogVersionTable', {
+        tableName: 'CatalogVersionTable',
+        partitionKey: { name: 'id', type: cdk.aws_dynamodb.AttributeType.STRING },
+        billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.RETAIN,
+      });
+      
+      // Create DynamoDB table for the conversations of idle multi-turn chat sessions
+      const chatSessionTable = new cdk.aws_dynamodb.Table(this, 'ChatSessionTable', {
+        tableName: 'ChatSessionTable',
+        partitionKey: { name: 'id', type: cdk.aws_dynamodb.AttributeType.STRING },
+        billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.RETAIN,
+        timeToLiveAttribute: 'expire_at',
+      });
+      
       console.log('DynamoDB tables for agent and MCP services will be created');
     } else {
       console.log('DynamoDB tables creation is disabled');
@@ -478,6 +539,8 @@ export class AgentXStack extends cdk.Stack {
         timeout: cdk.Duration.seconds(5),
         healthyHttpCodes: '200',
       },
+      // Keep a client on one task, where its chat sessions are warm; any task can still resume them
+      stickinessCookieDuration: cdk.Duration.hours(1),
     });
 
     const feTargetGroup = new elbv2.ApplicationTargetGroup(this, 'FeTargetGroup', {
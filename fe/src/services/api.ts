@@ -403,8 +403,15 @@ export const chatAPI = {
   // Get chat responses for a specific chat
   getChatResponses: async (chatId: string): Promise<ChatResponse[]> => {
     try {
-      const response = await axios.get(CHAT_API.listResponses(chatId));
-      return response.data;
+      // The backend streams one JSON object per line (NDJSON)
+      const response = await axios.get(CHAT_API.listResponses(chatId), {
+        responseType: 'text',
+        transformResponse: [(data) => data],
+      });
+      return (response.data as string)
+        .split('\n')
+        .filter((line) => line.trim())
+        .map((line) => JSON.parse(line) as ChatResponse);
     } catch (error) {
       console.error(`Error fetching chat responses for chat ID ${chatId}:`, error);
       return [];